@@ -0,0 +1,103 @@
+import json
+from typing import Dict, Any, Optional, Iterator
+
+from bson.errors import InvalidId
+from flask import Blueprint, jsonify, Response, stream_with_context
+from flask_restful import Resource, Api
+
+from app.models.capsule import CapsuleModel
+from app.services.capsule_service import CapsuleService
+from app.services.capsule_summary_service import CapsuleSummaryService
+from app.services.email_pipeline import EmailPipeline
+
+# Create a blueprint for capsule-related routes
+capsule_bp = Blueprint('capsule', __name__, url_prefix='/api/capsules')
+api = Api(capsule_bp)
+
+def format_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """
+    Format one server-sent event
+    
+    Args:
+        data: JSON payload of the event
+        event: Event name (default: an unnamed "message" event)
+    
+    Returns:
+        The event, terminated by a blank line
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+def summary_events(capsule_id: str, capsule: CapsuleModel, summary_service: CapsuleSummaryService,
+                   capsule_service: CapsuleService) -> Iterator[str]:
+    """
+    Stream the regenerated summary of a capsule as server-sent events
+    
+    Each piece of text is sent as a message event with a "delta". Once the
+    completion is finished, the full summary is saved on the capsule and sent
+    in a "done" event. If generation fails, an "error" event is sent and the
+    stored summary is left unchanged.
+    
+    Args:
+        capsule_id: ID of the capsule
+        capsule: The capsule
+        summary_service: Service generating the summary
+        capsule_service: Service storing the capsule
+    
+    Yields:
+        Formatted server-sent events
+    """
+    pieces = []
+    try:
+        for piece in summary_service.stream_summary(capsule):
+            pieces.append(piece)
+            yield format_event({"delta": piece})
+    except Exception as e:
+        print(f"Error streaming summary of capsule {capsule_id}: {e}")
+        yield format_event({"error": str(e)}, event="error")
+        return
+    
+    summary = "".join(pieces).strip()
+    capsule_service.update_capsule(capsule_id, {"summary": summary})
+    yield format_event({"summary": summary}, event="done")
+
+class CapsuleSummaryStreamResource(Resource):
+    """API resource streaming a capsule's summary as it is generated"""
+    
+    def get(self, capsule_id):
+        """Regenerate the summary of a capsule and stream it as server-sent events"""
+        # Initialize the email pipeline
+        pipeline = EmailPipeline()
+        
+        try:
+            capsule = pipeline.capsule_service.get_capsule(capsule_id)
+        except InvalidId:
+            capsule = None
+        
+        if not capsule:
+            return jsonify({
+                "success": False,
+                "error": "Capsule not found",
+                "message": f"Capsule with ID {capsule_id} not found"
+            }), 404
+        
+        events = summary_events(capsule_id, capsule, pipeline.capsule_generator.summary_service,
+                                pipeline.capsule_service)
+        
+        return Response(
+            stream_with_context(events),
+            mimetype="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                # Keep reverse proxies from buffering the stream
+                "X-Accel-Buffering": "no"
+            }
+        )
+
+# Register the resources with the API
+api.add_resource(CapsuleSummaryStreamResource, '/<string:capsule_id>/summary/stream')
+
+# Function to register the blueprint with the Flask app
+def register_capsule_routes(app):
+    app.register_blueprint(capsule_bp)
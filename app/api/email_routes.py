@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, send_file
 from flask_restful import Resource, Api
 
 from app.services.email_pipeline import EmailPipeline
@@ -101,10 +101,49 @@ class ThreadEmailsResource(Resource):
             "count": len(emails)
         }), 200
 
+class EmailAttachmentResource(Resource):
+    """API resource for downloading an email attachment"""
+    
+    def get(self, email_id, part_id):
+        """Download an attachment, fetching it from Gmail on first access"""
+        # Initialize the email pipeline
+        pipeline = EmailPipeline()
+        
+        # Check if Gmail service is authenticated
+        if not pipeline.is_authenticated():
+            return jsonify({
+                "success": False,
+                "error": "Gmail service not authenticated",
+                "message": "Please authenticate with Gmail first"
+            }), 401
+        
+        # Find the attachment metadata recorded at ingest
+        email_model = pipeline.email_processor.get_email_by_id(email_id)
+        attachment = None
+        if email_model:
+            attachment = next((a for a in email_model.attachments if a.get("part_id") == part_id), None)
+        
+        if not attachment:
+            return jsonify({
+                "success": False,
+                "error": "Attachment not found",
+                "message": f"Attachment {part_id} of email {email_id} not found"
+            }), 404
+        
+        stored = pipeline.email_processor.attachment_service.download(email_id, attachment)
+        
+        return send_file(
+            stored["path"],
+            mimetype=attachment.get("mime_type") or "application/octet-stream",
+            as_attachment=True,
+            download_name=attachment.get("filename") or part_id
+        )
+
 # Register the resources with the API
 api.add_resource(ProcessEmailsResource, '/process')
 api.add_resource(EmailResource, '/<string:email_id>')
 api.add_resource(ThreadEmailsResource, '/thread/<string:thread_id>')
+api.add_resource(EmailAttachmentResource, '/<string:email_id>/attachments/<string:part_id>')
 
 # Function to register the blueprint with the Flask app
 def register_email_routes(app):
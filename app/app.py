@@ -17,6 +17,10 @@ def create_app():
     from app.api.email_routes import register_email_routes
     register_email_routes(app)
     
+    # Register capsule routes
+    from app.api.capsule_routes import register_capsule_routes
+    register_capsule_routes(app)
+    
     @app.route("/")
     def index():
         return send_from_directory('templates', 'index.html')
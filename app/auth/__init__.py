@@ -13,11 +13,14 @@ auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 credentials_path = os.path.join(os.path.dirname(__file__), '..', '..', 'client_secret.json')
 token_path = os.path.join(os.path.dirname(__file__), '..', '..', 'token.pickle')
+cache_dir = os.environ.get('GMAIL_CACHE_DIR', os.path.join(os.path.dirname(__file__), '..', '..', '.cache', 'gmail'))
 
 gmail_service = GmailService(
     credentials_path=credentials_path,
     token_path=token_path,
-    scopes=SCOPES
+    scopes=SCOPES,
+    cache_dir=cache_dir,
+    cache_max_bytes=int(os.environ.get('GMAIL_CACHE_MAX_MB', '512')) * 1024 * 1024
 )
 
 @auth_bp.route('/login')
@@ -53,24 +56,19 @@ def emails():
     # Retrieve messages
     try:
         messages = gmail_service.list_messages(max_results=10)
-        message_list = []
         
-        for msg in messages:
-            # Get message details
-            message = service.users().messages().get(userId='me', id=msg['id']).execute()
-            headers = message.get('payload', {}).get('headers', [])
-            
-            # Extract subject and sender
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No subject)')
-            sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), '(Unknown sender)')
-            
-            message_list.append({
-                'id': msg['id'],
-                'thread_id': message.get('threadId', ''),
-                'subject': subject,
-                'sender': sender,
-                'snippet': message.get('snippet', '')
-            })
+        # Fetch subject and sender for the whole page in one batched call
+        headers = gmail_service.list_message_headers([msg['id'] for msg in messages], headers=('Subject', 'From'))
+        message_list = [
+            {
+                'id': message['id'],
+                'thread_id': message['thread_id'],
+                'subject': message['subject'] or '(No subject)',
+                'sender': message['from'] or '(Unknown sender)',
+                'snippet': message['snippet']
+            }
+            for message in headers
+        ]
         
         return jsonify({
             "status": "success", 
@@ -89,20 +87,21 @@ def email_detail(email_id):
         return redirect(url_for('auth.login'))
     
     try:
-        # Get message details
-        message = service.users().messages().get(userId='me', id=email_id).execute()
-        headers = message.get('payload', {}).get('headers', [])
+        # Get message headers without downloading the body
+        messages = gmail_service.list_message_headers([email_id], headers=('Subject', 'From', 'To', 'Date'))
+        if not messages:
+            return jsonify({"status": "error", "message": f"Email {email_id} not found"})
         
-        # Extract header information
+        message = messages[0]
         email_data = {
             'id': message['id'],
-            'thread_id': message.get('threadId', ''),
-            'subject': next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No subject)'),
-            'from': next((h['value'] for h in headers if h['name'].lower() == 'from'), '(Unknown sender)'),
-            'to': next((h['value'] for h in headers if h['name'].lower() == 'to'), ''),
-            'date': next((h['value'] for h in headers if h['name'].lower() == 'date'), ''),
-            'snippet': message.get('snippet', ''),
-            'labels': message.get('labelIds', [])
+            'thread_id': message['thread_id'],
+            'subject': message['subject'] or '(No subject)',
+            'from': message['from'] or '(Unknown sender)',
+            'to': message['to'],
+            'date': message['date'],
+            'snippet': message['snippet'],
+            'labels': message['labels']
         }
         
         return jsonify({
@@ -140,38 +139,8 @@ def threads():
         return redirect(url_for('auth.login'))
     
     try:
-        # List threads
-        results = service.users().threads().list(
-            userId='me',
-            maxResults=10
-        ).execute()
-        
-        threads = results.get('threads', [])
-        thread_list = []
-        
-        for thread in threads:
-            # Get basic thread details
-            thread_data = service.users().threads().get(
-                userId='me',
-                id=thread['id']
-            ).execute()
-            
-            # Get messages in thread
-            messages = thread_data.get('messages', [])
-            
-            if messages:
-                # Get first message details for summary
-                first_message = messages[0]
-                headers = first_message.get('payload', {}).get('headers', [])
-                
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No subject)')
-                
-                thread_list.append({
-                    'id': thread['id'],
-                    'subject': subject,
-                    'message_count': len(messages),
-                    'snippet': first_message.get('snippet', '')
-                })
+        # List threads with their subjects in one batched call
+        thread_list = gmail_service.list_thread_summaries(max_results=10)
         
         return jsonify({
             "status": "success",
@@ -218,22 +187,18 @@ def search():
         # Search for messages
         messages = gmail_service.search_messages(query, max_results=10)
         
-        message_list = []
-        for msg in messages:
-            # Get message details
-            message = service.users().messages().get(userId='me', id=msg['id']).execute()
-            headers = message.get('payload', {}).get('headers', [])
-            
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No subject)')
-            sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), '(Unknown sender)')
-            
-            message_list.append({
-                'id': msg['id'],
-                'thread_id': message.get('threadId', ''),
-                'subject': subject,
-                'sender': sender,
-                'snippet': message.get('snippet', '')
-            })
+        # Fetch subject and sender for all results in one batched call
+        headers = gmail_service.list_message_headers([msg['id'] for msg in messages], headers=('Subject', 'From'))
+        message_list = [
+            {
+                'id': message['id'],
+                'thread_id': message['thread_id'],
+                'subject': message['subject'] or '(No subject)',
+                'sender': message['from'] or '(Unknown sender)',
+                'snippet': message['snippet']
+            }
+            for message in headers
+        ]
         
         return jsonify({
             "status": "success",
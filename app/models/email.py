@@ -26,7 +26,8 @@ class EmailModel:
         summary: str = "",
         category: str = "General",
         priority: int = 3,
-        category_explanation: str = ""
+        category_explanation: str = "",
+        enrichment_status: str = "complete"
     ):
         self.message_id = message_id
         self.thread_id = thread_id
@@ -46,6 +47,7 @@ class EmailModel:
         self.category = category
         self.priority = priority
         self.category_explanation = category_explanation
+        self.enrichment_status = enrichment_status
         
     def to_dict(self) -> Dict[str, Any]:
         """Convert Email to dictionary for MongoDB storage"""
@@ -67,7 +69,8 @@ class EmailModel:
             "summary": self.summary,
             "category": self.category,
             "priority": self.priority,
-            "category_explanation": self.category_explanation
+            "category_explanation": self.category_explanation,
+            "enrichment_status": self.enrichment_status
         }
         
     @classmethod
@@ -91,5 +94,6 @@ class EmailModel:
             summary=data.get("summary", ""),
             category=data.get("category", "General"),
             priority=data.get("priority", 3),
-            category_explanation=data.get("category_explanation", "")
+            category_explanation=data.get("category_explanation", ""),
+            enrichment_status=data.get("enrichment_status", "complete")
         )
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import asyncio
+import weakref
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Iterable
+
+from app.services.openai_service import OpenAIService
+
+class AsyncOpenAIService:
+    """
+    Asyncio front end for OpenAIService:
+    - Runs the blocking API calls in worker threads over the shared connection pool
+    - Bounds the number of calls in flight with a semaphore
+    - Batches many calls and returns their results in input order
+    """
+    
+    def __init__(self, openai_service: Optional[OpenAIService] = None, max_concurrency: Optional[int] = None):
+        """
+        Initialize the async service
+        
+        Args:
+            openai_service: OpenAIService whose methods are called (default: a new one)
+            max_concurrency: Maximum number of calls in flight
+                             (default: OPENAI_MAX_CONCURRENCY or the transport's pool size)
+        """
+        self.openai_service = openai_service or OpenAIService()
+        
+        if max_concurrency is None:
+            default = self.openai_service.transport.pool_size
+            max_concurrency = int(os.environ.get('OPENAI_MAX_CONCURRENCY', default))
+        self.max_concurrency = max(1, max_concurrency)
+        
+        # Own worker threads, so the default executor's size does not cap concurrency
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="openai")
+        
+        # Semaphores bind to the running event loop, so one is created per loop;
+        # each is dropped with its loop
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+    
+    async def extract_entities(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
+        """Async variant of OpenAIService.extract_entities"""
+        return await self._call(self.openai_service.extract_entities, email_text, email_subject, model)
+    
+    async def generate_email_summary(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> str:
+        """Async variant of OpenAIService.generate_email_summary"""
+        return await self._call(self.openai_service.generate_email_summary, email_text, email_subject, model)
+    
+    async def categorize_email(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
+        """Async variant of OpenAIService.categorize_email"""
+        return await self._call(self.openai_service.categorize_email, email_text, email_subject, model)
+    
+    async def enrich_email(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
+        """Async variant of OpenAIService.enrich_email"""
+        return await self._call(self.openai_service.enrich_email, email_text, email_subject, model)
+    
+    async def enrich_packed(self, pack: List[Dict[str, str]], model: str = "gpt-4o-mini") -> Dict[str, Optional[Dict[str, Any]]]:
+        """Async variant of OpenAIService.enrich_packed"""
+        return await self._call(self.openai_service.enrich_packed, pack, model)
+    
+    async def detect_follow_ups(self, email_text: str, email_subject: str = "", sender: str = "",
+                                model: str = "gpt-4o") -> List[Dict[str, str]]:
+        """Async variant of OpenAIService.detect_follow_ups"""
+        return await self._call(self.openai_service.detect_follow_ups, email_text, email_subject, sender, model)
+    
+    async def simple_completion(self, prompt: str, model: str = "gpt-4o-mini") -> str:
+        """Async variant of OpenAIService.simple_completion"""
+        return await self._call(self.openai_service.simple_completion, prompt, model)
+    
+    async def gather_batch(self, items: Iterable[Any], func: Callable[[Any], Awaitable[Any]]) -> List[Dict[str, Any]]:
+        """
+        Run an async call for every item, at most max_concurrency at a time
+        
+        A failing item does not cancel the others.
+        
+        Args:
+            items: Inputs of the calls
+            func: Coroutine function called with each item, e.g. a lambda
+                  around one of this service's methods
+        
+        Returns:
+            One dict per item, in input order, with "result" on success or
+            "error" (the exception) on failure
+        """
+        results = await asyncio.gather(*(func(item) for item in items), return_exceptions=True)
+        
+        return [
+            {"error": result} if isinstance(result, BaseException) else {"result": result}
+            for result in results
+        ]
+    
+    def run_batch(self, items: Iterable[Any], func: Callable[[Any], Awaitable[Any]]) -> List[Dict[str, Any]]:
+        """
+        Blocking wrapper around gather_batch for synchronous callers
+        
+        Args:
+            items: Inputs of the calls
+            func: Coroutine function called with each item
+        
+        Returns:
+            Same as gather_batch
+        
+        Raises:
+            RuntimeError: If called from a running event loop, which it would
+                          block; coroutines should await gather_batch instead
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.gather_batch(items, func))
+        raise RuntimeError("run_batch cannot be called from a running event loop, await gather_batch instead")
+    
+    async def _call(self, method: Callable, *args) -> Any:
+        """Run a blocking OpenAIService method in a worker thread once a slot is free"""
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Get the concurrency semaphore of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+        return semaphore
@@ -0,0 +1,256 @@
+import os
+import re
+import base64
+import hashlib
+import tempfile
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Any, Optional
+
+from app.services.gmail_service import GmailService
+from app.services.mime_parser import extract_part
+from app.services.db_utils import db_connection
+from app.models.email import EmailModel
+
+class _HTMLTextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document"""
+    
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip = 0
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+    
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+    
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+class AttachmentService:
+    """
+    Service for handling email attachments:
+    - Downloads attachment bodies from Gmail on demand
+    - Streams decoded content to disk in chunks
+    - Deduplicates identical files across emails by content hash
+    - Extracts text from text-like formats for entity extraction
+    """
+    
+    # MIME types whose content can be read as text
+    TEXT_MIME_TYPES = {
+        "text/plain", "text/csv", "text/tab-separated-values", "text/markdown",
+        "text/html", "text/calendar", "text/xml",
+        "application/json", "application/xml", "application/csv"
+    }
+    TEXT_EXTENSIONS = {".txt", ".csv", ".tsv", ".md", ".html", ".htm", ".ics", ".xml", ".json"}
+    
+    # Base64 characters decoded per chunk; a multiple of 4 so chunks decode independently
+    CHUNK_CHARS = 4 * 1024 * 1024
+    
+    def __init__(self, gmail_service: GmailService, storage_dir: Optional[str] = None, max_text_chars: int = 20000):
+        """
+        Initialize the AttachmentService
+        
+        Args:
+            gmail_service: GmailService instance used to download attachments
+            storage_dir: Directory for downloaded files (default: ATTACHMENT_DIR or .cache/attachments)
+            max_text_chars: Maximum number of characters of extracted text kept per file
+        """
+        self.gmail_service = gmail_service
+        self.storage_dir = storage_dir or os.environ.get('ATTACHMENT_DIR', '.cache/attachments')
+        self.max_text_chars = max_text_chars
+        self.db = db_connection.connect()
+        self.attachments_collection = db_connection.get_collection("attachments")
+        self.emails_collection = db_connection.get_collection("emails")
+        
+        os.makedirs(self.storage_dir, exist_ok=True)
+    
+    def is_text_like(self, attachment: Dict[str, Any]) -> bool:
+        """Check whether an attachment is in a format we can extract text from"""
+        mime_type = (attachment.get("mime_type") or "").lower()
+        extension = os.path.splitext(attachment.get("filename", ""))[1].lower()
+        return mime_type in self.TEXT_MIME_TYPES or extension in self.TEXT_EXTENSIONS
+    
+    def ingest_attachments(self, email_model: EmailModel, max_bytes: int = 1024 * 1024) -> Dict[str, str]:
+        """
+        Download the small text-like attachments of an email and extract their text
+        
+        Other attachments only keep their metadata until they are requested.
+        
+        Args:
+            email_model: EmailModel whose attachments list holds Gmail metadata
+            max_bytes: Size limit for attachments downloaded at ingest time
+        
+        Returns:
+            Dictionary mapping attachment filename to extracted text
+        """
+        texts = {}
+        
+        for attachment in email_model.attachments:
+            if not self.is_text_like(attachment) or attachment.get("size", 0) > max_bytes:
+                continue
+            
+            try:
+                stored = self.download(email_model.message_id, attachment, update_email=False)
+                if stored.get("text"):
+                    texts[attachment["filename"]] = stored["text"]
+            except Exception as e:
+                print(f"Error ingesting attachment {attachment.get('filename')}: {e}")
+        
+        return texts
+    
+    def download(self, message_id: str, attachment: Dict[str, Any], update_email: bool = True) -> Dict[str, Any]:
+        """
+        Download an attachment to disk, reusing an identical file if one exists
+        
+        Args:
+            message_id: Gmail message ID the attachment belongs to
+            attachment: Attachment metadata dict (modified in place with its
+                        content hash)
+            update_email: Also record the content hash on the stored email
+        
+        Returns:
+            The attachments collection document, including 'path' and 'text'
+        """
+        # Reuse a file downloaded earlier for this part
+        if attachment.get("content_hash"):
+            stored = self.attachments_collection.find_one({"_id": attachment["content_hash"]})
+            if stored and os.path.exists(stored["path"]):
+                return stored
+        
+        if attachment.get("attachment_id"):
+            response = self.gmail_service.get_attachment(message_id, attachment["attachment_id"])
+            content_hash, size, tmp_path = self._write_chunks(response.get("data", ""))
+        else:
+            # Parsed from a raw message: the body is inside the message itself
+            # Labels do not matter here, so the stored payload is used as is
+            raw_message = self.gmail_service.get_raw_message(message_id, refresh_labels=False)
+            content = extract_part(raw_message, attachment["part_id"])
+            if content is None:
+                raise Exception(f"Part {attachment['part_id']} not found in message {message_id}")
+            content_hash, size, tmp_path = self._write_bytes(content)
+        
+        path = self._file_path(content_hash)
+        if os.path.exists(path):
+            # Identical file already stored for another email
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        
+        stored = self.attachments_collection.find_one({"_id": content_hash})
+        if stored is None:
+            stored = {
+                "_id": content_hash,
+                "path": path,
+                "size": size,
+                "mime_type": attachment.get("mime_type", ""),
+                "filename": attachment.get("filename", ""),
+                "text": self.extract_text(path, attachment) if self.is_text_like(attachment) else "",
+                "message_ids": [],
+                "created_at": datetime.utcnow()
+            }
+        
+        self.attachments_collection.update_one(
+            {"_id": content_hash},
+            {
+                "$setOnInsert": {k: v for k, v in stored.items() if k not in ("_id", "message_ids")},
+                "$addToSet": {"message_ids": message_id}
+            },
+            upsert=True
+        )
+        
+        attachment["content_hash"] = content_hash
+        if update_email:
+            self.emails_collection.update_one(
+                {"message_id": message_id, "attachments.part_id": attachment.get("part_id")},
+                {"$set": {"attachments.$.content_hash": content_hash}}
+            )
+        
+        return stored
+    
+    def extract_text(self, path: str, attachment: Dict[str, Any]) -> str:
+        """
+        Extract readable text from a downloaded text-like attachment
+        
+        Args:
+            path: Path of the downloaded file
+            attachment: Attachment metadata (used for the MIME type and filename)
+        
+        Returns:
+            Extracted text, truncated to max_text_chars
+        """
+        with open(path, "rb") as f:
+            raw = f.read(self.max_text_chars * 4)
+        
+        text = raw.decode("utf-8", errors="replace")
+        
+        mime_type = (attachment.get("mime_type") or "").lower()
+        extension = os.path.splitext(attachment.get("filename", ""))[1].lower()
+        if mime_type == "text/html" or extension in (".html", ".htm"):
+            extractor = _HTMLTextExtractor()
+            extractor.feed(text)
+            text = " ".join(extractor.parts)
+        
+        # Collapse runs of whitespace left over from markup and tables
+        text = re.sub(r"[ \t]+", " ", text)
+        text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+        
+        return text[:self.max_text_chars]
+    
+    def get_text(self, content_hash: str) -> str:
+        """Get the extracted text of a stored attachment"""
+        stored = self.attachments_collection.find_one({"_id": content_hash}, {"text": 1})
+        return stored.get("text", "") if stored else ""
+    
+    def _write_chunks(self, data: str) -> tuple:
+        """
+        Decode base64url data to a temporary file chunk by chunk
+        
+        Args:
+            data: base64url encoded attachment body
+        
+        Returns:
+            Tuple of (content hash, size in bytes, temporary file path)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            for start in range(0, len(data), self.CHUNK_CHARS):
+                chunk = data[start:start + self.CHUNK_CHARS]
+                # Gmail strips the padding from the final chunk
+                if len(chunk) % 4:
+                    chunk += "=" * (4 - len(chunk) % 4)
+                decoded = base64.urlsafe_b64decode(chunk)
+                digest.update(decoded)
+                size += len(decoded)
+                f.write(decoded)
+        
+        return digest.hexdigest(), size, tmp_path
+    
+    def _write_bytes(self, content: bytes) -> tuple:
+        """
+        Write already decoded content to a temporary file
+        
+        Args:
+            content: Attachment body
+        
+        Returns:
+            Tuple of (content hash, size in bytes, temporary file path)
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        
+        return hashlib.sha256(content).hexdigest(), len(content), tmp_path
+    
+    def _file_path(self, content_hash: str) -> str:
+        """Path of a stored attachment, sharded by the first two hash characters"""
+        return os.path.join(self.storage_dir, content_hash[:2], content_hash)
@@ -33,7 +33,8 @@ class CapsuleGenerator:
         self.openai_service = openai_service
         self.clustering_service = EmailClusteringService(email_processor, openai_service)
         self.summary_service = CapsuleSummaryService(email_processor, openai_service)
-        self.follow_up_service = FollowUpService(capsule_service, openai_service)
+        self.follow_up_service = FollowUpService(capsule_service, openai_service,
+                                                 emails_collection=email_processor.emails_collection)
     
     def process_email(self, message_id: str) -> Optional[str]:
         """
@@ -1,4 +1,4 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Iterator
 from datetime import datetime
 
 from app.models.capsule import CapsuleModel
@@ -25,6 +25,14 @@ class CapsuleSummaryService:
         self.email_processor = email_processor
         self.openai_service = openai_service
     
+    # Subject of each capsule type in the message used when summary generation fails
+    FAILURE_SUBJECTS = {
+        "Property": " about a property",
+        "Deal": " about a deal",
+        "Task": " about tasks",
+        "Meeting": " about a meeting",
+    }
+    
     def generate_summary(self, capsule: CapsuleModel) -> str:
         """
         Generate a summary for a capsule based on its emails
@@ -35,11 +43,54 @@ class CapsuleSummaryService:
         Returns:
             Generated summary text
         """
+        prompt, fallback = self._summary_request(capsule)
+        if prompt is None:
+            return fallback
+        
+        try:
+            summary = self.openai_service.simple_completion(prompt, model="gpt-4o")
+            return summary
+        except Exception as e:
+            print(f"Error generating summary of {capsule.type} capsule: {e}")
+            return fallback
+    
+    def stream_summary(self, capsule: CapsuleModel) -> Iterator[str]:
+        """
+        Generate the summary of a capsule, yielding the text as the model writes it
+        
+        Args:
+            capsule: CapsuleModel to generate summary for
+        
+        Yields:
+            Pieces of the summary text, in order
+        
+        Raises:
+            ValueError: If the completion fails; the caller decides whether to keep
+                        the text received so far
+        """
+        prompt, fallback = self._summary_request(capsule)
+        if prompt is None:
+            yield fallback
+            return
+        
+        yield from self.openai_service.stream_completion(prompt, model="gpt-4o")
+    
+    def _summary_request(self, capsule: CapsuleModel) -> Tuple[Optional[str], str]:
+        """
+        Build the summary prompt of a capsule
+        
+        Args:
+            capsule: CapsuleModel to generate summary for
+        
+        Returns:
+            Tuple of (prompt, text used if generation fails); the prompt is None
+            when there is no email content to summarize
+        """
         # Get all emails in the capsule
         email_ids = [email_ref.get("email_id") for email_ref in capsule.emails]
         
         if not email_ids:
-            return "No emails in this capsule."
+            return None, "No emails in this capsule."
         
         # Get email models
         emails = []
@@ -49,25 +100,50 @@ class CapsuleSummaryService:
                 emails.append(email_model)
         
         if not emails:
-            return "No email content available."
+            return None, "No email content available."
         
         # Sort emails by sent_at date
         emails.sort(key=lambda e: e.sent_at if e.sent_at else datetime.min)
         
-        # Generate summary based on capsule type
+        fallback = (f"Summary generation failed. This capsule contains {len(emails)} emails"
+                    f"{self.FAILURE_SUBJECTS.get(capsule.type, '')}.")
+        
+        # Build the prompt based on capsule type
         if capsule.type == "Property":
-            return self._generate_property_summary(capsule, emails)
+            return self._property_summary_prompt(capsule, emails), fallback
         elif capsule.type == "Deal":
-            return self._generate_deal_summary(capsule, emails)
+            return self._deal_summary_prompt(capsule, emails), fallback
         elif capsule.type == "Task":
-            return self._generate_task_summary(capsule, emails)
+            return self._task_summary_prompt(capsule, emails), fallback
         elif capsule.type == "Meeting":
-            return self._generate_meeting_summary(capsule, emails)
+            return self._meeting_summary_prompt(capsule, emails), fallback
         else:
-            return self._generate_general_summary(capsule, emails)
+            return self._general_summary_prompt(capsule, emails), fallback
     
-    def _generate_property_summary(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
-        """Generate a summary for a Property capsule"""
+    def _format_email_thread(self, emails: List[EmailModel], max_emails: int = 5) -> str:
+        """
+        Format the emails of a capsule for a summary prompt
+        
+        Bodies are stripped of quoted history and boilerplate, then fitted to
+        the per-email capsule_summary token budget.
+        
+        Args:
+            emails: Emails of the capsule
+            max_emails: Maximum number of emails included
+        
+        Returns:
+            The formatted email thread
+        """
+        return "\n\n".join([
+            f"Email {i+1} - From: {email.sender.get('name', 'Unknown')} ({email.sender.get('email', '')})\n"
+            f"Subject: {email.subject}\n"
+            f"Date: {email.sent_at}\n\n"
+            f"{self.openai_service.budget.prepare(email.body_text, 'capsule_summary')}"
+            for i, email in enumerate(emails[:max_emails])
+        ])
+    
+    def _property_summary_prompt(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
+        """Build the summary prompt of a Property capsule"""
         # Extract property information
         property_info = ""
         if capsule.entities.get("properties"):
@@ -76,13 +152,7 @@ class CapsuleSummaryService:
             property_info = f"Property: {property_address}\n\n"
         
         # Create a prompt for the OpenAI API
-        email_content = "\n\n".join([
-            f"Email {i+1} - From: {email.sender.get('name', 'Unknown')} ({email.sender.get('email', '')})\n"
-            f"Subject: {email.subject}\n"
-            f"Date: {email.sent_at}\n\n"
-            f"{email.body_text[:500]}..."  # Limit text to avoid token limits
-            for i, email in enumerate(emails[:5])  # Limit to 5 emails
-        ])
+        email_content = self._format_email_thread(emails)
         
         prompt = f"""
         Create a concise summary of this email thread about a real estate property.
@@ -101,15 +171,10 @@ class CapsuleSummaryService:
         Format the summary in clear paragraphs with bullet points for actions.
         """
         
-        try:
-            summary = self.openai_service.simple_completion(prompt, model="gpt-4o")
-            return summary
-        except Exception as e:
-            print(f"Error generating property summary: {e}")
-            return f"Summary generation failed. This capsule contains {len(emails)} emails about a property."
+        return prompt
     
-    def _generate_deal_summary(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
-        """Generate a summary for a Deal capsule"""
+    def _deal_summary_prompt(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
+        """Build the summary prompt of a Deal capsule"""
         # Extract deal information
         deal_info = ""
         if capsule.entities.get("properties"):
@@ -118,13 +183,7 @@ class CapsuleSummaryService:
             deal_info = f"Property: {property_address}\n\n"
         
         # Create a prompt for the OpenAI API
-        email_content = "\n\n".join([
-            f"Email {i+1} - From: {email.sender.get('name', 'Unknown')} ({email.sender.get('email', '')})\n"
-            f"Subject: {email.subject}\n"
-            f"Date: {email.sent_at}\n\n"
-            f"{email.body_text[:500]}..."  # Limit text to avoid token limits
-            for i, email in enumerate(emails[:5])  # Limit to 5 emails
-        ])
+        email_content = self._format_email_thread(emails)
         
         prompt = f"""
         Create a concise summary of this email thread about a real estate deal.
@@ -144,23 +203,12 @@ class CapsuleSummaryService:
         Format the summary in clear paragraphs with bullet points for actions.
         """
         
-        try:
-            summary = self.openai_service.simple_completion(prompt, model="gpt-4o")
-            return summary
-        except Exception as e:
-            print(f"Error generating deal summary: {e}")
-            return f"Summary generation failed. This capsule contains {len(emails)} emails about a deal."
+        return prompt
     
-    def _generate_task_summary(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
-        """Generate a summary for a Task capsule"""
+    def _task_summary_prompt(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
+        """Build the summary prompt of a Task capsule"""
         # Create a prompt for the OpenAI API
-        email_content = "\n\n".join([
-            f"Email {i+1} - From: {email.sender.get('name', 'Unknown')} ({email.sender.get('email', '')})\n"
-            f"Subject: {email.subject}\n"
-            f"Date: {email.sent_at}\n\n"
-            f"{email.body_text[:500]}..."  # Limit text to avoid token limits
-            for i, email in enumerate(emails[:5])  # Limit to 5 emails
-        ])
+        email_content = self._format_email_thread(emails)
         
         # Include follow-ups in the prompt
         follow_ups_text = ""
@@ -193,23 +241,12 @@ class CapsuleSummaryService:
         Format the summary in clear paragraphs with bullet points for actions.
         """
         
-        try:
-            summary = self.openai_service.simple_completion(prompt, model="gpt-4o")
-            return summary
-        except Exception as e:
-            print(f"Error generating task summary: {e}")
-            return f"Summary generation failed. This capsule contains {len(emails)} emails about tasks."
+        return prompt
     
-    def _generate_meeting_summary(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
-        """Generate a summary for a Meeting capsule"""
+    def _meeting_summary_prompt(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
+        """Build the summary prompt of a Meeting capsule"""
         # Create a prompt for the OpenAI API
-        email_content = "\n\n".join([
-            f"Email {i+1} - From: {email.sender.get('name', 'Unknown')} ({email.sender.get('email', '')})\n"
-            f"Subject: {email.subject}\n"
-            f"Date: {email.sent_at}\n\n"
-            f"{email.body_text[:500]}..."  # Limit text to avoid token limits
-            for i, email in enumerate(emails[:5])  # Limit to 5 emails
-        ])
+        email_content = self._format_email_thread(emails)
         
         prompt = f"""
         Create a concise summary of this email thread about a meeting.
@@ -227,23 +264,12 @@ class CapsuleSummaryService:
         Format the summary in clear paragraphs with bullet points for actions.
         """
         
-        try:
-            summary = self.openai_service.simple_completion(prompt, model="gpt-4o")
-            return summary
-        except Exception as e:
-            print(f"Error generating meeting summary: {e}")
-            return f"Summary generation failed. This capsule contains {len(emails)} emails about a meeting."
+        return prompt
     
-    def _generate_general_summary(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
-        """Generate a summary for a General capsule"""
+    def _general_summary_prompt(self, capsule: CapsuleModel, emails: List[EmailModel]) -> str:
+        """Build the summary prompt of a General capsule"""
         # Create a prompt for the OpenAI API
-        email_content = "\n\n".join([
-            f"Email {i+1} - From: {email.sender.get('name', 'Unknown')} ({email.sender.get('email', '')})\n"
-            f"Subject: {email.subject}\n"
-            f"Date: {email.sent_at}\n\n"
-            f"{email.body_text[:500]}..."  # Limit text to avoid token limits
-            for i, email in enumerate(emails[:5])  # Limit to 5 emails
-        ])
+        email_content = self._format_email_thread(emails)
         
         prompt = f"""
         Create a concise summary of this email thread.
@@ -260,12 +286,7 @@ class CapsuleSummaryService:
         Format the summary in clear paragraphs with bullet points for actions.
         """
         
-        try:
-            summary = self.openai_service.simple_completion(prompt, model="gpt-4o")
-            return summary
-        except Exception as e:
-            print(f"Error generating general summary: {e}")
-            return f"Summary generation failed. This capsule contains {len(emails)} emails."
+        return prompt
     
     def update_capsule_summary(self, capsule: CapsuleModel) -> str:
         """
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from typing import Dict, Any
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an API whose circuit is open"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to an external API:
+    - Closed: calls go through; consecutive failures are counted
+    - Open: after failure_threshold consecutive failures, calls fail fast
+      with CircuitOpenError for recovery_timeout seconds
+    - Half-open: after the timeout a limited number of probe calls go
+      through; a successful probe closes the circuit, a failed one opens it again
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str = "api", failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        Initialize the circuit breaker in the closed state
+        
+        Args:
+            name: Name used in log messages and errors
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before probing
+            half_open_max_calls: Concurrent probe calls allowed while half-open
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        
+        self.opened = 0
+        self.short_circuited = 0
+    
+    @property
+    def state(self) -> str:
+        """Current state; an open circuit whose timeout has passed reports half-open"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+    
+    def allows_requests(self) -> bool:
+        """Check whether a call would currently be let through (without reserving a probe)"""
+        return self.state != self.OPEN
+    
+    def before_call(self) -> None:
+        """
+        Check the circuit before a call
+        
+        Every call let through must end in record_success, record_failure or
+        release_probe, or a half-open circuit keeps waiting for its probe.
+        
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all probes in flight
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self.short_circuited += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open after {self._failures} consecutive failures")
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.short_circuited += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open and waiting for a probe")
+                self._probes += 1
+    
+    def release_probe(self) -> None:
+        """Give back the probe reserved by before_call for a call that ended without a result"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+    
+    def record_success(self) -> None:
+        """Record a successful call, closing the circuit"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"{self.name} circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+    
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit after too many consecutive failures"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                    print(f"{self.name} circuit opened after {self._failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the current state and counters"""
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "short_circuited": self.short_circuited
+            }
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """
+    Get the process-wide OpenAI circuit breaker, creating it from environment variables on first use
+    
+    OPENAI_CIRCUIT_FAILURES (default 5) and OPENAI_CIRCUIT_RECOVERY_SECONDS
+    (default 30) configure the breaker.
+    """
+    global _breaker
+    
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                name="OpenAI",
+                failure_threshold=int(os.environ.get("OPENAI_CIRCUIT_FAILURES", "5")),
+                recovery_timeout=float(os.environ.get("OPENAI_CIRCUIT_RECOVERY_SECONDS", "30"))
+            )
+        return _breaker
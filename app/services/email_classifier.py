@@ -0,0 +1,395 @@
+import os
+import re
+import json
+import math
+import zlib
+import random
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from app.services.prompt_budget import clean_email_body
+
+# Explanation prefix of categories set by the local classifier; such emails
+# are not used as training labels so the model never learns from itself
+LOCAL_EXPLANATION = "Local classifier"
+
+_TOKEN = re.compile(r"[a-z0-9$%]+(?:[.,'][a-z0-9]+)*")
+
+class HashedLinearClassifier:
+    """
+    Multinomial logistic regression over hashed word n-grams:
+    - Features are word unigrams and bigrams hashed into a fixed number of buckets
+    - Trained with plain SGD, no third-party dependencies
+    - Weights are stored sparsely and serialize to JSON
+    """
+    
+    def __init__(self, n_features: int = 2 ** 16, labels: Optional[List[str]] = None):
+        """
+        Initialize an untrained classifier
+        
+        Args:
+            n_features: Number of hash buckets
+            labels: Class labels, set by fit() if not given
+        """
+        self.n_features = n_features
+        self.labels = list(labels or [])
+        self.weights = {label: {} for label in self.labels}
+        self.bias = {label: 0.0 for label in self.labels}
+    
+    def features(self, text: str) -> Dict[int, float]:
+        """
+        Hash the unigrams and bigrams of a text into an L2-normalized sparse vector
+        
+        Args:
+            text: Input text
+        
+        Returns:
+            Dictionary of bucket index to value
+        """
+        tokens = _TOKEN.findall(text.lower())
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        
+        vector = {}
+        for gram in grams:
+            # crc32 rather than hash() so buckets are stable across processes
+            index = zlib.crc32(gram.encode("utf-8")) % self.n_features
+            vector[index] = vector.get(index, 0.0) + 1.0
+        
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {index: value / norm for index, value in vector.items()}
+    
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 5, learning_rate: float = 0.5,
+            l2: float = 1e-5, seed: int = 0) -> None:
+        """
+        Train the classifier
+        
+        Args:
+            texts: Training texts
+            labels: Label of each text
+            epochs: Passes over the training data
+            learning_rate: Initial SGD step size, decayed per epoch
+            l2: L2 regularization strength
+            seed: Seed of the shuffling order
+        """
+        self.labels = sorted(set(labels))
+        self.weights = {label: {} for label in self.labels}
+        self.bias = {label: 0.0 for label in self.labels}
+        
+        examples = [(self.features(text), label) for text, label in zip(texts, labels)]
+        rng = random.Random(seed)
+        
+        for epoch in range(epochs):
+            rng.shuffle(examples)
+            step = learning_rate / (1 + epoch)
+            for vector, target in examples:
+                probabilities = self._probabilities(vector)
+                for label in self.labels:
+                    gradient = probabilities[label] - (1.0 if label == target else 0.0)
+                    weights = self.weights[label]
+                    for index, value in vector.items():
+                        weight = weights.get(index, 0.0)
+                        weights[index] = weight - step * (gradient * value + l2 * weight)
+                    self.bias[label] -= step * gradient
+    
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """
+        Predict the most probable label of a text
+        
+        Args:
+            text: Input text
+        
+        Returns:
+            Tuple of (label, probability), or (None, 0.0) if the model is untrained
+        """
+        if not self.labels:
+            return None, 0.0
+        
+        probabilities = self._probabilities(self.features(text))
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+    
+    def to_dict(self, min_weight: float = 1e-4) -> Dict[str, Any]:
+        """Serialize the model, dropping weights too small to matter"""
+        return {
+            "n_features": self.n_features,
+            "labels": self.labels,
+            "bias": self.bias,
+            "weights": {
+                label: {str(index): round(weight, 6) for index, weight in weights.items() if abs(weight) >= min_weight}
+                for label, weights in self.weights.items()
+            }
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HashedLinearClassifier':
+        """Load a model serialized by to_dict"""
+        model = cls(data["n_features"], data["labels"])
+        model.bias = dict(data["bias"])
+        model.weights = {
+            label: {int(index): weight for index, weight in weights.items()}
+            for label, weights in data["weights"].items()
+        }
+        return model
+    
+    def _probabilities(self, vector: Dict[int, float]) -> Dict[str, float]:
+        """Softmax of the label scores of a feature vector"""
+        scores = {
+            label: self.bias[label] + sum(self.weights[label].get(index, 0.0) * value for index, value in vector.items())
+            for label in self.labels
+        }
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+class EmailClassifier:
+    """
+    Local first tier in front of the LLM for categorization and follow-up detection:
+    - Trains hashed n-gram models from labels already stored in the emails collection
+    - Answers only when its confidence reaches the threshold; callers escalate
+      every other email to the LLM
+    - Counts local answers and escalations per task
+    """
+    
+    # Tasks with one model each
+    TASKS = ("category", "priority", "follow_up")
+    
+    def __init__(self, model_path: Optional[str] = None, threshold: float = 0.9, min_examples: int = 50):
+        """
+        Initialize the classifier, loading a saved model if there is one
+        
+        Args:
+            model_path: JSON file the trained models are saved to and loaded from
+            threshold: Minimum probability for a local answer
+            min_examples: Minimum labeled emails needed to train a task's model
+        """
+        self.model_path = model_path
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.models = {}
+        self.trained_at = None
+        self._lock = threading.Lock()
+        self._stats = {task: {"local": 0, "escalated": 0} for task in self.TASKS}
+        
+        if model_path and os.path.exists(model_path):
+            self.load()
+    
+    @staticmethod
+    def email_text(body_text: str, subject: str = "") -> str:
+        """Text the models see: the subject and the start of the cleaned body"""
+        return f"{subject}\n{clean_email_body(body_text or '')[:4000]}"
+    
+    @staticmethod
+    def training_labels(doc: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Get the training labels of a stored email document
+        
+        Only labels produced by the LLM are used: default categories, local
+        classifier answers and emails still awaiting enrichment are skipped.
+        The follow-up label is the answer FollowUpService stored from the
+        LLM's follow-up detection, which is only asked about emails without
+        extracted action items, the same emails the model screens.
+        
+        Args:
+            doc: Email document from the emails collection
+        
+        Returns:
+            Dictionary of task name to label
+        """
+        labels = {}
+        if doc.get("follow_up_label") in ("yes", "no"):
+            labels["follow_up"] = doc["follow_up_label"]
+        
+        if doc.get("enrichment_status", "complete") != "complete":
+            return labels
+        
+        explanation = doc.get("category_explanation") or ""
+        if not doc.get("category") or explanation.startswith(("Default", LOCAL_EXPLANATION)):
+            return labels
+        
+        labels["category"] = doc["category"]
+        if doc.get("priority") is not None:
+            labels["priority"] = str(doc["priority"])
+        
+        return labels
+    
+    def train(self, docs: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Train one model per task from email documents and save them
+        
+        Tasks with fewer than min_examples labels or a single label are left
+        untrained, so every email of that task escalates to the LLM. If no
+        task can be trained, the current models are kept and not saved over.
+        
+        Args:
+            docs: Email documents with subject, body_text, category, priority,
+                  category_explanation, enrichment_status and follow_up_label
+        
+        Returns:
+            Number of training examples per trained task
+        """
+        examples = {task: ([], []) for task in self.TASKS}
+        for doc in docs:
+            labels = self.training_labels(doc)
+            if not labels:
+                continue
+            
+            text = self.email_text(doc.get("body_text", ""), doc.get("subject", ""))
+            for task, label in labels.items():
+                examples[task][0].append(text)
+                examples[task][1].append(label)
+        
+        models = {}
+        counts = {}
+        for task, (texts, labels) in examples.items():
+            if len(texts) < self.min_examples or len(set(labels)) < 2:
+                print(f"Not enough labeled emails to train the {task} model ({len(texts)})")
+                continue
+            
+            model = HashedLinearClassifier()
+            model.fit(texts, labels)
+            models[task] = model
+            counts[task] = len(texts)
+        
+        if not models:
+            return counts
+        
+        with self._lock:
+            self.models = models
+            self.trained_at = datetime.utcnow().isoformat()
+        
+        if self.model_path:
+            self.save()
+        
+        return counts
+    
+    def train_from_collection(self, collection, limit: int = 20000) -> Dict[str, int]:
+        """
+        Train from the most recent emails of a MongoDB collection
+        
+        Args:
+            collection: The emails collection
+            limit: Maximum number of emails to read
+        
+        Returns:
+            Number of training examples per trained task
+        """
+        projection = {
+            "subject": 1, "body_text": 1, "category": 1, "priority": 1, "category_explanation": 1,
+            "enrichment_status": 1, "follow_up_label": 1
+        }
+        cursor = collection.find({}, projection).sort("received_at", -1).limit(limit)
+        return self.train(cursor)
+    
+    def categorize(self, body_text: str, subject: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Categorize an email locally if the category model is confident
+        
+        Args:
+            body_text: The body text of the email
+            subject: The subject of the email
+        
+        Returns:
+            Dictionary with "category", "priority" and "explanation" like
+            OpenAIService.categorize_email, or None to escalate to the LLM
+        """
+        text = self.email_text(body_text, subject)
+        category, confidence = self._predict("category", text)
+        if category is None:
+            return None
+        
+        # Priority follows the category decision; its most probable label is used
+        priority_model = self.models.get("priority")
+        priority = priority_model.predict(text)[0] if priority_model else None
+        
+        return {
+            "category": category,
+            "priority": int(priority) if priority else 3,
+            "explanation": f"{LOCAL_EXPLANATION} (confidence {confidence:.2f})"
+        }
+    
+    def needs_follow_up(self, body_text: str, subject: str = "") -> Optional[bool]:
+        """
+        Decide locally whether an email asks for a follow-up
+        
+        Args:
+            body_text: The body text of the email
+            subject: The subject of the email
+        
+        Returns:
+            True or False if the follow-up model is confident, None to escalate to the LLM
+        """
+        label, _ = self._predict("follow_up", self.email_text(body_text, subject))
+        return None if label is None else label == "yes"
+    
+    def save(self) -> None:
+        """Save the trained models to model_path"""
+        directory = os.path.dirname(self.model_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with self._lock:
+            data = {
+                "trained_at": self.trained_at,
+                "models": {task: model.to_dict() for task, model in self.models.items()}
+            }
+        
+        # Write to a temporary file first so readers never see a partial model
+        tmp_path = f"{self.model_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.model_path)
+    
+    def load(self) -> None:
+        """Load the models saved at model_path"""
+        try:
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading email classifier from {self.model_path}: {e}")
+            return
+        
+        with self._lock:
+            self.models = {task: HashedLinearClassifier.from_dict(model) for task, model in data["models"].items()}
+            self.trained_at = data.get("trained_at")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return local answers and escalations per task"""
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "trained_at": self.trained_at,
+                "tasks": {task: dict(stats) for task, stats in self._stats.items()}
+            }
+    
+    def _predict(self, task: str, text: str) -> Tuple[Optional[str], float]:
+        """Predict a label, returning (None, confidence) below the threshold"""
+        model = self.models.get(task)
+        label, confidence = model.predict(text) if model else (None, 0.0)
+        confident = label is not None and confidence >= self.threshold
+        
+        with self._lock:
+            self._stats[task]["local" if confident else "escalated"] += 1
+        
+        return (label if confident else None), confidence
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+def get_classifier() -> EmailClassifier:
+    """
+    Get the process-wide email classifier, creating it from environment variables on first use
+    
+    CLASSIFIER_MODEL_PATH (default .cache/email_classifier.json) and
+    CLASSIFIER_CONFIDENCE_THRESHOLD (default 0.9) configure the classifier.
+    """
+    global _classifier
+    
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = EmailClassifier(
+                model_path=os.environ.get("CLASSIFIER_MODEL_PATH", ".cache/email_classifier.json"),
+                threshold=float(os.environ.get("CLASSIFIER_CONFIDENCE_THRESHOLD", "0.9"))
+            )
+        return _classifier
@@ -191,11 +191,11 @@ class EmailClusteringService:
                     
                     Email 1:
                     Subject: {email1.subject}
-                    Body: {email1.body_text[:500]}...
+                    Body: {self.openai_service.budget.prepare(email1.body_text, "clustering")}
                     
                     Email 2:
                     Subject: {email2.subject}
-                    Body: {email2.body_text[:500]}...
+                    Body: {self.openai_service.budget.prepare(email2.body_text, "clustering")}
                     
                     Are these emails related to the same topic, property, deal, or task?
                     Answer with just 'yes' or 'no'.
@@ -6,6 +6,8 @@ from app.services.gmail_service import GmailService
 from app.services.email_processor import EmailProcessor
 from app.services.capsule_generator import CapsuleGenerator
 from app.services.capsule_service import CapsuleService
+from app.services.openai_service import OpenAIService
+from app.services.openai_batch import OpenAIBatchClient, BatchError, BatchFailedError
 
 class EmailPipeline:
     """
@@ -16,22 +18,30 @@ class EmailPipeline:
     - Can be run as a one-time process or as a continuous background job
     """
     
+    # Key of the document listing submitted enrichment batches in the sync_state collection
+    ENRICHMENT_BATCHES_ID = "enrichment_batches"
+    
     def __init__(self):
         """Initialize the email processing pipeline"""
         # Set up Gmail service
         credentials_path = os.environ.get('GMAIL_CREDENTIALS_PATH', 'client_secret.json')
         token_path = os.environ.get('GMAIL_TOKEN_PATH', 'token.pickle')
         scopes = ['https://www.googleapis.com/auth/gmail.readonly']
+        cache_dir = os.environ.get('GMAIL_CACHE_DIR', '.cache/gmail')
+        cache_max_bytes = int(os.environ.get('GMAIL_CACHE_MAX_MB', '512')) * 1024 * 1024
+        use_raw_format = os.environ.get('GMAIL_RAW_PARSER', '').lower() in ('1', 'true', 'yes')
         
-        self.gmail_service = GmailService(credentials_path, token_path, scopes)
+        self.gmail_service = GmailService(credentials_path, token_path, scopes, cache_dir, cache_max_bytes,
+                                          use_raw_format=use_raw_format)
         
         # Build the service if token exists
         self.gmail_service.build_service()
         
-        # Set up other services
-        self.email_processor = EmailProcessor(self.gmail_service)
+        # Set up other services; one OpenAIService so all of them share its connection pool
+        self.openai_service = OpenAIService()
+        self.email_processor = EmailProcessor(self.gmail_service, self.openai_service)
         self.capsule_service = CapsuleService()
-        self.capsule_generator = CapsuleGenerator(self.email_processor, self.capsule_service)
+        self.capsule_generator = CapsuleGenerator(self.email_processor, self.capsule_service, self.openai_service)
     
     def process_emails(self, max_emails: int = 10) -> Dict[str, Any]:
         """
@@ -52,8 +62,8 @@ class EmailPipeline:
             }
         
         try:
-            # Process new emails
-            processed_ids = self.email_processor.process_new_emails(max_emails)
+            # Process emails added since the last history checkpoint
+            processed_ids = self.email_processor.sync_new_emails(max_emails)
             
             # Generate capsules
             capsule_ids = []
@@ -67,7 +77,16 @@ class EmailPipeline:
                 "processed_emails": len(processed_ids),
                 "created_capsules": len(capsule_ids),
                 "email_ids": processed_ids,
-                "capsule_ids": capsule_ids
+                "capsule_ids": capsule_ids,
+                "openai_pool": self.openai_service.pool_stats(),
+                "llm_cache": self.openai_service.cache_stats(),
+                "openai_rate_limit": self.openai_service.rate_limit_headroom(),
+                "openai_circuit": self.openai_service.circuit_stats(),
+                "openai_hedging": self.openai_service.hedge_stats(),
+                "openai_packing": self.openai_service.packing_stats(),
+                "llm_ledger": self.openai_service.ledger_stats(),
+                "classifier": self.email_processor.classifier.stats(),
+                "prompt_tokens_saved": self.openai_service.prompt_stats()
             }
             
         except Exception as e:
@@ -79,6 +98,298 @@ class EmailPipeline:
                 "created_capsules": 0
             }
     
+    def backfill(self, query: Optional[str] = None, limit: Optional[int] = None, page_size: int = 100) -> Dict[str, Any]:
+        """
+        Import historical emails matching a query and generate capsules
+        
+        Message IDs are streamed page by page from Gmail and processed as they
+        arrive, so backfills are not limited to a single page of results.
+        
+        Args:
+            query: Gmail search query selecting the emails to import
+            limit: Maximum number of messages to read, or None for all
+            page_size: Number of message IDs listed per Gmail page
+        
+        Returns:
+            Dictionary with processing results
+        """
+        if not self.gmail_service.service:
+            return {
+                "success": False,
+                "error": "Gmail service not authenticated",
+                "processed_emails": 0,
+                "created_capsules": 0
+            }
+        
+        processed_count = 0
+        capsule_ids = set()
+        
+        try:
+            messages = self.gmail_service.iter_messages(query=query, page_size=page_size, limit=limit)
+            for message_id in self.email_processor.iter_process_messages(messages):
+                processed_count += 1
+                
+                capsule_id = self.capsule_generator.process_email(message_id)
+                if capsule_id:
+                    capsule_ids.add(capsule_id)
+                
+                if processed_count % 100 == 0:
+                    print(f"Backfill progress: {processed_count} emails processed")
+            
+            return {
+                "success": True,
+                "processed_emails": processed_count,
+                "created_capsules": len(capsule_ids),
+                "openai_pool": self.openai_service.pool_stats(),
+                "llm_cache": self.openai_service.cache_stats(),
+                "openai_rate_limit": self.openai_service.rate_limit_headroom(),
+                "openai_circuit": self.openai_service.circuit_stats(),
+                "openai_hedging": self.openai_service.hedge_stats(),
+                "openai_packing": self.openai_service.packing_stats(),
+                "llm_ledger": self.openai_service.ledger_stats(),
+                "classifier": self.email_processor.classifier.stats(),
+                "prompt_tokens_saved": self.openai_service.prompt_stats()
+            }
+        
+        except Exception as e:
+            print(f"Error in email backfill: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "processed_emails": processed_count,
+                "created_capsules": len(capsule_ids)
+            }
+    
+    def batch_backfill(self, query: Optional[str] = None, limit: Optional[int] = None, page_size: int = 100,
+                       poll_interval: float = 60.0) -> Dict[str, Any]:
+        """
+        Import historical emails and enrich them through the OpenAI Batch API
+        
+        Emails are stored first without any interactive OpenAI calls, then
+        enriched by batch jobs, so large imports do not consume the rate budget
+        of the live pipeline.
+        
+        Args:
+            query: Gmail search query selecting the emails to import
+            limit: Maximum number of messages to read, or None for all
+            page_size: Number of message IDs listed per Gmail page
+            poll_interval: Seconds between batch status checks
+        
+        Returns:
+            Dictionary with processing results
+        """
+        if not self.gmail_service.service:
+            return {
+                "success": False,
+                "error": "Gmail service not authenticated",
+                "processed_emails": 0,
+                "created_capsules": 0
+            }
+        
+        stored_count = 0
+        try:
+            messages = self.gmail_service.iter_messages(query=query, page_size=page_size, limit=limit)
+            for _ in self.email_processor.iter_process_messages(messages, enrich=False):
+                stored_count += 1
+                if stored_count % 500 == 0:
+                    print(f"Backfill progress: {stored_count} emails stored for batch enrichment")
+        except Exception as e:
+            print(f"Error in email backfill: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "processed_emails": stored_count,
+                "created_capsules": 0
+            }
+        
+        result = self.enrich_pending(poll_interval=poll_interval)
+        result["stored_emails"] = stored_count
+        return result
+    
+    def enrich_pending(self, poll_interval: float = 60.0, max_requests_per_batch: int = 10000,
+                       model: str = "gpt-4o-mini", timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Enrich all stored emails with enrichment_status "pending" using batch jobs
+        
+        All batches are submitted before waiting, so they are processed in parallel.
+        Their IDs are saved in the sync_state collection until their results are
+        stored, and a run first collects the batches an earlier run left behind.
+        New batches are only submitted once none is outstanding, so no email is
+        billed twice. Emails whose request failed stay pending and are picked up
+        by the next run.
+        
+        Args:
+            poll_interval: Seconds between batch status checks
+            max_requests_per_batch: Maximum number of requests per batch input file
+            model: The OpenAI model to use
+            timeout: Maximum number of seconds to wait for each batch, or None to
+                wait until it finishes
+        
+        Returns:
+            Dictionary with processing results
+        """
+        batch_dir = os.environ.get('OPENAI_BATCH_DIR', '.cache/batches')
+        client = OpenAIBatchClient(transport=self.openai_service.transport)
+        
+        enriched_count = 0
+        capsule_ids = set()
+        
+        try:
+            # Batches submitted by an interrupted run are collected first
+            unfinished_ids = []
+            for batch_id in self._saved_batch_ids():
+                count = self._collect_batch(client, batch_id, poll_interval, timeout, capsule_ids)
+                if count is None:
+                    unfinished_ids.append(batch_id)
+                else:
+                    enriched_count += count
+            
+            pending_ids = [] if unfinished_ids else self._pending_ids()
+            
+            batch_ids = []
+            for start in range(0, len(pending_ids), max_requests_per_batch):
+                chunk = pending_ids[start:start + max_requests_per_batch]
+                input_path = os.path.join(batch_dir, f"enrich-{int(time.time())}-{start // max_requests_per_batch}.jsonl")
+                
+                requests = self.email_processor.iter_pending_enrichment_requests(chunk, model)
+                if not client.write_requests(requests, input_path):
+                    continue
+                
+                batch = client.create_batch(client.upload_file(input_path), metadata={"job": "email_enrichment"})
+                print(f"Submitted batch {batch['id']} with {len(chunk)} emails")
+                self._save_batch_id(batch["id"])
+                batch_ids.append(batch["id"])
+            
+            for batch_id in batch_ids:
+                count = self._collect_batch(client, batch_id, poll_interval, timeout, capsule_ids)
+                if count is None:
+                    unfinished_ids.append(batch_id)
+                else:
+                    enriched_count += count
+            
+            return {
+                "success": True,
+                "processed_emails": enriched_count,
+                "pending_emails": len(self._pending_ids()),
+                "created_capsules": len(capsule_ids),
+                "unfinished_batches": unfinished_ids
+            }
+        
+        except Exception as e:
+            print(f"Error in batch enrichment: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "processed_emails": enriched_count,
+                "created_capsules": len(capsule_ids)
+            }
+    
+    def _collect_batch(self, client: OpenAIBatchClient, batch_id: str, poll_interval: float,
+                       timeout: Optional[float], capsule_ids: set) -> Optional[int]:
+        """
+        Wait for one enrichment batch and store its results
+        
+        The batch ID stays saved if the batch is still running or its results
+        could not be downloaded, so the next run collects it again.
+        
+        Args:
+            client: Batch client
+            batch_id: ID of the batch job
+            poll_interval: Seconds between batch status checks
+            timeout: Maximum number of seconds to wait, or None to wait until it finishes
+            capsule_ids: Set the IDs of created or updated capsules are added to
+        
+        Returns:
+            Number of enriched emails, or None if the batch has to be collected again
+        """
+        try:
+            batch = client.wait_for_batch(batch_id, poll_interval, timeout)
+        except TimeoutError as e:
+            print(f"{e}, collecting it on the next run")
+            return None
+        except BatchFailedError as e:
+            # Nothing to collect; its emails are still pending and are submitted again
+            print(e)
+            self._forget_batch_id(batch_id)
+            return 0
+        except BatchError as e:
+            print(f"Error polling batch {batch_id}, collecting it on the next run: {e}")
+            return None
+        
+        enriched_count = 0
+        try:
+            for result in client.iter_batch_output(batch):
+                message_id = self.email_processor.apply_batch_result(result)
+                if not message_id:
+                    continue
+                
+                enriched_count += 1
+                capsule_id = self.capsule_generator.process_email(message_id)
+                if capsule_id:
+                    capsule_ids.add(capsule_id)
+        except BatchError as e:
+            print(f"Error downloading the results of batch {batch_id}, collecting it on the next run: {e}")
+            return None
+        
+        self._forget_batch_id(batch_id)
+        return enriched_count
+    
+    def _pending_ids(self) -> List[str]:
+        """Get the message IDs of stored emails waiting for enrichment"""
+        return [
+            doc["message_id"]
+            for doc in self.email_processor.emails_collection.find(
+                {"enrichment_status": "pending"}, {"message_id": 1}
+            )
+        ]
+    
+    def _saved_batch_ids(self) -> List[str]:
+        """Get the IDs of enrichment batches whose results are not stored yet"""
+        state = self.email_processor.sync_state_collection.find_one({"_id": self.ENRICHMENT_BATCHES_ID}) or {}
+        return list(state.get("batch_ids") or [])
+    
+    def _save_batch_id(self, batch_id: str) -> None:
+        """Remember a submitted enrichment batch until its results are stored"""
+        self.email_processor.sync_state_collection.update_one(
+            {"_id": self.ENRICHMENT_BATCHES_ID},
+            {"$addToSet": {"batch_ids": batch_id}},
+            upsert=True
+        )
+    
+    def _forget_batch_id(self, batch_id: str) -> None:
+        """Drop an enrichment batch whose results are stored"""
+        self.email_processor.sync_state_collection.update_one(
+            {"_id": self.ENRICHMENT_BATCHES_ID},
+            {"$pull": {"batch_ids": batch_id}}
+        )
+    
+    def train_classifier(self, limit: int = 20000) -> Dict[str, Any]:
+        """
+        Train the local email classifier from the labels of stored emails
+        
+        Args:
+            limit: Maximum number of most recent emails to learn from
+        
+        Returns:
+            Dictionary with the number of training examples per trained task
+        """
+        try:
+            classifier = self.email_processor.classifier
+            examples = classifier.train_from_collection(self.email_processor.emails_collection, limit)
+            return {
+                "success": bool(examples),
+                "examples": examples,
+                "model_path": classifier.model_path,
+                "error": None if examples else "Not enough labeled emails"
+            }
+        except Exception as e:
+            print(f"Error training email classifier: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "examples": {}
+            }
+    
     def run_continuous(self, interval_seconds: int = 300, max_emails: int = 10) -> None:
         """
         Run the email processing pipeline continuously at specified intervals
@@ -1,12 +1,17 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Iterator
 import re
 import email.utils
 from datetime import datetime, timedelta
 from email.header import decode_header
+from pymongo.errors import BulkWriteError, OperationFailure
 
-from app.services.gmail_service import GmailService
+from app.services.gmail_service import GmailService, HistoryExpiredError
 from app.services.db_utils import db_connection
-from app.services.openai_service import OpenAIService
+from app.services.openai_service import OpenAIService, NOT_RETRIED
+from app.services.async_openai_service import AsyncOpenAIService
+from app.services.email_classifier import EmailClassifier, get_classifier
+from app.services.prompt_budget import ATTACHMENT_MARKER
+from app.services.attachment_service import AttachmentService
 from app.models.email import EmailModel
 
 class EmailProcessor:
@@ -18,17 +23,42 @@ class EmailProcessor:
     - Stores processed emails in the database
     """
     
-    def __init__(self, gmail_service: GmailService):
+    # Key of the Gmail history checkpoint document in the sync_state collection
+    SYNC_STATE_ID = "gmail_history"
+    
+    # Syncs in which a message that could not be fetched or stored is retried
+    SYNC_MAX_RETRIES = 5
+    
+    # MongoDB error code of a unique index violation
+    DUPLICATE_KEY_ERROR = 11000
+    
+    def __init__(self, gmail_service: GmailService, openai_service: Optional[OpenAIService] = None,
+                 classifier: Optional[EmailClassifier] = None):
         """
         Initialize the EmailProcessor with a Gmail service
         
         Args:
             gmail_service: An authenticated GmailService instance
+            openai_service: OpenAIService to share with other services (default: a new one)
+            classifier: Local classifier tried before the LLM (default: the shared instance)
         """
         self.gmail_service = gmail_service
         self.db = db_connection.connect()
         self.emails_collection = db_connection.get_collection("emails")
-        self.openai_service = OpenAIService()
+        self.sync_state_collection = db_connection.get_collection("sync_state")
+        self.openai_service = openai_service or OpenAIService()
+        self.async_openai_service = AsyncOpenAIService(self.openai_service)
+        self.classifier = classifier or get_classifier()
+        self.attachment_service = AttachmentService(gmail_service)
+        self._ensure_indexes()
+    
+    def _ensure_indexes(self) -> None:
+        """Create the unique message_id index that makes duplicate inserts from concurrent runs harmless"""
+        try:
+            self.emails_collection.create_index("message_id", unique=True, name="message_id_unique")
+        except OperationFailure as e:
+            # Existing duplicates prevent the index; ingest still skips known IDs
+            print(f"Could not create unique index on emails.message_id: {e}")
     
     def process_new_emails(self, max_emails: int = 10) -> List[str]:
         """
@@ -43,37 +73,200 @@ class EmailProcessor:
         # Query for unread emails
         messages = self.gmail_service.list_messages(max_results=max_emails, query="is:unread")
         
-        processed_ids = []
-        for message in messages:
-            message_id = message.get('id')
+        new_ids = self._filter_new_ids([message.get('id') for message in messages])
+        return self._process_message_ids(new_ids)
+    
+    def sync_new_emails(self, max_emails: int = 10, resync_limit: int = 100) -> List[str]:
+        """
+        Process emails added since the last sync using Gmail history checkpoints
+        
+        Only messages added after the stored historyId are listed, so each poll
+        costs a single history call instead of re-listing the same unread
+        messages. When there is no checkpoint yet, or Gmail has expired it, a
+        full resync of at most resync_limit inbox messages is performed.
+        Messages that could not be fetched or stored are retried by later
+        syncs, up to SYNC_MAX_RETRIES failed syncs in total.
+        
+        Args:
+            max_emails: Maximum number of emails to process in this run
+            resync_limit: Maximum number of messages to list on a full resync
+        
+        Returns:
+            List of processed email IDs
+        """
+        state = self.sync_state_collection.find_one({"_id": self.SYNC_STATE_ID}) or {}
+        start_history_id = state.get("history_id")
+        
+        # Messages of earlier syncs that failed, mapped to their number of failed syncs
+        retries = state.get("retry_ids") or {}
+        
+        candidate_ids = None
+        if start_history_id:
+            try:
+                history = self.gmail_service.list_history(start_history_id)
+                candidate_ids = history["message_ids"]
+                new_history_id = history["history_id"]
+            except HistoryExpiredError as e:
+                print(f"{e}, falling back to a full resync")
+        
+        if candidate_ids is None:
+            # Take the checkpoint before listing so nothing that arrives
+            # during the resync is skipped by the next delta
+            new_history_id = self.gmail_service.get_profile().get("historyId")
+            messages = self.gmail_service.list_messages(max_results=resync_limit, query="in:inbox")
+            candidate_ids = [message.get('id') for message in messages]
+        
+        new_ids = self._filter_new_ids(list(retries) + candidate_ids)
+        batch_ids = new_ids[:max_emails]
+        processed_ids = self._process_message_ids(batch_ids)
+        
+        # Only move the checkpoint once every new message has been handled,
+        # otherwise the next run picks up the remainder from the same point
+        if len(new_ids) <= max_emails and new_history_id:
+            # The next delta starts after messages that failed to fetch or
+            # store, so they are kept for the next runs to retry
+            failed_ids = self._filter_new_ids(batch_ids) if len(processed_ids) < len(batch_ids) else []
+            retry_ids = {}
+            for message_id in failed_ids:
+                attempts = retries.get(message_id, 0) + 1
+                if attempts < self.SYNC_MAX_RETRIES:
+                    retry_ids[message_id] = attempts
+                else:
+                    print(f"Giving up on message {message_id} after {attempts} failed syncs")
             
-            # Check if email already exists in database
-            existing = self.emails_collection.find_one({"message_id": message_id})
-            if existing:
-                continue
-                
+            self.sync_state_collection.update_one(
+                {"_id": self.SYNC_STATE_ID},
+                {"$set": {"history_id": new_history_id, "retry_ids": retry_ids, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+        
+        return processed_ids
+    
+    def iter_process_messages(self, messages: Iterable[Dict[str, Any]], chunk_size: int = 50,
+                              enrich: bool = True) -> Iterator[str]:
+        """
+        Process a stream of Gmail message stubs chunk by chunk
+        
+        Messages are deduplicated, fetched and stored as soon as a chunk has
+        been read from the stream, so a backfill never holds more than one
+        chunk of messages in memory.
+        
+        Args:
+            messages: Iterable of message stubs, e.g. GmailService.iter_messages()
+            chunk_size: Number of messages fetched and processed together
+            enrich: Enrich emails with OpenAI now; if False they are stored with
+                    enrichment_status "pending" for batch enrichment
+        
+        Yields:
+            IDs of processed emails as each chunk completes
+        """
+        chunk = []
+        for message in messages:
+            chunk.append(message.get('id'))
+            if len(chunk) >= chunk_size:
+                yield from self._process_new_chunk(chunk, enrich)
+                chunk = []
+        
+        if chunk:
+            yield from self._process_new_chunk(chunk, enrich)
+    
+    def _process_new_chunk(self, message_ids: List[str], enrich: bool = True) -> List[str]:
+        """Process the messages of a chunk that are not in the database yet"""
+        return self._process_message_ids(self._filter_new_ids(message_ids), enrich)
+    
+    def _filter_new_ids(self, message_ids: List[str]) -> List[str]:
+        """
+        Keep the message IDs that are not in the database yet
+        
+        All IDs are checked with a single query that only returns message IDs.
+        
+        Args:
+            message_ids: Candidate Gmail message IDs
+        
+        Returns:
+            The new IDs, in their original order and without repeats
+        """
+        candidates = list(dict.fromkeys(message_id for message_id in message_ids if message_id))
+        if not candidates:
+            return []
+        
+        existing = {
+            doc["message_id"]
+            for doc in self.emails_collection.find({"message_id": {"$in": candidates}}, {"message_id": 1, "_id": 0})
+        }
+        return [message_id for message_id in candidates if message_id not in existing]
+    
+    def _process_message_ids(self, message_ids: List[str], enrich: bool = True) -> List[str]:
+        """
+        Fetch, enrich and store the given Gmail messages
+        
+        Args:
+            message_ids: Gmail message IDs that are not yet in the database
+            enrich: Enrich emails with OpenAI now; if False they are stored with
+                    enrichment_status "pending" for batch enrichment
+        
+        Returns:
+            List of processed email IDs
+        """
+        if not message_ids:
+            return []
+        
+        # Fetch all bodies with batched requests instead of one call per message
+        fetch_result = self.gmail_service.get_messages_with_body(message_ids)
+        for message_id, error in fetch_result["errors"].items():
+            print(f"Error fetching message {message_id}: {error}")
+        
+        email_models = []
+        for email_data in fetch_result["messages"]:
             # Process the email
-            email_data = self.gmail_service.get_message_with_body(message_id)
             email_model = self._convert_to_email_model(email_data)
             
             if email_model:
-                # Extract entities and information using OpenAI
-                self._extract_entities_with_ai(email_model)
-                
-                # Generate summary using OpenAI
-                self._generate_summary(email_model)
-                
-                # Categorize email using OpenAI
-                self._categorize_email(email_model)
-                
-                # Store in database
-                email_dict = email_model.to_dict()
-                result = self.emails_collection.insert_one(email_dict)
-                
-                if result.inserted_id:
-                    processed_ids.append(message_id)
+                # Download small text attachments so their content can be used for extraction
+                attachment_texts = self.attachment_service.ingest_attachments(email_model)
+                email_models.append((email_model, attachment_texts))
         
-        return processed_ids
+        if enrich:
+            # Extract entities, summarize and categorize, several emails at a time
+            self._enrich_emails(email_models)
+        else:
+            for email_model, _ in email_models:
+                email_model.summary = f"Email from {email_model.sender.get('name', 'Unknown')} about {email_model.subject}"
+                email_model.enrichment_status = "pending"
+        
+        return self._store_emails([email_model for email_model, _ in email_models])
+    
+    def _store_emails(self, email_models: List[EmailModel]) -> List[str]:
+        """
+        Insert emails with one unordered bulk write
+        
+        Emails another run stored in the meantime are rejected by the unique
+        message_id index and skipped; the others are still inserted.
+        
+        Args:
+            email_models: Emails to store
+        
+        Returns:
+            Message IDs of the emails that were inserted
+        
+        Raises:
+            BulkWriteError: If an insert failed for another reason than a duplicate message ID
+        """
+        if not email_models:
+            return []
+        
+        try:
+            self.emails_collection.insert_many([email_model.to_dict() for email_model in email_models], ordered=False)
+            failed = set()
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            other_errors = [error for error in errors if error.get("code") != self.DUPLICATE_KEY_ERROR]
+            if other_errors:
+                raise
+            failed = {error["index"] for error in errors}
+            print(f"Skipped {len(failed)} emails that were already stored by another run")
+        
+        return [email_model.message_id for index, email_model in enumerate(email_models) if index not in failed]
     
     def _convert_to_email_model(self, email_data: Dict[str, Any]) -> Optional[EmailModel]:
         """
@@ -129,7 +322,7 @@ class EmailProcessor:
                 body_html=body_html,
                 sent_at=sent_at,
                 received_at=datetime.utcnow(),
-                attachments=[],  # TODO: Handle attachments
+                attachments=email_data.get('attachments', []),
                 labels=email_data.get('labels', []),
                 is_read=False
             )
@@ -192,20 +385,278 @@ class EmailProcessor:
         
         return name, email_addr
     
-    def _extract_entities_with_ai(self, email_model: EmailModel) -> None:
+    def _enrich_emails(self, email_models: List[tuple]) -> None:
+        """
+        Enrich several emails with concurrent OpenAI calls
+        
+        Short emails are packed several to a request (see OpenAIService.pack_emails),
+        so bursts like listing blasts do not resend the enrichment prompt per email.
+        
+        Args:
+            email_models: List of (EmailModel, attachment_texts) tuples
+        
+        Returns:
+            None (modifies the email models in place)
+        """
+        if not email_models:
+            return
+        
+        items = {
+            email_model.message_id: (email_model, attachment_texts)
+            for email_model, attachment_texts in email_models
+        }
+        packs = self.openai_service.pack_emails([
+            {
+                "message_id": message_id,
+                "text": self._text_with_attachments(email_model, attachment_texts),
+                "subject": email_model.subject
+            }
+            for message_id, (email_model, attachment_texts) in items.items()
+        ])
+        
+        results = self.async_openai_service.run_batch(packs, self.async_openai_service.enrich_packed)
+        
+        for pack, outcome in zip(packs, results):
+            for email_item in pack:
+                email_model, attachment_texts = items[email_item["message_id"]]
+                if isinstance(outcome.get("error"), NOT_RETRIED):
+                    self._enrich_offline(email_model)
+                elif "error" in outcome:
+                    print(f"Error enriching email with AI: {outcome['error']}")
+                    self._enrich_with_fallbacks(email_model, attachment_texts)
+                elif outcome["result"][email_item["message_id"]] is None:
+                    # The API became unavailable before this email of the pack was sent
+                    self._enrich_offline(email_model)
+                else:
+                    self._apply_enrichment(email_model, outcome["result"][email_item["message_id"]])
+    
+    def iter_pending_enrichment_requests(self, message_ids: Iterable[str], model: str = "gpt-4o-mini") -> Iterator[tuple]:
+        """
+        Build enrichment requests for stored emails, for use with the Batch API
+        
+        Args:
+            message_ids: IDs of stored emails with enrichment_status "pending"
+            model: The OpenAI model to use
+        
+        Yields:
+            (message_id, chat completion request body) tuples
+        """
+        for message_id in message_ids:
+            email_model = self.get_email_by_id(message_id)
+            if not email_model:
+                continue
+            
+            # Attachment text was extracted when the email was stored
+            attachment_texts = {
+                attachment["filename"]: self.attachment_service.get_text(attachment["content_hash"])
+                for attachment in email_model.attachments
+                if attachment.get("content_hash")
+            }
+            
+            yield message_id, self.openai_service.build_enrichment_request(
+                email_text=self._text_with_attachments(email_model, attachment_texts),
+                email_subject=email_model.subject,
+                model=model
+            )
+    
+    def apply_batch_result(self, result: Dict[str, Any]) -> Optional[str]:
+        """
+        Store one line of a Batch API output file on its email
+        
+        Args:
+            result: Batch result object whose custom_id is the email's message ID
+        
+        Returns:
+            The message ID if the email was enriched, None if the request failed
+            or its response was unusable (the email then stays pending)
+        """
+        message_id = result.get("custom_id")
+        response = result.get("response") or {}
+        
+        if result.get("error") or response.get("status_code") != 200:
+            print(f"Batch enrichment failed for {message_id}: {result.get('error') or response.get('body')}")
+            return None
+        
+        email_model = self.get_email_by_id(message_id)
+        if not email_model:
+            return None
+        
+        email_model.enrichment_status = "complete"
+        self._apply_enrichment(email_model, self.openai_service.parse_enrichment_response(response["body"]))
+        self.emails_collection.update_one(
+            {"message_id": message_id},
+            {"$set": {
+                "extracted_data": email_model.extracted_data,
+                "summary": email_model.summary,
+                "category": email_model.category,
+                "priority": email_model.priority,
+                "category_explanation": email_model.category_explanation,
+                "enrichment_status": email_model.enrichment_status
+            }}
+        )
+        return message_id if email_model.enrichment_status == "complete" else None
+    
+    def _enrich_email(self, email_model: EmailModel, attachment_texts: Optional[Dict[str, str]] = None) -> None:
+        """
+        Extract entities, summarize and categorize an email using OpenAI
+        
+        Args:
+            email_model: EmailModel to enrich
+            attachment_texts: Text extracted from the email's attachments, keyed by filename
+        
+        Returns:
+            None (modifies email_model in place)
+        """
+        try:
+            enrichment = self.openai_service.enrich_email(
+                email_text=self._text_with_attachments(email_model, attachment_texts),
+                email_subject=email_model.subject
+            )
+        except NOT_RETRIED:
+            self._enrich_offline(email_model)
+            return
+        except Exception as e:
+            print(f"Error enriching email with AI: {e}")
+            self._enrich_with_fallbacks(email_model, attachment_texts)
+            return
+        
+        self._apply_enrichment(email_model, enrichment)
+    
+    def _enrich_with_fallbacks(self, email_model: EmailModel, attachment_texts: Optional[Dict[str, str]] = None) -> None:
+        """Enrich an email with the per-task helpers and their local defaults"""
+        if not self.openai_service.circuit_breaker.allows_requests():
+            self._enrich_offline(email_model)
+            return
+        
+        try:
+            self._extract_entities_with_ai(email_model, attachment_texts)
+            self._generate_summary(email_model)
+            self._categorize_email(email_model)
+        except NOT_RETRIED:
+            # No point sending the remaining tasks while the API turns requests away
+            self._enrich_offline(email_model)
+            return
+        
+        # The circuit opened while the helpers ran, so some of them used local defaults
+        if not self.openai_service.circuit_breaker.allows_requests():
+            email_model.enrichment_status = "pending"
+    
+    def _enrich_offline(self, email_model: EmailModel) -> None:
+        """
+        Enrich an email without OpenAI while its circuit is open or its rate limit is exhausted
+        
+        Entities come from regex extraction and the category from the local
+        classifier or keyword rules. The email is marked "pending" so that
+        --enrich-pending replaces these results once the API is back.
+        
+        Args:
+            email_model: EmailModel to enrich
+        
+        Returns:
+            None (modifies email_model in place)
+        """
+        self._extract_entities_with_regex(email_model)
+        email_model.summary = f"Email from {email_model.sender.get('name', 'Unknown')} about {email_model.subject}"
+        
+        category_data = self.classifier.categorize(email_model.body_text, email_model.subject)
+        if not category_data:
+            category_data = self._categorize_with_rules(email_model)
+        
+        email_model.category = category_data["category"]
+        email_model.priority = category_data["priority"]
+        email_model.category_explanation = category_data["explanation"]
+        email_model.enrichment_status = "pending"
+    
+    def _categorize_with_rules(self, email_model: EmailModel) -> Dict[str, Any]:
+        """
+        Categorize an email with keyword rules as a fallback method
+        
+        Args:
+            email_model: EmailModel to categorize
+        
+        Returns:
+            Dictionary with "category", "priority" and "explanation"
+        """
+        text = f"{email_model.subject}\n{email_model.body_text}".lower()
+        
+        # Category with the most keyword hits; ties go to the earlier category
+        category_keywords = {
+            "Deal": [r"\bloi\b", r"letter of intent", r"\boffer\b", r"purchase price", r"\bpsa\b",
+                     r"\bclosing\b", r"\bescrow\b", r"due diligence", r"term sheet", r"cap rate"],
+            "Property": [r"\blease\b", r"\btenant", r"\brent\b", r"\bproperty\b", r"square feet",
+                         r"\bsf\b", r"\bzoning\b", r"\binspection\b"],
+            "Meeting": [r"\bmeeting\b", r"\bcall\b", r"\bschedule\b", r"\bcalendar\b", r"\bzoom\b",
+                        r"\btour\b", r"\binvit"],
+            "Task": [r"\bplease\b", r"action required", r"\bto-?do\b", r"\bdeadline\b", r"\bdue\b"]
+        }
+        hits = {
+            category: sum(1 for pattern in patterns if re.search(pattern, text))
+            for category, patterns in category_keywords.items()
+        }
+        category = max(hits, key=hits.get) if max(hits.values()) > 0 else "General"
+        
+        if re.search(r"\burgent\b|\basap\b|\bimmediately\b|\btoday\b|\beod\b", text):
+            priority = 1
+        elif re.search(r"\bdeadline\b|\btomorrow\b|\bby (?:monday|tuesday|wednesday|thursday|friday)\b", text):
+            priority = 2
+        else:
+            priority = 3
+        
+        return {
+            "category": category,
+            "priority": priority,
+            "explanation": "Default categorization from keyword rules while the AI service is unavailable"
+        }
+    
+    def _apply_enrichment(self, email_model: EmailModel, enrichment: Dict[str, Any]) -> None:
+        """
+        Copy the result of OpenAIService.enrich_email onto an email model
+        
+        Results made of defaults only ("partial" source) leave the email pending.
+        
+        Args:
+            email_model: EmailModel to update
+            enrichment: Dictionary returned by enrich_email
+        
+        Returns:
+            None (modifies email_model in place)
+        """
+        extracted_data = enrichment["entities"]
+        self._add_email_participants_to_people(email_model, extracted_data)
+        email_model.extracted_data = extracted_data
+        
+        summary = enrichment["summary"]
+        if summary and not summary.startswith("Error"):
+            email_model.summary = summary
+        else:
+            email_model.summary = f"Email from {email_model.sender.get('name', 'Unknown')} about {email_model.subject}"
+        
+        email_model.category = enrichment["category"]
+        email_model.priority = enrichment["priority"]
+        email_model.category_explanation = enrichment["explanation"]
+        
+        # Defaults standing in for an unusable response; --enrich-pending asks again
+        if enrichment.get("source") == "partial":
+            email_model.enrichment_status = "pending"
+    
+    def _extract_entities_with_ai(self, email_model: EmailModel, attachment_texts: Optional[Dict[str, str]] = None) -> None:
         """
         Extract entities and key information from email using OpenAI
         
         Args:
             email_model: EmailModel to extract entities from
+            attachment_texts: Text extracted from the email's attachments, keyed by filename
             
         Returns:
             None (modifies email_model in place)
+        
+        Raises:
+            RateLimitError, CircuitOpenError: If OpenAI cannot be called at the moment
         """
         try:
             # Use OpenAI to extract entities
             extracted_data = self.openai_service.extract_entities(
-                email_text=email_model.body_text,
+                email_text=self._text_with_attachments(email_model, attachment_texts),
                 email_subject=email_model.subject
             )
             
@@ -227,11 +678,31 @@ class EmailProcessor:
             # Update the email model with extracted data
             email_model.extracted_data = extracted_data
             
+        except NOT_RETRIED:
+            raise
         except Exception as e:
             print(f"Error extracting entities with AI: {e}")
             # Fall back to regex-based extraction
             self._extract_entities_with_regex(email_model)
     
+    def _text_with_attachments(self, email_model: EmailModel, attachment_texts: Optional[Dict[str, str]] = None,
+                               max_chars_per_attachment: int = 4000) -> str:
+        """
+        Append extracted attachment text to the email body for entity extraction
+        
+        Args:
+            email_model: EmailModel providing the body text
+            attachment_texts: Text extracted from attachments, keyed by filename
+            max_chars_per_attachment: Maximum characters included per attachment
+        
+        Returns:
+            Body text followed by one section per attachment
+        """
+        text = email_model.body_text
+        for filename, attachment_text in (attachment_texts or {}).items():
+            text += f"{ATTACHMENT_MARKER}{filename} ---\n{attachment_text[:max_chars_per_attachment]}"
+        return text
+    
     def _extract_entities_with_regex(self, email_model: EmailModel) -> None:
         """
         Extract entities using regex as a fallback method
@@ -367,6 +838,9 @@ class EmailProcessor:
             
         Returns:
             None (modifies email_model in place)
+        
+        Raises:
+            RateLimitError, CircuitOpenError: If OpenAI cannot be called at the moment
         """
         try:
             # Use OpenAI to generate summary
@@ -382,6 +856,8 @@ class EmailProcessor:
                 # Fallback to a simple summary
                 email_model.summary = f"Email from {email_model.sender.get('name', 'Unknown')} about {email_model.subject}"
                 
+        except NOT_RETRIED:
+            raise
         except Exception as e:
             print(f"Error generating summary: {e}")
             # Fallback to a simple summary
@@ -389,20 +865,26 @@ class EmailProcessor:
     
     def _categorize_email(self, email_model: EmailModel) -> None:
         """
-        Categorize the email using OpenAI
+        Categorize the email, using OpenAI only if the local classifier is not confident
         
         Args:
             email_model: EmailModel to categorize
             
         Returns:
             None (modifies email_model in place)
+        
+        Raises:
+            RateLimitError, CircuitOpenError: If OpenAI cannot be called at the moment
         """
         try:
+            category_data = self.classifier.categorize(email_model.body_text, email_model.subject)
+            
             # Use OpenAI to categorize email
-            category_data = self.openai_service.categorize_email(
-                email_text=email_model.body_text,
-                email_subject=email_model.subject
-            )
+            if not category_data:
+                category_data = self.openai_service.categorize_email(
+                    email_text=email_model.body_text,
+                    email_subject=email_model.subject
+                )
             
             # Update the email model with category information
             if category_data:
@@ -415,6 +897,8 @@ class EmailProcessor:
                 email_model.priority = 3
                 email_model.category_explanation = "Default categorization"
                 
+        except NOT_RETRIED:
+            raise
         except Exception as e:
             print(f"Error categorizing email: {e}")
             # Fallback to default values
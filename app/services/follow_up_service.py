@@ -6,6 +6,7 @@ from app.models.email import EmailModel
 from app.models.capsule import CapsuleModel
 from app.services.openai_service import OpenAIService
 from app.services.capsule_service import CapsuleService
+from app.services.email_classifier import EmailClassifier, get_classifier
 
 class FollowUpService:
     """
@@ -16,16 +17,24 @@ class FollowUpService:
     - Detects completed follow-ups
     """
     
-    def __init__(self, capsule_service: CapsuleService, openai_service: OpenAIService):
+    def __init__(self, capsule_service: CapsuleService, openai_service: OpenAIService,
+                 classifier: Optional[EmailClassifier] = None, emails_collection=None):
         """
         Initialize the FollowUpService
         
         Args:
             capsule_service: CapsuleService instance for accessing capsules
             openai_service: OpenAIService instance for analyzing emails
+            classifier: Local classifier that rules out follow-ups before the LLM
+                        is asked (default: the shared instance)
+            emails_collection: Emails collection in which the LLM's follow-up
+                               answers are stored as the classifier's training
+                               labels (default: not stored)
         """
         self.capsule_service = capsule_service
         self.openai_service = openai_service
+        self.classifier = classifier or get_classifier()
+        self.emails_collection = emails_collection
     
     def detect_follow_ups(self, email_model: EmailModel) -> List[Dict[str, Any]]:
         """
@@ -69,6 +78,11 @@ class FollowUpService:
                         "email_id": email_model.message_id
                     })
         
+        # Emails the local classifier is confident need no follow-up (e.g. a
+        # one-line "thanks") skip both the AI call and the regex fallback
+        if not follow_ups and self.classifier.needs_follow_up(email_model.body_text, email_model.subject) is False:
+            return []
+        
         # If no action items were extracted, use AI to detect follow-ups
         if not follow_ups:
             follow_ups = self._detect_follow_ups_with_ai(email_model)
@@ -82,68 +96,49 @@ class FollowUpService:
     def _detect_follow_ups_with_ai(self, email_model: EmailModel) -> List[Dict[str, Any]]:
         """Use AI to detect follow-ups in an email"""
         try:
-            prompt = f"""
-            Analyze this email and identify any follow-up tasks, action items, or requests.
-            
-            Subject: {email_model.subject}
-            From: {email_model.sender.get('name', 'Unknown')} ({email_model.sender.get('email', '')})
-            
-            Email Body:
-            {email_model.body_text[:1000]}...
-            
-            Extract any follow-up tasks with these details:
-            1. Task description
-            2. Who is responsible (if mentioned)
-            3. Due date or deadline (if mentioned)
-            
-            Format your response as a JSON array of objects with these fields:
-            [
-                {{
-                    "title": "Task description",
-                    "responsible": "Person responsible",
-                    "due_date": "YYYY-MM-DD" or ""
-                }}
-            ]
-            
-            If no follow-up tasks are found, return an empty array: []
-            """
+            sender = f"{email_model.sender.get('name', 'Unknown')} ({email_model.sender.get('email', '')})"
+            tasks = self.openai_service.detect_follow_ups(email_model.body_text, email_model.subject, sender)
+            self._store_follow_up_label(email_model, bool(tasks))
             
-            response = self.openai_service.simple_completion(prompt, model="gpt-4o")
-            
-            # Parse the JSON response
-            import json
-            try:
-                tasks = json.loads(response)
-                
-                # Convert to follow-up format
-                follow_ups = []
-                for task in tasks:
-                    # Parse due date if provided
-                    due_date = datetime.utcnow() + timedelta(days=7)  # Default to 7 days from now
-                    if task.get("due_date"):
-                        try:
-                            due_date = datetime.strptime(task["due_date"], "%Y-%m-%d")
-                        except:
-                            pass  # Keep the default date if parsing fails
-                    
-                    follow_ups.append({
-                        "title": task.get("title", f"Follow up on: {email_model.subject}"),
-                        "description": f"Action item from email: {email_model.subject}",
-                        "responsible": task.get("responsible", ""),
-                        "due_date": due_date,
-                        "completed": False,
-                        "created_at": datetime.utcnow(),
-                        "email_id": email_model.message_id
-                    })
+            # Convert to follow-up format
+            follow_ups = []
+            for task in tasks:
+                # Parse due date if provided
+                due_date = datetime.utcnow() + timedelta(days=7)  # Default to 7 days from now
+                if task.get("due_date"):
+                    try:
+                        due_date = datetime.strptime(task["due_date"], "%Y-%m-%d")
+                    except:
+                        pass  # Keep the default date if parsing fails
                 
-                return follow_ups
-            except json.JSONDecodeError:
-                print(f"Error parsing AI response as JSON: {response}")
-                return []
+                follow_ups.append({
+                    "title": task.get("title", f"Follow up on: {email_model.subject}"),
+                    "description": f"Action item from email: {email_model.subject}",
+                    "responsible": task.get("responsible", ""),
+                    "due_date": due_date,
+                    "completed": False,
+                    "created_at": datetime.utcnow(),
+                    "email_id": email_model.message_id
+                })
+            
+            return follow_ups
         except Exception as e:
             print(f"Error detecting follow-ups with AI: {e}")
             return []
     
+    def _store_follow_up_label(self, email_model: EmailModel, has_follow_ups: bool) -> None:
+        """Store the LLM's follow-up answer for an email as a training label of the local classifier"""
+        if self.emails_collection is None:
+            return
+        
+        try:
+            self.emails_collection.update_one(
+                {"message_id": email_model.message_id},
+                {"$set": {"follow_up_label": "yes" if has_follow_ups else "no"}}
+            )
+        except Exception as e:
+            print(f"Error storing follow-up label for {email_model.message_id}: {e}")
+    
     def _detect_follow_ups_with_regex(self, email_model: EmailModel) -> List[Dict[str, Any]]:
         """Use regex patterns to detect follow-ups in an email"""
         follow_ups = []
@@ -0,0 +1,286 @@
+import os
+import copy
+import json
+import mmap
+import zlib
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, Optional
+
+class PayloadStore:
+    """
+    Local on-disk store of raw Gmail API payloads:
+    - Blobs are zlib-compressed JSON files named by the SHA-256 of their content
+    - An SQLite index maps (kind, object ID) to a blob and the payload's historyId
+    - Least recently used entries are evicted once the store exceeds max_bytes
+    - Blobs are read through mmap so bulk reprocessing stays on local disk
+    """
+    
+    def __init__(self, root_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Initialize the payload store
+        
+        Args:
+            root_dir: Directory holding the blobs and the index database
+            max_bytes: Maximum total size of the compressed blobs
+        """
+        self.root_dir = root_dir
+        self.blob_dir = os.path.join(root_dir, "blobs")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        
+        os.makedirs(self.blob_dir, exist_ok=True)
+        
+        self._conn = sqlite3.connect(
+            os.path.join(root_dir, "index.sqlite3"),
+            timeout=30,
+            check_same_thread=False
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS payloads (
+                kind TEXT NOT NULL,
+                object_id TEXT NOT NULL,
+                history_id INTEGER,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (kind, object_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS payloads_last_access ON payloads (last_access)")
+        self._conn.commit()
+    
+    def get(self, kind: str, object_id: str, history_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get a stored payload
+        
+        Args:
+            kind: Payload type, e.g. "message" or "thread"
+            object_id: Gmail ID of the message or thread
+            history_id: If given, only return a payload at least this recent
+        
+        Returns:
+            The stored payload, or None if it is missing or outdated
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, history_id FROM payloads WHERE kind = ? AND object_id = ?",
+                (kind, object_id)
+            ).fetchone()
+            
+            if not row:
+                return None
+            
+            digest, stored_history_id = row
+            if history_id is not None and (stored_history_id is None or stored_history_id < int(history_id)):
+                return None
+            
+            self._conn.execute(
+                "UPDATE payloads SET last_access = ? WHERE kind = ? AND object_id = ?",
+                (time.time(), kind, object_id)
+            )
+            self._conn.commit()
+        
+        try:
+            return self._read_blob(digest)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Error reading cached {kind} {object_id}: {e}")
+            self.delete(kind, object_id)
+            return None
+    
+    def put(self, kind: str, object_id: str, payload: Dict[str, Any]) -> None:
+        """
+        Store a payload, replacing any older version of the same object
+        
+        Args:
+            kind: Payload type, e.g. "message" or "thread"
+            object_id: Gmail ID of the message or thread
+            payload: Gmail API response to store
+        """
+        data = zlib.compress(json.dumps(payload, sort_keys=True).encode("utf-8"), 6)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        
+        # Identical payloads share one blob
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        
+        history_id = payload.get("historyId")
+        
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT digest FROM payloads WHERE kind = ? AND object_id = ?",
+                (kind, object_id)
+            ).fetchone()
+            
+            self._conn.execute(
+                "INSERT OR REPLACE INTO payloads (kind, object_id, history_id, digest, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, object_id, int(history_id) if history_id else None, digest, len(data), time.time())
+            )
+            self._conn.commit()
+            
+            if old and old[0] != digest:
+                self._remove_blob_if_unused(old[0])
+            
+            self._evict()
+    
+    def delete(self, kind: str, object_id: str) -> None:
+        """Remove a payload from the store"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM payloads WHERE kind = ? AND object_id = ?",
+                (kind, object_id)
+            ).fetchone()
+            self._conn.execute("DELETE FROM payloads WHERE kind = ? AND object_id = ?", (kind, object_id))
+            self._conn.commit()
+            
+            if row:
+                self._remove_blob_if_unused(row[0])
+    
+    def iter_payloads(self, kind: str) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over all stored payloads of a kind without contacting Gmail
+        
+        Args:
+            kind: Payload type, e.g. "message"
+        
+        Yields:
+            Stored payloads, one at a time
+        """
+        with self._lock:
+            digests = [row[0] for row in self._conn.execute(
+                "SELECT digest FROM payloads WHERE kind = ? ORDER BY object_id", (kind,)
+            )]
+        
+        for digest in digests:
+            try:
+                yield self._read_blob(digest)
+            except (OSError, ValueError, zlib.error):
+                # Evicted or removed since the listing was taken
+                continue
+    
+    def stats(self) -> Dict[str, int]:
+        """Return the number of entries and total blob size of the store"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0]
+            total_bytes = self._total_bytes()
+        
+        return {"entries": entries, "bytes": total_bytes, "max_bytes": self.max_bytes}
+    
+    def _blob_path(self, digest: str) -> str:
+        """Path of the blob for a digest, sharded by its first two characters"""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+    
+    def _read_blob(self, digest: str) -> Dict[str, Any]:
+        """Read and decode a blob through a read-only memory map"""
+        with open(self._blob_path(digest), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return json.loads(zlib.decompress(mapped))
+    
+    def _total_bytes(self) -> int:
+        """Total size of the distinct blobs referenced by the index"""
+        row = self._conn.execute(
+            "SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM payloads GROUP BY digest)"
+        ).fetchone()
+        return row[0] or 0
+    
+    def _remove_blob_if_unused(self, digest: str) -> None:
+        """Delete a blob file once no index entry references it"""
+        in_use = self._conn.execute("SELECT 1 FROM payloads WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+        if not in_use:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+    
+    def _evict(self) -> None:
+        """Evict least recently used entries until the store fits in max_bytes"""
+        total_bytes = self._total_bytes()
+        if total_bytes <= self.max_bytes:
+            return
+        
+        rows = self._conn.execute(
+            "SELECT kind, object_id, digest, size FROM payloads ORDER BY last_access"
+        ).fetchall()
+        
+        for kind, object_id, digest, size in rows:
+            if total_bytes <= self.max_bytes:
+                break
+            
+            self._conn.execute("DELETE FROM payloads WHERE kind = ? AND object_id = ?", (kind, object_id))
+            in_use = self._conn.execute("SELECT 1 FROM payloads WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+            if not in_use:
+                total_bytes -= size
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+        
+        self._conn.commit()
+
+class ThreadCache:
+    """
+    In-memory LRU cache of parsed Gmail threads:
+    - Entries remember the historyId of the thread they were parsed from
+    - Callers revalidate with a cheap minimal-format fetch of the historyId
+    - Safe to share between request threads; entries are stored and returned
+      as copies, so callers may modify the threads they get
+    """
+    
+    def __init__(self, max_entries: int = 200):
+        """
+        Initialize the thread cache
+        
+        Args:
+            max_entries: Maximum number of parsed threads to keep
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, thread_id: str, history_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a parsed thread if it is still at the given historyId
+        
+        Args:
+            thread_id: Gmail thread ID
+            history_id: Current historyId of the thread
+            
+        Returns:
+            The parsed thread, or None if missing or changed since it was cached
+        """
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is None or entry[0] != str(history_id):
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(thread_id)
+            self.hits += 1
+        
+        return copy.deepcopy(entry[1])
+    
+    def put(self, thread_id: str, history_id: str, thread_data: Dict[str, Any]) -> None:
+        """Store a copy of a parsed thread together with the historyId it was parsed at"""
+        thread_data = copy.deepcopy(thread_data)
+        with self._lock:
+            self._entries[thread_id] = (str(history_id), thread_data)
+            self._entries.move_to_end(thread_id)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return the cache size and hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,207 @@
+import time
+import random
+import threading
+from typing import Callable, Dict, Any, Optional
+
+from googleapiclient.errors import HttpError
+
+class QuotaScheduler:
+    """
+    Token-bucket scheduler for Gmail per-user quota units:
+    - Charges each request its documented quota cost before it is sent
+    - Blocks callers instead of letting them exceed the per-second budget
+    - Retries rate-limited and transient failures with jittered backoff,
+      honoring Retry-After when Gmail sends it
+    """
+    
+    # Quota units per method, see https://developers.google.com/gmail/api/reference/quota
+    METHOD_COSTS = {
+        "getProfile": 1,
+        "history.list": 2,
+        "labels.list": 1,
+        "messages.list": 5,
+        "messages.get": 5,
+        "messages.attachments.get": 5,
+        "threads.list": 10,
+        "threads.get": 10,
+    }
+    DEFAULT_COST = 5
+    
+    # 403 reasons Gmail uses for quota rather than permission problems
+    RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+    
+    def __init__(self, units_per_second: float = 250, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 32.0):
+        """
+        Initialize the scheduler
+        
+        Args:
+            units_per_second: Per-user quota units Gmail allows each second
+            max_retries: Maximum number of retries for a rate-limited request
+            base_delay: First backoff delay in seconds
+            max_delay: Upper bound of a single backoff delay in seconds
+        """
+        self.units_per_second = units_per_second
+        self.capacity = units_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+        
+        self.rate_limited = 0
+        self.retries = 0
+    
+    def cost_of(self, request) -> int:
+        """
+        Get the quota cost of an API request or batch
+        
+        Args:
+            request: googleapiclient HttpRequest or BatchHttpRequest
+        
+        Returns:
+            Number of quota units the request consumes
+        """
+        # Batches are charged for every request they contain
+        batched = getattr(request, "_requests", None)
+        if batched is not None:
+            return sum(self.cost_of(item) for item in batched.values())
+        
+        method_id = getattr(request, "methodId", None) or ""
+        method = method_id.replace("gmail.users.", "", 1)
+        return self.METHOD_COSTS.get(method, self.DEFAULT_COST)
+    
+    def acquire(self, units: float) -> None:
+        """
+        Block until the bucket can pay for a request, then charge it
+        
+        Requests costing more than one second of quota wait for a full bucket
+        and leave it in debt, which delays the callers that follow.
+        
+        Args:
+            units: Quota units the request consumes
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                
+                wait = max(0.0, self._blocked_until - now)
+                if not wait:
+                    needed = min(units, self.capacity)
+                    if self._tokens >= needed:
+                        self._tokens -= units
+                        return
+                    wait = (needed - self._tokens) / self.units_per_second
+                
+                self._condition.wait(wait)
+    
+    def execute(self, send: Callable[[], Any], units: float) -> Any:
+        """
+        Send a request within quota, retrying when Gmail rate-limits it
+        
+        Args:
+            send: Callable performing the HTTP request
+            units: Quota units the request consumes
+        
+        Returns:
+            The response returned by send
+        """
+        attempt = 0
+        while True:
+            self.acquire(units)
+            try:
+                return send()
+            except HttpError as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                
+                delay = self.backoff_delay(attempt, e)
+                if self.is_rate_limit_error(e):
+                    self.penalize(delay)
+                else:
+                    time.sleep(delay)
+                
+                attempt += 1
+                self.retries += 1
+    
+    def penalize(self, delay: float) -> None:
+        """Pause all callers for delay seconds after a rate-limit response"""
+        with self._condition:
+            self.rate_limited += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self._tokens = min(self._tokens, 0.0)
+            self._condition.notify_all()
+    
+    def is_rate_limit_error(self, error: Exception) -> bool:
+        """Check whether an error is a Gmail rate-limit response"""
+        if not isinstance(error, HttpError):
+            return False
+        
+        status = error.resp.status
+        if status == 429:
+            return True
+        
+        if status == 403:
+            reasons = {detail.get("reason") for detail in (error.error_details or []) if isinstance(detail, dict)}
+            return bool(reasons & self.RATE_LIMIT_REASONS) or "rate limit" in str(error).lower()
+        
+        return False
+    
+    def is_retryable(self, error: Exception) -> bool:
+        """Check whether an error is worth retrying (rate limits and 5xx)"""
+        if self.is_rate_limit_error(error):
+            return True
+        return isinstance(error, HttpError) and error.resp.status >= 500
+    
+    def backoff_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """
+        Delay before the next retry
+        
+        Args:
+            attempt: Number of retries already made
+            error: The error being retried, used for its Retry-After header
+        
+        Returns:
+            Seconds to wait
+        """
+        retry_after = None
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get("retry-after")
+        
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        
+        # Full jitter keeps parallel workers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def headroom(self) -> Dict[str, float]:
+        """
+        Report the quota currently available
+        
+        Returns:
+            Dictionary with the available units, the configured rate and the
+            remaining pause after a rate-limit response
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "available_units": round(self._tokens, 1),
+                "units_per_second": self.units_per_second,
+                "blocked_for": round(max(0.0, self._blocked_until - now), 3),
+                "rate_limited": self.rate_limited,
+                "retries": self.retries
+            }
+    
+    def _refill(self, now: float) -> None:
+        """Add the units accrued since the last update to the bucket"""
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.units_per_second)
@@ -1,11 +1,23 @@
 import os
+import time
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from app.services.gmail_cache import PayloadStore, ThreadCache
+from app.services.gmail_transport import GmailTransportPool
+from app.services.gmail_quota import QuotaScheduler
+from app.services.mime_parser import parse_raw_message
+
+class HistoryExpiredError(Exception):
+    """Raised when a stored historyId is too old for the History API"""
+    pass
 
 class GmailService:
-    def __init__(self, credentials_path, token_path, scopes):
+    def __init__(self, credentials_path, token_path, scopes, cache_dir=None, cache_max_bytes=512 * 1024 * 1024,
+                 max_workers=4, quota_units_per_second=250, use_raw_format=False):
         """
         Initialize Gmail service with paths to credentials and token files
         
@@ -13,11 +25,22 @@ class GmailService:
             credentials_path: Path to the client_secret.json from Google Cloud Console
             token_path: Path where the authentication token will be stored
             scopes: List of API scopes required for the application
+            cache_dir: Directory for the local raw payload store (disabled if None)
+            cache_max_bytes: Size limit of the payload store before LRU eviction
+            max_workers: Number of threads used to run batch calls in parallel
+            quota_units_per_second: Per-user Gmail quota the request scheduler paces to
+            use_raw_format: Fetch bodies with format='raw' and parse them locally
         """
         self.credentials_path = credentials_path
         self.token_path = token_path
         self.scopes = scopes
+        self.max_workers = max_workers
+        self.use_raw_format = use_raw_format
         self.service = None
+        self.transport_pool = None
+        self.quota = QuotaScheduler(units_per_second=quota_units_per_second)
+        self.payload_store = PayloadStore(cache_dir, cache_max_bytes) if cache_dir else None
+        self.thread_cache = ThreadCache()
     
     def get_authorization_url(self, redirect_uri):
         """Generate the authorization URL for OAuth flow"""
@@ -44,13 +67,25 @@ class GmailService:
         flow.fetch_token(authorization_response=authorization_response)
         
         # Save the credentials for future use
-        with open(self.token_path, 'wb') as token:
-            pickle.dump(flow.credentials, token)
+        self._save_credentials(flow.credentials)
+        
+        # Rebuild the transport pool with the new credentials on next use
+        self.transport_pool = None
+        self.service = None
         
         return flow.credentials
     
     def build_service(self):
-        """Build and return the Gmail API service"""
+        """
+        Build and return the Gmail API service
+        
+        The credentials and discovery client are loaded once and shared by all
+        threads through a GmailTransportPool; later calls reuse them as long as
+        the credentials are still valid or can be refreshed.
+        """
+        if self.transport_pool and self.transport_pool.ensure_valid():
+            return self.service
+        
         creds = None
         
         # Load credentials from the saved file if it exists
@@ -62,47 +97,172 @@ class GmailService:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
             # Save the refreshed credentials
-            with open(self.token_path, 'wb') as token:
-                pickle.dump(creds, token)
+            self._save_credentials(creds)
         
         # If no valid credentials, return None - user needs to authenticate
         if not creds or not creds.valid:
+            self.transport_pool = None
+            self.service = None
             return None
         
         # Build and return the service
-        self.service = build('gmail', 'v1', credentials=creds)
+        self.transport_pool = GmailTransportPool(creds, on_refresh=self._save_credentials)
+        self.service = self.transport_pool.service
         return self.service
     
+    def _save_credentials(self, creds):
+        """Private method to persist credentials to the token file"""
+        with open(self.token_path, 'wb') as token:
+            pickle.dump(creds, token)
+    
+    def _execute(self, request):
+        """
+        Private method to execute an API request within the Gmail quota
+        
+        The request is charged its quota cost and retried with backoff when
+        Gmail rate-limits it. It runs on the calling thread's connection, as
+        httplib2 connections are not thread-safe.
+        """
+        if self.transport_pool:
+            send = lambda: self.transport_pool.execute(request)
+        else:
+            send = request.execute
+        
+        return self.quota.execute(send, self.quota.cost_of(request))
+    
+    def quota_headroom(self):
+        """Return the quota units currently available to new requests"""
+        return self.quota.headroom()
+    
     def list_messages(self, max_results=10, query=None):
         """List messages from the Gmail inbox"""
+        return list(self.iter_messages(query=query, page_size=max_results, limit=max_results))
+    
+    def iter_messages(self, query=None, page_size=100, limit=None):
+        """
+        Iterate over message IDs matching a query, one page at a time
+        
+        Follows nextPageToken so callers can walk an entire mailbox while only
+        holding a single page of IDs in memory.
+        
+        Args:
+            query: Gmail search query (e.g. "newer_than:1y")
+            page_size: Number of messages requested per page (max 500)
+            limit: Stop after this many messages, or None for no limit
+        
+        Yields:
+            dict: Message stubs with 'id' and 'threadId'
+        """
         if not self.service:
             self.build_service()
             
         if not self.service:
             raise Exception("Authentication required before listing messages")
+        
+        page_size = max(1, min(page_size, 500))
+        yielded = 0
+        page_token = None
+        
+        while limit is None or yielded < limit:
+            max_results = page_size if limit is None else min(page_size, limit - yielded)
+            results = self._execute(self.service.users().messages().list(
+                userId='me',
+                maxResults=max_results,
+                q=query,
+                pageToken=page_token,
+                fields='messages(id,threadId),nextPageToken'
+            ))
             
-        results = self.service.users().messages().list(
-            userId='me', 
-            maxResults=max_results,
-            q=query
-        ).execute()
+            for message in results.get('messages', []):
+                yield message
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+            
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def get_message(self, message_id, refresh_labels=True):
+        """
+        Get a specific message by ID, reading through the local payload store
         
-        messages = results.get('messages', [])
-        return messages
+        A message's content never changes once received, but its labels
+        (read, archived, ...) do. A stored payload is therefore revalidated
+        with a minimal fetch of its labelIds and historyId instead of being
+        downloaded again.
+        
+        Args:
+            message_id: The ID of the message to retrieve
+            refresh_labels: Revalidate the labels of a stored payload; callers
+                            that only need the content can skip the request
+        
+        Returns:
+            dict: Gmail API message object
+        """
+        return self._get_stored_message('message', 'full', message_id, refresh_labels)
     
-    def get_message(self, message_id):
-        """Get a specific message by ID"""
+    def get_raw_message(self, message_id, refresh_labels=True):
+        """Get a specific message in format='raw', reading through the local payload store like get_message"""
+        return self._get_stored_message('raw_message', 'raw', message_id, refresh_labels)
+    
+    def _get_stored_message(self, kind, message_format, message_id, refresh_labels):
+        """Private method to get a message in the given format through the payload store"""
+        message = self.payload_store.get(kind, message_id) if self.payload_store else None
+        if message and not refresh_labels:
+            return message
+        
         if not self.service:
             self.build_service()
             
         if not self.service:
             raise Exception("Authentication required before getting message")
-            
+        
+        if message:
+            current = self._execute(self._minimal_message_request(message_id))
+            return self._refresh_stored_message(kind, message_id, message, current)
+        
+        message = self._execute(self.service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format=message_format
+        ))
+        
+        if self.payload_store:
+            self.payload_store.put(kind, message_id, message)
+        
+        return message
+    
+    def _minimal_message_request(self, message_id):
+        """Private method to build a request for only the labels and historyId of a message"""
         return self.service.users().messages().get(
             userId='me',
             id=message_id,
-            format='full'
-        ).execute()
+            format='minimal',
+            fields='id,historyId,labelIds'
+        )
+    
+    def _refresh_stored_message(self, kind, message_id, stored, current):
+        """
+        Private method to bring a stored payload up to date with the message's current labels
+        
+        Args:
+            kind: Payload type of the stored message
+            message_id: The ID of the message
+            stored: Payload from the store
+            current: Minimal message with the current 'labelIds' and 'historyId'
+        
+        Returns:
+            dict: The stored payload with current labels, rewritten to the store if they changed
+        """
+        labels = current.get('labelIds', [])
+        history_id = current.get('historyId', stored.get('historyId'))
+        if labels == stored.get('labelIds', []) and history_id == stored.get('historyId'):
+            return stored
+        
+        message = dict(stored, labelIds=labels, historyId=history_id)
+        self.payload_store.put(kind, message_id, message)
+        return message
     
     def get_message_with_body(self, message_id):
         """
@@ -114,26 +274,305 @@ class GmailService:
         Returns:
             dict: Message details including headers and body content
         """
+        if self.use_raw_format:
+            return parse_raw_message(self.get_raw_message(message_id))
+        return self._parse_message(self.get_message(message_id))
+    
+    def get_messages_with_body(self, message_ids, batch_size=50):
+        """
+        Get several messages with their body content using Gmail batch requests
+        
+        Each batch packs up to batch_size messages().get calls into a single
+        HTTP round trip. Gmail rejects batches larger than 100 requests and
+        recommends 50, so larger ID lists are split into chunks.
+        
+        Args:
+            message_ids: IDs of the messages to retrieve
+            batch_size: Maximum number of requests per batch call
+        
+        Returns:
+            dict: 'messages' holds parsed messages (same shape as
+                  get_message_with_body) in input order, 'errors' maps the
+                  IDs that could not be fetched to an error message
+        """
         if not self.service:
             self.build_service()
-            
+        
         if not self.service:
-            raise Exception("Authentication required before getting message")
+            raise Exception("Authentication required before getting messages")
+        
+        # Drop duplicates; batch request IDs must be unique
+        unique_ids = list(dict.fromkeys(message_ids))
+        
+        if self.use_raw_format:
+            kind, message_format, parse = 'raw_message', 'raw', parse_raw_message
+        else:
+            kind, message_format, parse = 'message', 'full', self._parse_message
+        
+        # Serve stored payloads locally and only download the rest; stored
+        # messages are revalidated with minimal fetches of their labels
+        stored = {}
+        if self.payload_store:
+            for message_id in unique_ids:
+                message = self.payload_store.get(kind, message_id)
+                if message:
+                    stored[message_id] = message
+        
+        fetched, errors = self._execute_batch(
+            [
+                (message_id, self.service.users().messages().get(userId='me', id=message_id, format=message_format))
+                for message_id in unique_ids
+                if message_id not in stored
+            ] + [
+                (message_id, self._minimal_message_request(message_id))
+                for message_id in stored
+            ],
+            batch_size=batch_size
+        )
+        
+        responses = {}
+        for message_id, message in fetched.items():
+            if message_id in stored:
+                responses[message_id] = self._refresh_stored_message(kind, message_id, stored[message_id], message)
+            else:
+                if self.payload_store:
+                    self.payload_store.put(kind, message_id, message)
+                responses[message_id] = message
+        
+        messages = []
+        for message_id in unique_ids:
+            if message_id not in responses:
+                continue
+            try:
+                messages.append(parse(responses[message_id]))
+            except Exception as e:
+                errors[message_id] = f"Error parsing message: {e}"
+        
+        return {
+            'messages': messages,
+            'errors': errors
+        }
+    
+    def list_message_headers(self, message_ids, headers=('Subject', 'From', 'Date'), batch_size=50):
+        """
+        Get the headers of several messages without downloading their bodies
+        
+        Uses format='metadata' with a fields mask so each batched response only
+        carries the requested headers, the snippet and the labels.
+        
+        Args:
+            message_ids: IDs of the messages to describe
+            headers: Names of the headers to return
+            batch_size: Maximum number of requests per batch call
+        
+        Returns:
+            list: One dict per message in input order with 'id', 'thread_id',
+                  'snippet', 'labels' and a lowercase key per requested header
+        """
+        if not self.service:
+            self.build_service()
+        
+        if not self.service:
+            raise Exception("Authentication required before getting messages")
+        
+        unique_ids = list(dict.fromkeys(message_ids))
+        
+        responses, errors = self._execute_batch(
+            [
+                (message_id, self.service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='metadata',
+                    metadataHeaders=list(headers),
+                    fields='id,threadId,snippet,labelIds,payload/headers'
+                ))
+                for message_id in unique_ids
+            ],
+            batch_size=batch_size
+        )
+        
+        for message_id, error in errors.items():
+            print(f"Error getting headers for message {message_id}: {error}")
+        
+        summaries = []
+        for message_id in unique_ids:
+            message = responses.get(message_id)
+            if not message:
+                continue
+            
+            header_values = {
+                h['name'].lower(): h['value']
+                for h in message.get('payload', {}).get('headers', [])
+            }
+            summary = {
+                'id': message['id'],
+                'thread_id': message.get('threadId', ''),
+                'snippet': message.get('snippet', ''),
+                'labels': message.get('labelIds', [])
+            }
+            for name in headers:
+                summary[name.lower()] = header_values.get(name.lower(), '')
             
-        # Get the full message
-        message = self.service.users().messages().get(
+            summaries.append(summary)
+        
+        return summaries
+    
+    def list_thread_summaries(self, max_results=10, query=None, batch_size=50):
+        """
+        List threads with their subject and message count in two round trips
+        
+        Args:
+            max_results: Maximum number of threads to list
+            query: Optional Gmail search query
+            batch_size: Maximum number of requests per batch call
+        
+        Returns:
+            list: One dict per thread with 'id', 'subject', 'message_count'
+                  and the 'snippet' of its first message
+        """
+        if not self.service:
+            self.build_service()
+        
+        if not self.service:
+            raise Exception("Authentication required before listing threads")
+        
+        results = self._execute(self.service.users().threads().list(
             userId='me',
-            id=message_id,
-            format='full'
-        ).execute()
+            maxResults=max_results,
+            q=query,
+            fields='threads(id)'
+        ))
+        thread_ids = [thread['id'] for thread in results.get('threads', [])]
+        
+        responses, errors = self._execute_batch(
+            [
+                (thread_id, self.service.users().threads().get(
+                    userId='me',
+                    id=thread_id,
+                    format='metadata',
+                    metadataHeaders=['Subject'],
+                    fields='id,messages(id,snippet,payload/headers)'
+                ))
+                for thread_id in thread_ids
+            ],
+            batch_size=batch_size
+        )
+        
+        for thread_id, error in errors.items():
+            print(f"Error getting thread {thread_id}: {error}")
+        
+        summaries = []
+        for thread_id in thread_ids:
+            messages = responses.get(thread_id, {}).get('messages', [])
+            if not messages:
+                continue
+            
+            # Use the first message of the thread for the summary
+            first_message = messages[0]
+            headers = first_message.get('payload', {}).get('headers', [])
+            
+            summaries.append({
+                'id': thread_id,
+                'subject': next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No subject)'),
+                'message_count': len(messages),
+                'snippet': first_message.get('snippet', '')
+            })
+        
+        return summaries
+    
+    def _execute_batch(self, requests, batch_size=50):
+        """
+        Private method to run API requests through Gmail batch HTTP calls
+        
+        Chunks are sent in parallel from up to max_workers threads, each on its
+        own connection.
+        
+        Args:
+            requests: List of (request_id, HttpRequest) tuples; IDs must be unique
+            batch_size: Maximum number of requests per batch call (Gmail allows 100)
+        
+        Returns:
+            tuple: (responses, errors) dicts keyed by request ID
+        """
+        batch_size = max(1, min(batch_size, 100))
+        
+        responses = {}
+        errors = {}
+        
+        def run_chunk(chunk):
+            pending = chunk
+            attempt = 0
+            
+            while pending:
+                item_errors = {}
+                
+                def handle_response(request_id, response, exception):
+                    if exception is not None:
+                        item_errors[request_id] = exception
+                    else:
+                        responses[request_id] = response
+                
+                batch = self.service.new_batch_http_request(callback=handle_response)
+                for request_id, request in pending:
+                    batch.add(request, request_id=request_id)
+                
+                try:
+                    self._execute(batch)
+                except Exception as e:
+                    # The whole batch call failed, report every request in it
+                    for request_id, _ in pending:
+                        errors[request_id] = str(e)
+                    return
+                
+                # Items can be rate-limited individually inside a successful batch
+                retry = [
+                    (request_id, request) for request_id, request in pending
+                    if request_id in item_errors and self.quota.is_retryable(item_errors[request_id])
+                ]
+                if attempt >= self.quota.max_retries:
+                    retry = []
+                
+                retry_ids = {request_id for request_id, _ in retry}
+                for request_id, exception in item_errors.items():
+                    if request_id not in retry_ids:
+                        errors[request_id] = str(exception)
+                
+                if retry:
+                    delay = self.quota.backoff_delay(attempt, item_errors[retry[0][0]])
+                    if any(self.quota.is_rate_limit_error(item_errors[request_id]) for request_id in retry_ids):
+                        self.quota.penalize(delay)
+                    else:
+                        time.sleep(delay)
+                    attempt += 1
+                
+                pending = retry
+        
+        chunks = [requests[start:start + batch_size] for start in range(0, len(requests), batch_size)]
+        
+        if len(chunks) > 1 and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                list(executor.map(run_chunk, chunks))
+        else:
+            for chunk in chunks:
+                run_chunk(chunk)
         
-        # Extract headers
+        return responses, errors
+    
+    def _parse_message(self, message):
+        """
+        Private method to turn a full-format Gmail API message into email data
+        
+        Args:
+            message: Gmail API message object fetched with format='full'
+        
+        Returns:
+            dict: Message details including headers and body content
+        """
+        # Index headers by lowercase name in one pass, keeping the first occurrence
         headers = message.get('payload', {}).get('headers', [])
         header_data = {}
-        
-        # Get all headers
         for header in headers:
-            header_data[header['name']] = header['value']
+            header_data.setdefault(header['name'].lower(), header['value'])
         
         # Get the email body
         body_content = self._extract_email_body(message)
@@ -142,11 +581,12 @@ class GmailService:
         email_data = {
             'id': message['id'],
             'thread_id': message.get('threadId', ''),
-            'subject': next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(No subject)'),
-            'from': next((h['value'] for h in headers if h['name'].lower() == 'from'), '(Unknown sender)'),
-            'to': next((h['value'] for h in headers if h['name'].lower() == 'to'), ''),
-            'date': next((h['value'] for h in headers if h['name'].lower() == 'date'), ''),
+            'subject': header_data.get('subject', '(No subject)'),
+            'from': header_data.get('from', '(Unknown sender)'),
+            'to': header_data.get('to', ''),
+            'date': header_data.get('date', ''),
             'body': body_content,
+            'attachments': self._extract_attachments(message),
             'snippet': message.get('snippet', ''),
             'labels': message.get('labelIds', [])
         }
@@ -213,23 +653,105 @@ class GmailService:
         
         return body
     
-    def get_thread(self, thread_id):
-        """Get a thread by ID"""
+    def _extract_attachments(self, message):
+        """
+        Private method to collect attachment metadata from a Gmail API message
+        
+        Only metadata is read here; bodies are downloaded on demand with
+        get_attachment().
+        
+        Args:
+            message: Gmail API message object
+        
+        Returns:
+            list: One dict per attachment with its part ID, attachment ID,
+                  filename, MIME type and size in bytes
+        """
+        attachments = []
+        
+        def collect_parts(payload):
+            body = payload.get('body', {})
+            if payload.get('filename') and body.get('attachmentId'):
+                attachments.append({
+                    'part_id': payload.get('partId', ''),
+                    'attachment_id': body['attachmentId'],
+                    'filename': payload['filename'],
+                    'mime_type': payload.get('mimeType', 'application/octet-stream'),
+                    'size': body.get('size', 0)
+                })
+            
+            for part in payload.get('parts', []):
+                collect_parts(part)
+        
+        collect_parts(message.get('payload', {}))
+        
+        return attachments
+    
+    def get_attachment(self, message_id, attachment_id):
+        """
+        Get the body of a message attachment
+        
+        Args:
+            message_id: The ID of the message containing the attachment
+            attachment_id: The attachment ID from the message payload
+        
+        Returns:
+            dict: Gmail API attachment object with base64url 'data' and 'size'
+        """
+        if not self.service:
+            self.build_service()
+        
+        if not self.service:
+            raise Exception("Authentication required before getting attachment")
+        
+        return self._execute(self.service.users().messages().attachments().get(
+            userId='me',
+            messageId=message_id,
+            id=attachment_id
+        ))
+    
+    def get_thread(self, thread_id, history_id=None):
+        """
+        Get a thread by ID, reading through the local payload store
+        
+        Threads change as messages arrive, so a stored copy is only used when
+        the caller knows the thread's current historyId.
+        
+        Args:
+            thread_id: The ID of the thread to retrieve
+            history_id: Current historyId of the thread, if known
+        
+        Returns:
+            dict: Gmail API thread object
+        """
+        if self.payload_store and history_id is not None:
+            thread = self.payload_store.get('thread', thread_id, history_id=history_id)
+            if thread:
+                return thread
+        
         if not self.service:
             self.build_service()
             
         if not self.service:
             raise Exception("Authentication required before getting thread")
             
-        return self.service.users().threads().get(
+        thread = self._execute(self.service.users().threads().get(
             userId='me',
             id=thread_id
-        ).execute()
+        ))
+        
+        if self.payload_store:
+            self.payload_store.put('thread', thread_id, thread)
+        
+        return thread
     
     def get_thread_with_messages(self, thread_id):
         """
         Get a thread and all its messages with body content
         
+        Parsed threads are cached in memory. Each call only fetches the
+        thread's historyId and re-downloads the thread when it has changed.
+        
         Args:
             thread_id: The ID of the thread to retrieve
             
@@ -238,15 +760,26 @@ class GmailService:
         """
         if not self.service:
             self.build_service()
-            
+        
         if not self.service:
             raise Exception("Authentication required before getting thread")
         
-        # Get the thread with all messages
-        thread = self.service.users().threads().get(
+        # Revalidate with a minimal fetch that only returns the thread's historyId
+        current = self._execute(self.service.users().threads().get(
             userId='me',
-            id=thread_id
-        ).execute()
+            id=thread_id,
+            format='minimal',
+            fields='id,historyId'
+        ))
+        history_id = current.get('historyId')
+        
+        if history_id:
+            thread_data = self.thread_cache.get(thread_id, history_id)
+            if thread_data:
+                return thread_data
+        
+        # Get the thread with all messages
+        thread = self.get_thread(thread_id, history_id=history_id)
         
         # Process each message in the thread
         processed_messages = []
@@ -281,24 +814,82 @@ class GmailService:
         if processed_messages:
             thread_data['subject'] = processed_messages[0]['subject']
         
+        self.thread_cache.put(thread_id, thread.get('historyId', history_id), thread_data)
+        
         return thread_data
     
-    def search_messages(self, query, max_results=10):
-        """Search for messages using Gmail query syntax"""
+    def get_profile(self):
+        """Get the mailbox profile, including the current historyId"""
         if not self.service:
             self.build_service()
-            
+        
         if not self.service:
-            raise Exception("Authentication required before searching messages")
-            
-        results = self.service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=max_results
-        ).execute()
+            raise Exception("Authentication required before getting profile")
         
-        messages = results.get('messages', [])
-        return messages
+        return self._execute(self.service.users().getProfile(userId='me'))
+    
+    def list_history(self, start_history_id, label_id='INBOX'):
+        """
+        List messages added to the mailbox since a history checkpoint
+        
+        Args:
+            start_history_id: historyId of the last successful sync
+            label_id: Only return changes for messages with this label
+        
+        Returns:
+            dict: 'message_ids' holds the added message IDs in the order they
+                  arrived, 'history_id' is the checkpoint to resume from next
+        
+        Raises:
+            HistoryExpiredError: If Gmail no longer keeps history for
+                                 start_history_id and a full sync is needed
+        """
+        if not self.service:
+            self.build_service()
+        
+        if not self.service:
+            raise Exception("Authentication required before listing history")
+        
+        message_ids = []
+        seen = set()
+        latest_history_id = start_history_id
+        page_token = None
+        
+        while True:
+            try:
+                results = self._execute(self.service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    labelId=label_id,
+                    pageToken=page_token
+                ))
+            except HttpError as e:
+                # Gmail answers 404 once the start history ID has expired
+                if e.resp.status == 404:
+                    raise HistoryExpiredError(f"History ID {start_history_id} is no longer available")
+                raise
+            
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_id = added.get('message', {}).get('id')
+                    if message_id and message_id not in seen:
+                        seen.add(message_id)
+                        message_ids.append(message_id)
+            
+            latest_history_id = results.get('historyId', latest_history_id)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        return {
+            'message_ids': message_ids,
+            'history_id': latest_history_id
+        }
+    
+    def search_messages(self, query, max_results=10):
+        """Search for messages using Gmail query syntax"""
+        return list(self.iter_messages(query=query, page_size=max_results, limit=max_results))
         
     # Test function for connectivity
     def test_connection(self):
@@ -314,7 +905,7 @@ class GmailService:
             return False
         
         # List 10 messages from inbox
-        results = service.users().messages().list(userId='me', maxResults=10).execute()
+        results = self._execute(service.users().messages().list(userId='me', maxResults=10))
         messages = results.get('messages', [])
         
         if not messages:
@@ -323,7 +914,7 @@ class GmailService:
             print(f"Successfully retrieved {len(messages)} messages:")
             
             for i, msg in enumerate(messages, 1):
-                message = service.users().messages().get(userId='me', id=msg['id']).execute()
+                message = self._execute(service.users().messages().get(userId='me', id=msg['id']))
                 headers = message.get('payload', {}).get('headers', [])
                 
                 subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No subject)')
@@ -0,0 +1,81 @@
+import threading
+from typing import Callable, Optional
+
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+
+class GmailTransportPool:
+    """
+    Thread-safe transport layer for the Gmail API:
+    - Shares one credentials object and one discovery client across threads
+    - Gives each worker thread its own authorized keep-alive HTTP connection
+    - Refreshes expired credentials once, under a lock, for all threads
+    """
+    
+    def __init__(self, credentials, timeout: int = 60, on_refresh: Optional[Callable] = None):
+        """
+        Initialize the transport pool
+        
+        Args:
+            credentials: google.oauth2 credentials shared by all connections
+            timeout: Socket timeout in seconds for each HTTP connection
+            on_refresh: Called with the credentials after they were refreshed
+        """
+        self.credentials = credentials
+        self.timeout = timeout
+        self.on_refresh = on_refresh
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        self._connections = 0
+        
+        # The client is only a request factory; requests are always executed
+        # with the calling thread's own connection
+        self.service = build('gmail', 'v1', http=self._new_http(), cache_discovery=False)
+    
+    def http(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Get the authorized HTTP connection of the current thread"""
+        self.ensure_valid()
+        
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._new_http()
+            self._local.http = http
+        return http
+    
+    def execute(self, request):
+        """Execute an API request or batch on the current thread's connection"""
+        return request.execute(http=self.http())
+    
+    def ensure_valid(self) -> bool:
+        """
+        Refresh the shared credentials if they have expired
+        
+        Returns:
+            True if the credentials are valid
+        """
+        if self.credentials.valid:
+            return True
+        
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited
+            if not self.credentials.valid and self.credentials.refresh_token:
+                self.credentials.refresh(Request())
+                if self.on_refresh:
+                    self.on_refresh(self.credentials)
+        
+        return self.credentials.valid
+    
+    def stats(self):
+        """Return the number of HTTP connections opened by the pool"""
+        return {"connections": self._connections}
+    
+    def _new_http(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Create a new authorized connection; httplib2 keeps it alive between requests"""
+        with self._refresh_lock:
+            self._connections += 1
+        return google_auth_httplib2.AuthorizedHttp(
+            self.credentials,
+            http=httplib2.Http(timeout=self.timeout)
+        )
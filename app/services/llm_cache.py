@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Callable, Optional
+
+class LLMCache:
+    """
+    Persistent cache of LLM completions:
+    - Keyed by a SHA-256 of the model, the whitespace-normalized messages and
+      the remaining request parameters
+    - Stored in a local SQLite file with a TTL and LRU eviction past max_entries
+    - Concurrent requests for one key make a single upstream call: threads of a
+      process wait on an event, other processes wait on a lease row
+    """
+    
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 10000,
+                 lease_seconds: float = 120.0, poll_interval: float = 0.2):
+        """
+        Initialize the cache
+        
+        Args:
+            path: SQLite database file
+            ttl_seconds: Age after which an entry is no longer served
+            max_entries: Maximum number of entries before the least recently used are evicted
+            lease_seconds: How long another process may hold a key before it is taken over
+            poll_interval: Seconds between checks while another process computes a key
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._inflight = {}
+        
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """
+        Build the cache key of a chat completion request
+        
+        Args:
+            request: Chat completion request body
+        
+        Returns:
+            Hex SHA-256 digest
+        """
+        messages = [
+            {"role": message.get("role"), "content": " ".join(str(message.get("content", "")).split())}
+            for message in request.get("messages", [])
+        ]
+        params = {k: v for k, v in request.items() if k not in ("model", "messages")}
+        canonical = json.dumps(
+            {"model": request.get("model"), "messages": messages, "params": params},
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a cached response
+        
+        Args:
+            key: Key from make_key
+        
+        Returns:
+            The cached response body, or None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None:
+                return None
+            
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        
+        return json.loads(row[0])
+    
+    def put(self, key: str, response: Dict[str, Any], model: str = "") -> None:
+        """Store a response and evict least recently used entries past max_entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(response), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[Dict[str, Any]]], model: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Get a cached response, or compute and store it exactly once across workers
+        
+        Args:
+            key: Key from make_key
+            compute: Makes the upstream call; returns the response body to
+                     cache, or None if the response must not be cached
+            model: Model name recorded with the entry
+        
+        Returns:
+            The cached or computed response body (None if compute returned None)
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+        
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+        
+        if not leader:
+            # Another thread of this process is already asking for this key
+            event.wait(self.lease_seconds)
+            cached = self.get(key)
+            if cached is not None:
+                self._count("coalesced")
+                return cached
+            self._count("misses")
+            return compute()
+        
+        try:
+            cached = self._acquire_lease(key)
+            if cached is not None:
+                self._count("coalesced")
+                return cached
+            
+            self._count("misses")
+            try:
+                response = compute()
+                if response is not None:
+                    self.put(key, response, model)
+                return response
+            finally:
+                self._release_lease(key)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+    
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of entries and the hit/miss counters"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0
+            }
+    
+    def _acquire_lease(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Take the cross-process lease of a key
+        
+        Returns:
+            None once this process holds the lease, or the response if another
+            process stored it while we waited
+        """
+        while True:
+            now = time.time()
+            with self._lock:
+                # Take over leases abandoned by crashed workers
+                self._conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                    (key, self._owner, now + self.lease_seconds)
+                )
+                self._conn.commit()
+            
+            if cursor.rowcount:
+                return None
+            
+            time.sleep(self.poll_interval)
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+    
+    def _release_lease(self, key: str) -> None:
+        """Give up the lease of a key held by this process"""
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner))
+            self._conn.commit()
+    
+    def _evict(self) -> None:
+        """Delete least recently used entries past max_entries (caller holds the lock)"""
+        count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+    
+    def _count(self, counter: str) -> None:
+        """Increment a statistics counter"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> Optional[LLMCache]:
+    """
+    Get the process-wide LLM cache, creating it from environment variables on first use
+    
+    LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS and LLM_CACHE_MAX_ENTRIES configure the
+    cache; LLM_CACHE_DISABLED=1 turns it off.
+    
+    Returns:
+        The shared LLMCache, or None if caching is disabled
+    """
+    global _cache
+    
+    if os.environ.get("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(
+                path=os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3"),
+                ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+                max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+            )
+        return _cache
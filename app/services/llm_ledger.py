@@ -0,0 +1,422 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+# USD per million tokens: (uncached prompt, cached prompt, completion).
+# Models are matched by the longest prefix of the name returned by the API.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+# Modules between an application call site and the HTTP request
+_PLUMBING_MODULES = (
+    "app.services.openai_service", "app.services.async_openai_service", "app.services.llm_ledger",
+    "app.services.llm_cache", "app.services.request_hedger", "tenacity", "concurrent", "threading",
+    "asyncio", "functools", "contextlib",
+)
+
+def describe_call_site() -> Tuple[str, str, int]:
+    """
+    Find out who made the OpenAI call being recorded
+    
+    Walks the stack of the current thread: the innermost public OpenAIService
+    method is the operation, the first frame outside the OpenAI plumbing is the
+    call site, and a tenacity frame on the way gives the attempt number. Calls
+    made from worker threads have no application frame; their call site is the
+    operation.
+    
+    Returns:
+        Tuple of (call site as "module.function", operation, attempt number)
+    """
+    operation = None
+    attempt = 1
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module == "app.services.openai_service":
+            if operation is None and not frame.f_code.co_name.startswith("_"):
+                operation = frame.f_code.co_name
+        elif module.startswith("tenacity"):
+            retry_state = frame.f_locals.get("retry_state")
+            if attempt == 1 and retry_state is not None:
+                attempt = getattr(retry_state, "attempt_number", 1)
+        elif not module.startswith(_PLUMBING_MODULES):
+            return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}", operation or "unknown", attempt
+        frame = frame.f_back
+    
+    return operation or "unknown", operation or "unknown", attempt
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """
+    Estimate the cost of a call in USD
+    
+    Args:
+        model: Model name, e.g. "gpt-4o-mini-2024-07-18"
+        prompt_tokens: Prompt tokens, including cached ones
+        completion_tokens: Completion tokens
+        cached_tokens: Prompt tokens served from OpenAI's prompt cache
+    
+    Returns:
+        The cost, or None if the model has no known price
+    """
+    prefixes = [prefix for prefix in MODEL_PRICES if (model or "").startswith(prefix)]
+    if not prefixes:
+        return None
+    
+    prompt_price, cached_price, completion_price = MODEL_PRICES[max(prefixes, key=len)]
+    return ((prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
+            + completion_tokens * completion_price) / 1_000_000
+
+class LLMLedger:
+    """
+    Append-only record of every LLM call:
+    - record() only queues the entry, so the calling thread never waits on I/O
+    - A background thread writes queued entries in batches to the llm_calls
+      collection, or to a JSON Lines file if MongoDB is not used; entries
+      MongoDB did not take are appended to the file, and MongoDB is tried
+      again after MONGO_RETRY_INTERVAL
+    - Entries that do not fit the queue are counted and dropped
+    """
+    
+    # Seconds batches go to the file after MongoDB failed, before it is tried again
+    MONGO_RETRY_INTERVAL = 60.0
+    
+    def __init__(self, path: Optional[str] = None, use_mongo: bool = True, batch_size: int = 100,
+                 flush_interval: float = 2.0, max_queue: int = 10000):
+        """
+        Initialize the ledger and start its writer thread
+        
+        Args:
+            path: JSON Lines file written when MongoDB is not used (default: .cache/llm_calls.jsonl)
+            use_mongo: Write to the llm_calls collection, falling back to the file while it fails
+            batch_size: Maximum entries per write
+            flush_interval: Seconds a queued entry waits at most before it is written
+            max_queue: Maximum queued entries
+        """
+        self.path = path or os.path.join(".cache", "llm_calls.jsonl")
+        self.use_mongo = use_mongo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._collection = None
+        self._mongo_retry_at = 0.0
+        self._lock = threading.Lock()
+        
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        
+        self._thread = threading.Thread(target=self._run, name="llm-ledger", daemon=True)
+        self._thread.start()
+    
+    def record(self, entry: Dict[str, Any]) -> None:
+        """
+        Queue an entry for writing
+        
+        Args:
+            entry: Description of one call; a "timestamp" is added if missing
+        """
+        entry.setdefault("timestamp", datetime.utcnow())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        
+        with self._lock:
+            self.recorded += 1
+    
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until all queued entries have been written
+        
+        Args:
+            timeout: Maximum seconds to wait
+        
+        Returns:
+            True if the queue was drained in time
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of recorded, written, dropped and queued entries"""
+        with self._lock:
+            return {
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "queued": self._queue.qsize(),
+                "destination": "mongodb" if self.use_mongo else self.path
+            }
+    
+    def _run(self) -> None:
+        """Writer thread: collect entries into batches and write them"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Error writing {len(batch)} LLM ledger entries: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Write a batch to MongoDB, appending what MongoDB did not take to the file"""
+        if self.use_mongo and time.monotonic() >= self._mongo_retry_at:
+            batch = self._write_mongo(batch)
+            if not batch:
+                return
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            for entry in batch:
+                file.write(json.dumps(entry, default=_json_default) + "\n")
+        self._count_written(len(batch))
+    
+    def _write_mongo(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Insert a batch into the llm_calls collection
+        
+        Args:
+            batch: Ledger entries
+        
+        Returns:
+            The entries that were not inserted
+        """
+        from pymongo.errors import BulkWriteError
+        
+        try:
+            # insert_many adds an _id to each document; write copies
+            self._get_collection().insert_many([dict(entry) for entry in batch], ordered=False)
+            self._count_written(len(batch))
+            return []
+        except BulkWriteError as e:
+            # An unordered insert writes every document that has no error of its own
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            self._count_written(len(batch) - len(failed))
+            print(f"LLM ledger could not write {len(failed)} entries to MongoDB, appending them to {self.path}: {e}")
+            return [entry for index, entry in enumerate(batch) if index in failed]
+        except Exception as e:
+            self._mongo_retry_at = time.monotonic() + self.MONGO_RETRY_INTERVAL
+            print(f"LLM ledger cannot write to MongoDB, using {self.path} for "
+                  f"{self.MONGO_RETRY_INTERVAL:.0f}s: {e}")
+            return batch
+    
+    def _get_collection(self):
+        """Get the llm_calls collection, connecting to MongoDB on first use"""
+        if self._collection is None:
+            from app.services.db_utils import db_connection
+            
+            if db_connection.db is None:
+                db_connection.connect()
+            self._collection = db_connection.get_collection("llm_calls")
+        return self._collection
+    
+    def _count_written(self, count: int) -> None:
+        """Add to the written counter"""
+        with self._lock:
+            self.written += count
+
+def _json_default(value: Any) -> Any:
+    """Serialize datetimes in ledger files as ISO 8601 strings"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _day_and_site_rows(groups: Dict[Tuple[str, str, str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge per-model groups into per-day, per-call-site rows with costs and average latency"""
+    rows = {}
+    for (day, call_site, model), group in groups.items():
+        row = rows.setdefault((day, call_site), {
+            "day": day, "call_site": call_site, "models": [], "calls": 0, "errors": 0, "cache_hits": 0,
+            "retries": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "latency_ms_total": 0, "latency_ms_max": 0, "cost_usd": 0.0, "unpriced_calls": 0
+        })
+        row["models"].append(model)
+        for key in ("calls", "errors", "cache_hits", "retries", "prompt_tokens", "completion_tokens",
+                    "cached_tokens", "latency_ms_total"):
+            row[key] += group[key]
+        row["latency_ms_max"] = max(row["latency_ms_max"], group["latency_ms_max"])
+        
+        cost = estimate_cost(model, group["prompt_tokens"], group["completion_tokens"], group["cached_tokens"])
+        if cost is None:
+            row["unpriced_calls"] += group["calls"]
+        else:
+            row["cost_usd"] += cost
+    
+    report = []
+    for row in rows.values():
+        row["latency_ms_avg"] = round(row.pop("latency_ms_total") / row["calls"]) if row["calls"] else 0
+        row["cost_usd"] = round(row["cost_usd"], 6)
+        report.append(row)
+    
+    report.sort(key=lambda row: (row["day"], row["cost_usd"]), reverse=True)
+    return report
+
+def aggregate_collection(collection, since: datetime,
+                         entries: Optional[Iterable[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Aggregate the llm_calls collection by day and call site
+    
+    Args:
+        collection: The llm_calls collection
+        since: Only calls recorded at or after this time (UTC)
+        entries: Ledger entries written to the file while MongoDB failed,
+                 counted together with the collection
+    
+    Returns:
+        One row per day and call site, newest day first and costliest call site
+        first, with call, error, cache hit, retry and token counts, average and
+        maximum latency and estimated cost
+    """
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                "call_site": "$call_site",
+                "model": "$model"
+            },
+            "calls": {"$sum": 1},
+            "errors": {"$sum": {"$cond": [{"$in": ["$outcome", ["error", "http_error"]]}, 1, 0]}},
+            "cache_hits": {"$sum": {"$cond": [{"$eq": ["$outcome", "cache_hit"]}, 1, 0]}},
+            "retries": {"$sum": {"$add": [{"$subtract": ["$attempt", 1]}, "$rate_limit_waits"]}},
+            "prompt_tokens": {"$sum": "$prompt_tokens"},
+            "completion_tokens": {"$sum": "$completion_tokens"},
+            "cached_tokens": {"$sum": "$cached_tokens"},
+            "latency_ms_total": {"$sum": "$latency_ms"},
+            "latency_ms_max": {"$max": "$latency_ms"}
+        }}
+    ]
+    
+    groups = _entry_groups(entries or (), since)
+    for doc in collection.aggregate(pipeline):
+        key = doc.pop("_id")
+        group = groups.setdefault((key["day"], key["call_site"], key.get("model") or ""), _empty_group())
+        for name, value in doc.items():
+            if name == "latency_ms_max":
+                group[name] = max(group[name], value)
+            else:
+                group[name] += value
+    return _day_and_site_rows(groups)
+
+def aggregate_entries(entries: Iterable[Dict[str, Any]], since: datetime) -> List[Dict[str, Any]]:
+    """
+    Aggregate ledger entries, e.g. read from a ledger file, by day and call site
+    
+    Args:
+        entries: Ledger entries; timestamps may be datetimes or ISO 8601 strings
+        since: Only calls recorded at or after this time (UTC)
+    
+    Returns:
+        Same rows as aggregate_collection
+    """
+    return _day_and_site_rows(_entry_groups(entries, since))
+
+def _empty_group() -> Dict[str, Any]:
+    """Counters of one day, call site and model"""
+    return {
+        "calls": 0, "errors": 0, "cache_hits": 0, "retries": 0, "prompt_tokens": 0,
+        "completion_tokens": 0, "cached_tokens": 0, "latency_ms_total": 0, "latency_ms_max": 0
+    }
+
+def _entry_groups(entries: Iterable[Dict[str, Any]], since: datetime) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    """Sum ledger entries per day, call site and model"""
+    groups = {}
+    for entry in entries:
+        timestamp = entry.get("timestamp")
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if timestamp is None or timestamp < since:
+            continue
+        
+        key = (timestamp.strftime("%Y-%m-%d"), entry.get("call_site", "unknown"), entry.get("model") or "")
+        group = groups.setdefault(key, _empty_group())
+        group["calls"] += 1
+        group["errors"] += entry.get("outcome") in ("error", "http_error")
+        group["cache_hits"] += entry.get("outcome") == "cache_hit"
+        group["retries"] += entry.get("attempt", 1) - 1 + entry.get("rate_limit_waits", 0)
+        for key_name in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            group[key_name] += entry.get(key_name) or 0
+        group["latency_ms_total"] += entry.get("latency_ms", 0)
+        group["latency_ms_max"] = max(group["latency_ms_max"], entry.get("latency_ms", 0))
+    
+    return groups
+
+def read_entries(path: str) -> Iterable[Dict[str, Any]]:
+    """
+    Read the entries of a ledger file, skipping lines that are not valid JSON
+    
+    Args:
+        path: JSON Lines ledger file
+    
+    Yields:
+        Ledger entries
+    """
+    if not os.path.exists(path):
+        return
+    
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def report_since(days: int) -> datetime:
+    """Start of the UTC day days - 1 days ago, so a report of 1 day covers today"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=max(1, days) - 1)
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger() -> Optional[LLMLedger]:
+    """
+    Get the process-wide LLM call ledger, or None if it is disabled
+    
+    LLM_LEDGER selects where calls are recorded: "mongo" (default, the
+    llm_calls collection), "file" (the JSON Lines file at LLM_LEDGER_PATH,
+    default .cache/llm_calls.jsonl) or "off".
+    """
+    global _ledger
+    
+    backend = os.environ.get("LLM_LEDGER", "mongo").lower()
+    if backend in ("off", "0", "false", "no"):
+        return None
+    
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = LLMLedger(path=os.environ.get("LLM_LEDGER_PATH"), use_mongo=backend != "file")
+            # Write what is still queued when the process exits
+            atexit.register(_ledger.flush, 5.0)
+        return _ledger
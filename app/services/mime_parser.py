@@ -0,0 +1,160 @@
+import base64
+import binascii
+from email import policy
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from typing import Dict, List, Any, Optional, Tuple
+
+# Parser shared by all calls; compat32 skips the header registry, which costs more
+# than the body walk itself, so the few headers we need are decoded by hand
+_PARSER = BytesParser(policy=policy.compat32)
+
+# Largest HTML body kept per message; marketing blasts can carry megabytes of markup
+MAX_HTML_CHARS = 200000
+
+def decode_raw(raw: str) -> bytes:
+    """
+    Decode the base64url 'raw' field of a Gmail API message
+    
+    Args:
+        raw: base64url encoded RFC 2822 message, possibly without padding
+    
+    Returns:
+        The message bytes
+    """
+    padding = len(raw) % 4
+    if padding:
+        raw += "=" * (4 - padding)
+    return base64.urlsafe_b64decode(raw)
+
+def parse_raw_message(message: Dict[str, Any], max_html_chars: int = MAX_HTML_CHARS) -> Dict[str, Any]:
+    """
+    Parse a Gmail API message fetched with format='raw'
+    
+    Walks the MIME tree once, decoding every text part with its declared
+    charset and collecting attachment metadata along the way.
+    
+    Args:
+        message: Gmail API message object with a 'raw' field
+        max_html_chars: HTML bodies longer than this are truncated
+    
+    Returns:
+        dict: Email data in the same shape as GmailService._parse_message,
+              plus 'parts' describing every leaf part of the message
+    """
+    mime_message = _PARSER.parsebytes(decode_raw(message.get("raw", "")))
+    
+    plain_parts = []
+    html_parts = []
+    attachments = []
+    parts = []
+    
+    for part_id, part in _iter_leaf_parts(mime_message):
+        mime_type = part.get_content_type()
+        filename = part.get_filename()
+        disposition = part.get_content_disposition()
+        
+        if filename or disposition == "attachment":
+            attachments.append({
+                "part_id": part_id,
+                "attachment_id": None,
+                "filename": _decode_header(filename) if filename else f"part-{part_id}",
+                "mime_type": mime_type,
+                "size": _payload_size(part)
+            })
+            parts.append({"part_id": part_id, "mime_type": mime_type, "attachment": True})
+            continue
+        
+        if mime_type == "text/plain":
+            plain_parts.append(_decode_text(part))
+        elif mime_type == "text/html":
+            html_parts.append(_decode_text(part))
+        
+        parts.append({"part_id": part_id, "mime_type": mime_type, "attachment": False})
+    
+    html = "\n".join(html_parts)
+    if len(html) > max_html_chars:
+        html = html[:max_html_chars]
+    
+    return {
+        "id": message.get("id", ""),
+        "thread_id": message.get("threadId", ""),
+        "subject": _decode_header(mime_message.get("Subject", "(No subject)")),
+        "from": _decode_header(mime_message.get("From", "(Unknown sender)")),
+        "to": _decode_header(mime_message.get("To", "")),
+        "date": _decode_header(mime_message.get("Date", "")),
+        "body": {
+            "plain": "\n".join(plain_parts),
+            "html": html
+        },
+        "attachments": attachments,
+        "parts": parts,
+        "snippet": message.get("snippet", ""),
+        "labels": message.get("labelIds", [])
+    }
+
+def extract_part(message: Dict[str, Any], part_id: str) -> Optional[bytes]:
+    """
+    Get the decoded content of one part of a raw Gmail message
+    
+    Args:
+        message: Gmail API message object with a 'raw' field
+        part_id: Part ID as reported by parse_raw_message
+    
+    Returns:
+        The part's bytes, or None if the message has no such part
+    """
+    mime_message = _PARSER.parsebytes(decode_raw(message.get("raw", "")))
+    for current_id, part in _iter_leaf_parts(mime_message):
+        if current_id == part_id:
+            return part.get_payload(decode=True) or b""
+    return None
+
+def _iter_leaf_parts(part, part_id: str = "") -> List[Tuple[str, Any]]:
+    """
+    List the non-multipart parts of a message with Gmail-style part IDs
+    
+    Children of the root are numbered "0", "1", ...; nested children get
+    dotted IDs such as "1.0", matching the partId values of format='full'.
+    """
+    if not part.is_multipart():
+        return [(part_id, part)]
+    
+    leaves = []
+    for index, child in enumerate(part.get_payload()):
+        child_id = f"{part_id}.{index}" if part_id else str(index)
+        leaves.extend(_iter_leaf_parts(child, child_id))
+    return leaves
+
+def _decode_header(value) -> str:
+    """Decode an RFC 2047 encoded header value to text"""
+    try:
+        return str(make_header(decode_header(str(value))))
+    except (LookupError, UnicodeDecodeError, ValueError):
+        return str(value)
+
+def _payload_size(part) -> int:
+    """Decoded size of a part, estimated from its base64 length without decoding it"""
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return 0
+    
+    if (part.get("Content-Transfer-Encoding") or "").strip().lower() == "base64":
+        data = "".join(payload.split())
+        return len(data) * 3 // 4 - data[-2:].count("=")
+    
+    return len(payload.encode("utf-8", errors="replace"))
+
+def _decode_text(part) -> str:
+    """Decode a text part using its declared charset, replacing undecodable bytes"""
+    try:
+        payload = part.get_payload(decode=True) or b""
+    except (binascii.Error, ValueError):
+        return ""
+    
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        # Unknown charset declared by the sender
+        return payload.decode("utf-8", errors="replace")
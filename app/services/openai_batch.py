@@ -0,0 +1,231 @@
+import os
+import json
+import time
+from typing import Dict, Any, Optional, Iterable, Iterator, Tuple
+
+from app.services.openai_transport import OpenAITransport, get_transport
+
+class BatchError(Exception):
+    """Raised when a batch job fails, expires or is cancelled"""
+
+class BatchFailedError(BatchError):
+    """Raised when a batch job reached a final state without any output to collect"""
+
+class OpenAIBatchClient:
+    """
+    Client for the OpenAI Batch API:
+    - Writes chat completion requests to a JSONL input file
+    - Uploads the file and creates a batch job
+    - Polls the job until it reaches a final state
+    - Streams the output file back line by line
+    """
+    
+    # Batch states after which the job does not change anymore
+    FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+    
+    def __init__(self, api_key: Optional[str] = None, transport: Optional[OpenAITransport] = None):
+        """
+        Initialize the batch client
+        
+        Args:
+            api_key: OpenAI API key (default: OPENAI_API_KEY)
+            transport: HTTP transport; its base URL selects the API or a local stand-in
+                       (default: the shared process-wide transport)
+        """
+        self.api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        self.transport = transport or get_transport()
+        
+        if not self.api_key:
+            print("WARNING: OPENAI_API_KEY not found in environment variables")
+    
+    def write_requests(self, requests: Iterable[Tuple[str, Dict[str, Any]]], path: str,
+                       endpoint: str = "/v1/chat/completions") -> int:
+        """
+        Write requests to a Batch API input file
+        
+        Args:
+            requests: Iterable of (custom_id, request body) tuples
+            path: Path of the JSONL file to write
+            endpoint: API endpoint every request is sent to
+        
+        Returns:
+            Number of requests written
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for custom_id, body in requests:
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": endpoint, "body": body}))
+                f.write("\n")
+                count += 1
+        
+        return count
+    
+    def upload_file(self, path: str) -> str:
+        """
+        Upload a batch input file
+        
+        Args:
+            path: Path of the JSONL file
+        
+        Returns:
+            The file ID
+        """
+        with open(path, "rb") as f:
+            response = self.transport.request(
+                "POST", "/files", self.api_key,
+                data={"purpose": "batch"},
+                files={"file": (os.path.basename(path), f, "application/jsonl")}
+            )
+        
+        return self._json(response)["id"]
+    
+    def create_batch(self, input_file_id: str, endpoint: str = "/v1/chat/completions",
+                     completion_window: str = "24h", metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Create a batch job for an uploaded input file
+        
+        Args:
+            input_file_id: ID returned by upload_file
+            endpoint: API endpoint of the requests in the file
+            completion_window: Time frame in which the batch is processed
+            metadata: Optional labels stored with the batch
+        
+        Returns:
+            The batch object
+        """
+        payload = {
+            "input_file_id": input_file_id,
+            "endpoint": endpoint,
+            "completion_window": completion_window
+        }
+        if metadata:
+            payload["metadata"] = metadata
+        
+        return self._json(self.transport.post("/batches", self.api_key, payload))
+    
+    def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Get the current state of a batch job"""
+        return self._json(self.transport.request("GET", f"/batches/{batch_id}", self.api_key))
+    
+    def wait_for_batch(self, batch_id: str, poll_interval: float = 60.0, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Poll a batch job until it reaches a final state
+        
+        An expired batch is returned like a completed one if it has an output
+        file: the requests that finished in time are in it, the others in the
+        error file.
+        
+        Args:
+            batch_id: ID of the batch job
+            poll_interval: Seconds between status checks
+            timeout: Maximum number of seconds to wait, or None to wait indefinitely
+        
+        Returns:
+            The completed batch object, or the expired one with its partial output
+        
+        Raises:
+            BatchFailedError: If the batch failed or was cancelled, or expired without output
+            BatchError: If the batch status could not be read
+            TimeoutError: If the batch did not finish within the timeout
+        """
+        started = time.monotonic()
+        while True:
+            batch = self.get_batch(batch_id)
+            status = batch.get("status")
+            counts = batch.get("request_counts") or {}
+            print(f"Batch {batch_id}: {status} ({counts.get('completed', 0)}/{counts.get('total', 0)} completed)")
+            
+            if status == "completed":
+                return batch
+            if status == "expired" and batch.get("output_file_id"):
+                print(f"Batch {batch_id} expired; collecting the {counts.get('completed', 0)} finished requests")
+                return batch
+            if status in self.FINAL_STATES:
+                raise BatchFailedError(f"Batch {batch_id} ended with status {status}: {batch.get('errors')}")
+            
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"Batch {batch_id} still {status} after {timeout} seconds")
+            
+            time.sleep(poll_interval)
+    
+    def iter_results(self, file_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the lines of a batch output or error file
+        
+        Args:
+            file_id: output_file_id or error_file_id of a batch
+        
+        Yields:
+            One result object per request, with "custom_id", "response" and "error"
+        """
+        response = self.transport.request("GET", f"/files/{file_id}/content", self.api_key, stream=True)
+        try:
+            if response.status_code != 200:
+                raise BatchError(f"Error downloading file {file_id}: HTTP {response.status_code}: {response.text}")
+            
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
+    
+    def run(self, requests: Iterable[Tuple[str, Dict[str, Any]]], input_path: str,
+            poll_interval: float = 60.0, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Write, upload and submit requests, wait for the batch, and stream its results
+        
+        Args:
+            requests: Iterable of (custom_id, request body) tuples
+            input_path: Path of the JSONL input file to write
+            poll_interval: Seconds between status checks
+            timeout: Maximum number of seconds to wait for the batch
+        
+        Yields:
+            Result objects from the output file, then from the error file
+        """
+        if not self.write_requests(requests, input_path):
+            return
+        
+        batch = self.create_batch(self.upload_file(input_path))
+        print(f"Submitted batch {batch['id']} from {input_path}")
+        
+        yield from self.iter_batch_results(batch["id"], poll_interval, timeout)
+    
+    def iter_batch_results(self, batch_id: str, poll_interval: float = 60.0,
+                           timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Wait for an already submitted batch and stream its results
+        
+        Args:
+            batch_id: ID of the batch job
+            poll_interval: Seconds between status checks
+            timeout: Maximum number of seconds to wait for the batch
+        
+        Yields:
+            Result objects from the output file, then from the error file
+        """
+        yield from self.iter_batch_output(self.wait_for_batch(batch_id, poll_interval, timeout))
+    
+    def iter_batch_output(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the results of a finished batch
+        
+        Args:
+            batch: Batch object returned by wait_for_batch
+        
+        Yields:
+            Result objects from the output file, then from the error file
+        """
+        for file_key in ("output_file_id", "error_file_id"):
+            if batch.get(file_key):
+                yield from self.iter_results(batch[file_key])
+    
+    def _json(self, response) -> Dict[str, Any]:
+        """Decode a JSON response, raising BatchError on HTTP errors"""
+        if response.status_code != 200:
+            raise BatchError(f"OpenAI API error: HTTP {response.status_code}: {response.text}")
+        return response.json()
@@ -1,8 +1,30 @@
 import os
 import json
+import time
+import threading
 import requests
-from typing import Dict, List, Any, Optional
-from tenacity import retry, stop_after_attempt, wait_exponential
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
+
+from app.services.openai_transport import OpenAITransport, get_transport
+from app.services.llm_cache import LLMCache, get_cache
+from app.services.prompt_budget import PromptBudget, prompt_budget, estimate_tokens, clean_email_body
+from app.services.rate_limiter import AdaptiveRateLimiter, RateLimitError, get_rate_limiter
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker
+from app.services.request_hedger import RequestHedger, get_hedger
+from app.services.llm_ledger import LLMLedger, get_ledger, describe_call_site
+from app.services.structured_output import (
+    StructuredOutputError, ENTITIES_SCHEMA, CATEGORY_SCHEMA, ENRICHMENT_SCHEMA, FOLLOW_UPS_SCHEMA,
+    PACKED_ENRICHMENT_SCHEMA, PACKED_ENRICHMENT_ITEM_SCHEMA, response_format, parse_structured, validate
+)
+
+# Errors that waiting a few seconds will not fix: tenacity does not retry them
+# and the per-task methods raise them instead of returning defaults
+NOT_RETRIED = (RateLimitError, CircuitOpenError)
+
+# Default of the cache and ledger arguments: use the shared instance. Passing
+# None instead turns caching or recording off.
+_SHARED = object()
 
 class OpenAIService:
     """
@@ -12,47 +34,433 @@ class OpenAIService:
     - Manages prompt templates for different extraction tasks
     """
     
-    def __init__(self):
-        """Initialize the OpenAI service with API key from environment variables"""
+    # Entity lists returned by extract_entities and enrich_email
+    ENTITY_KEYS = ["properties", "people", "companies", "dates",
+                   "financial_details", "action_items", "keywords"]
+    
+    CATEGORY_MAPPING = {
+        "property": "Property",
+        "deal": "Deal",
+        "meeting": "Meeting",
+        "task": "Task",
+        "general": "General"
+    }
+    
+    # Completion tokens assumed when a request does not set max_tokens
+    DEFAULT_COMPLETION_TOKENS = 500
+    
+    # 429 responses a single request waits out before RateLimitError is raised
+    MAX_RATE_LIMIT_WAITS = 8
+    
+    # Packed enrichment: emails up to PACKED_MAX_EMAIL_TOKENS share a request with
+    # up to PACKED_MAX_EMAILS others, within PACKED_MAX_PROMPT_TOKENS of email text
+    PACKED_MAX_EMAIL_TOKENS = 600
+    PACKED_MAX_EMAILS = 8
+    PACKED_MAX_PROMPT_TOKENS = 4000
+    PACKED_COMPLETION_TOKENS_PER_EMAIL = 700
+    
+    # Fields of the combined enrichment, shared by the single and packed prompts
+    ENRICHMENT_FIELDS_PROMPT = """
+        - "properties": Real estate properties mentioned (address, property type, size, other details)
+        - "people": Individuals mentioned (name, role/position, company, contact information)
+        - "companies": Organizations mentioned (name exactly as it appears, type: broker, developer, investor, etc.)
+        - "dates": Important dates (date and what it refers to: meeting, deadline, etc.)
+        - "financial_details": Monetary values or financial terms (amount, currency, what it refers to)
+        - "action_items": Tasks, follow-ups or requests (action, who is responsible, deadline if mentioned)
+        - "keywords": Important CRE-specific terms or concepts
+        - "summary": A concise summary under 100 words covering the purpose, key points,
+          next steps and important property, deal or meeting details
+        - "category": One of "Property", "Deal", "Meeting", "Task", "General", capitalized exactly as written
+        - "priority": A number from 1-5, where 1 is highest priority (consider urgency, deadlines, financial impact)
+        - "explanation": A brief explanation for the priority level
+        
+        The first seven keys are arrays of objects. Give every object a "confidence"
+        score (0.0-1.0), use an empty string for details that are not mentioned and
+        dates in YYYY-MM-DD format where possible. Use an empty array when a category
+        has no entities.
+        """
+    
+    def __init__(self, transport: Optional[OpenAITransport] = None, cache: Optional[LLMCache] = _SHARED,
+                 budget: Optional[PromptBudget] = None, rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, hedger: Optional[RequestHedger] = None,
+                 ledger: Optional[LLMLedger] = _SHARED):
+        """
+        Initialize the OpenAI service with API key from environment variables
+        
+        Args:
+            transport: HTTP transport to use (default: the shared process-wide pool)
+            cache: Completion cache to use, or None for no caching (default: the
+                   shared cache, unless disabled)
+            budget: Prompt preprocessing and token budgets (default: the shared instance)
+            rate_limiter: Limiter pacing requests to the account's rate limits
+                          (default: the limiter shared by all threads and processes)
+            circuit_breaker: Breaker that fails calls fast while the API is down
+                             (default: the shared process-wide breaker)
+            hedger: Hedger re-sending unusually slow requests (default: the shared
+                    hedger if OPENAI_HEDGING is set, otherwise no hedging)
+            ledger: Ledger recording every call, or None to record nothing
+                    (default: the shared ledger, unless LLM_LEDGER is "off")
+        """
         # Get API key from environment variables
         self.api_key = os.environ.get('OPENAI_API_KEY')
+        self.transport = transport or get_transport()
+        self.cache = get_cache() if cache is _SHARED else cache
+        self.budget = budget or prompt_budget
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.hedger = hedger or get_hedger()
+        self.ledger = get_ledger() if ledger is _SHARED else ledger
+        
+        # Rate limit waits of the current thread's last request, for the ledger
+        self._call_local = threading.local()
+        
+        # Packing several short emails per enrichment request; OPENAI_PACK_EMAILS=0 disables it
+        self.packing_enabled = os.environ.get('OPENAI_PACK_EMAILS', '1').lower() not in ('0', 'false', 'no')
+        self._packing_lock = threading.Lock()
+        self._packing_stats = {"packed_requests": 0, "packed_emails": 0, "unaligned_emails": 0,
+                               "failed_packs": 0}
         
         if not self.api_key:
             print("WARNING: OPENAI_API_KEY not found in environment variables")
     
-    def _normalize_keys(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _post_chat_completion(self, data: Dict[str, Any]) -> requests.Response:
         """
-        Normalize dictionary keys to lowercase
+        Send a chat completion request through the pooled transport
+        
+        Identical requests are answered from the completion cache; only
+        complete, valid responses are stored (see _is_cacheable). Non-streaming
+        calls are recorded in the ledger (streamed ones by stream_completion
+        once they end, hedged ones and their copies by _send_chat_completion).
         
         Args:
-            data: Dictionary with keys to normalize
-            
+            data: Chat completion request body
+        
         Returns:
-            Dictionary with normalized keys
+            The HTTP response
         """
-        if not isinstance(data, dict):
-            return data
+        if self.ledger is None:
+            return self._cached_chat_completion(data)
+        
+        started = time.monotonic()
+        self._call_local.rate_limit_waits = 0
+        self._call_local.recorded = False
+        try:
+            response = self._cached_chat_completion(data)
+        except Exception as e:
+            if not self._call_local.recorded:
+                self._record_call(data, started, error=e)
+            raise
+        
+        if not data.get("stream") and not self._call_local.recorded:
+            self._record_call(data, started, response=response)
+        return response
+    
+    def _cached_chat_completion(self, data: Dict[str, Any]) -> requests.Response:
+        """Answer a chat completion request from the completion cache, or send it"""
+        if self.cache is None or data.get("stream"):
+            return self._send_chat_completion(data)
+        
+        upstream = {}
+        
+        def send():
+            response = self._send_chat_completion(data)
+            upstream["response"] = response
+            if response.status_code != 200:
+                return None
+            body = response.json()
+            return body if self._is_cacheable(data, body) else None
+        
+        body = self.cache.get_or_compute(self.cache.make_key(data), send, data.get("model", ""))
+        if "response" in upstream:
+            return upstream["response"]
+        
+        # Rebuild a response from the cached body so callers handle both alike
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response.headers["X-Cache"] = "hit"
+        response._content = json.dumps(body).encode("utf-8")
+        return response
+    
+    def _is_cacheable(self, data: Dict[str, Any], body: Dict[str, Any]) -> bool:
+        """
+        Check whether a successful response may be served again for the same request
+        
+        Truncated responses, refusals and content that does not match the
+        request's JSON schema are not stored, so that a later identical
+        request asks the model again instead of getting the same bad answer.
+        
+        Args:
+            data: Chat completion request body
+            body: Response body
+        
+        Returns:
+            True if every choice finished normally with acceptable content
+        """
+        choices = body.get("choices") or []
+        response_format = data.get("response_format") or {}
+        for choice in choices:
+            message = choice.get("message") or {}
+            if choice.get("finish_reason") != "stop" or message.get("refusal"):
+                return False
             
-        result = {}
-        for key, value in data.items():
-            # Convert key to lowercase
-            normalized_key = key.lower()
+            if response_format.get("type") in ("json_schema", "json_object"):
+                try:
+                    value = json.loads(message.get("content") or "")
+                except ValueError:
+                    return False
+                schema = (response_format.get("json_schema") or {}).get("schema")
+                if schema and validate(value, schema):
+                    return False
+        return bool(choices)
+    
+    def _send_chat_completion(self, data: Dict[str, Any]) -> requests.Response:
+        """
+        Send a chat completion request once the circuit breaker and rate limiter allow it
+        
+        The limiter learns the remaining budget from the response headers.
+        A 429 response pauses all callers until the limit resets, after which
+        the request is sent again instead of failing. Connection errors,
+        timeouts and 5xx responses count as failures for the circuit breaker.
+        With a hedger, a non-streaming request slower than usual is sent a
+        second time and the first response that is not a 5xx wins.
+        
+        Args:
+            data: Chat completion request body
+        
+        Returns:
+            The HTTP response
+        
+        Raises:
+            CircuitOpenError: If the circuit is open because the API keeps failing
+            RateLimitError: If the request is still rate limited after MAX_RATE_LIMIT_WAITS waits
+        """
+        prompt = "".join(str(message.get("content", "")) for message in data.get("messages", []))
+        tokens = estimate_tokens(prompt) + data.get("max_tokens", self.DEFAULT_COMPLETION_TOKENS)
+        stream = bool(data.get("stream"))
+        
+        def send():
+            return self.transport.post("/chat/completions", self.api_key, data, stream=stream)
+        
+        # Hedges run on worker threads, whose stack does not show the call site
+        call_site = describe_call_site() if self.hedger and self.ledger is not None and not stream else None
+        
+        # Latencies of different models and operations are not comparable
+        response_format = data.get("response_format") or {}
+        operation = (response_format.get("json_schema") or {}).get("name") or response_format.get("type", "text")
+        hedge_key = f"{data.get('model')}/{operation}/{data.get('max_tokens', self.DEFAULT_COMPLETION_TOKENS)}"
+        
+        def recorded_send(hedge: bool, started: Optional[float] = None, rate_limit_waits: int = 0):
+            # Both copies of a hedged request are real requests that are billed,
+            # so each records its own response, whichever of them wins
+            started = started or time.monotonic()
+            try:
+                response = send()
+            except Exception as e:
+                self._record_call(data, started, error=e, call_site=call_site, hedge=hedge,
+                                  rate_limit_waits=rate_limit_waits)
+                raise
+            self._record_call(data, started, response=response, call_site=call_site, hedge=hedge,
+                              rate_limit_waits=rate_limit_waits)
+            return response
+        
+        for attempt in range(self.MAX_RATE_LIMIT_WAITS + 1):
+            self.circuit_breaker.before_call()
+            try:
+                started = time.monotonic()
+                self.rate_limiter.acquire(tokens)
+                if self.hedger and not stream:
+                    primary, hedge = send, send
+                    if self.ledger is not None:
+                        waits = getattr(self._call_local, "rate_limit_waits", 0)
+                        primary = lambda: recorded_send(False, started, waits)
+                        hedge = lambda: recorded_send(True)
+                        # _post_chat_completion must not record the winner a second time
+                        self._call_local.recorded = True
+                    response = self.hedger.call(primary, hedge, close=lambda r: r.close(),
+                                                failed=lambda r: r.status_code >= 500, key=hedge_key,
+                                                prepare_hedge=lambda: self.rate_limiter.acquire(tokens))
+                else:
+                    response = send()
+            except requests.RequestException:
+                self.circuit_breaker.record_failure()
+                raise
+            except BaseException:
+                # Not the API's fault: free a half-open probe for the next caller
+                self.circuit_breaker.release_probe()
+                raise
             
-            # Recursively normalize nested dictionaries
-            if isinstance(value, dict):
-                result[normalized_key] = self._normalize_keys(value)
-            # Normalize dictionaries in lists
-            elif isinstance(value, list):
-                result[normalized_key] = [
-                    self._normalize_keys(item) if isinstance(item, dict) else item
-                    for item in value
-                ]
+            if response.status_code >= 500:
+                self.circuit_breaker.record_failure()
             else:
-                result[normalized_key] = value
-                
-        return result
+                self.circuit_breaker.record_success()
+            
+            if response.status_code != 429:
+                self.rate_limiter.update(response.headers)
+                return response
+            
+            wait = self.rate_limiter.on_rate_limited(response.headers)
+            self._call_local.rate_limit_waits = attempt + 1
+            print(f"OpenAI rate limit reached, waiting {wait:.1f}s (attempt {attempt + 1})")
+            response.close()
+        
+        raise RateLimitError(f"OpenAI API still rate limited after {self.MAX_RATE_LIMIT_WAITS} waits")
+    
+    def _record_call(self, data: Dict[str, Any], started: float, response: Optional[requests.Response] = None,
+                     usage: Optional[Dict[str, Any]] = None, error: Optional[Exception] = None,
+                     call_site: Optional[Tuple[str, str, int]] = None, hedge: bool = False,
+                     rate_limit_waits: Optional[int] = None) -> None:
+        """
+        Queue a ledger entry for a chat completion call
+        
+        Args:
+            data: Chat completion request body
+            started: time.monotonic() when the call started
+            response: The HTTP response, if one was received
+            usage: Token usage, if not in the response body (streamed calls)
+            error: The exception that ended the call, if any
+            call_site: Result of describe_call_site, if not taken from the current stack
+            hedge: Whether the call is the hedged copy of another request
+            rate_limit_waits: 429 waits before the call (default: those of the
+                              current thread's call, none for a hedged copy)
+        """
+        call_site, operation, attempt = call_site or describe_call_site()
+        cache_hit = response is not None and response.headers.get("X-Cache") == "hit"
+        
+        if response is not None and response.status_code == 200 and usage is None and not data.get("stream"):
+            try:
+                usage = response.json().get("usage")
+            except ValueError:
+                usage = None
+        
+        if error is not None:
+            outcome = "error"
+        elif cache_hit:
+            outcome = "cache_hit"
+        elif response is not None and response.status_code != 200:
+            outcome = "http_error"
+        else:
+            outcome = "ok"
+        
+        # Cached completions are not billed again
+        usage = {} if cache_hit else (usage or {})
+        prompt = "".join(str(message.get("content", "")) for message in data.get("messages", []))
+        
+        self.ledger.record({
+            "call_site": call_site,
+            "operation": operation,
+            "model": data.get("model", ""),
+            "stream": bool(data.get("stream")),
+            "hedge": hedge,
+            "outcome": outcome,
+            "status_code": response.status_code if response is not None else None,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            "estimated_prompt_tokens": estimate_tokens(prompt),
+            "latency_ms": round((time.monotonic() - started) * 1000),
+            "attempt": attempt,
+            "rate_limit_waits": rate_limit_waits if rate_limit_waits is not None
+                                else 0 if hedge else getattr(self._call_local, "rate_limit_waits", 0)
+        })
+    
+    def ledger_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the ledger's counters, or None if calls are not recorded"""
+        return self.ledger.stats() if self.ledger else None
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Return request counters and connection pool statistics of the transport"""
+        return self.transport.stats()
+    
+    def prompt_stats(self) -> Dict[str, Dict[str, int]]:
+        """Return the tokens saved by prompt preprocessing, per task"""
+        return self.budget.stats()
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return completion cache statistics, or an empty dict if caching is disabled"""
+        return self.cache.stats() if self.cache else {}
+    
+    def rate_limit_headroom(self) -> Dict[str, Any]:
+        """Return the remaining request and token budget reported by the API"""
+        return self.rate_limiter.headroom()
+    
+    def circuit_stats(self) -> Dict[str, Any]:
+        """Return the state and counters of the circuit breaker"""
+        return self.circuit_breaker.stats()
+    
+    def packing_stats(self) -> Dict[str, int]:
+        """Return the counters of packed enrichment requests"""
+        with self._packing_lock:
+            return dict(self._packing_stats)
+    
+    def hedge_stats(self) -> Dict[str, Any]:
+        """Return hedged request counters, or an empty dict if hedging is disabled"""
+        return self.hedger.stats() if self.hedger else {}
+    
+    def _parse_structured_response(self, response_data: Dict[str, Any], schema: Dict[str, Any]) -> Any:
+        """
+        Parse the content of a schema-constrained chat completion
+        
+        Truncated or wrapped JSON is repaired locally and schema errors are only
+        logged, so a malformed response never costs another request; callers
+        fill in defaults for anything missing.
+        
+        Args:
+            response_data: Chat completion response body
+            schema: JSON schema of the request's response_format
+        
+        Returns:
+            The parsed JSON value
+        
+        Raises:
+            StructuredOutputError: If the model refused or returned no recoverable JSON
+        """
+        choice = response_data['choices'][0]
+        message = choice['message']
+        if message.get("refusal"):
+            raise StructuredOutputError(f"Model refused the request: {message['refusal']}")
+        
+        data, errors = parse_structured(message.get("content"), schema)
+        if errors:
+            print(f"Structured response does not match its schema "
+                  f"(finish_reason={choice.get('finish_reason')}): {'; '.join(errors[:3])}")
+        return data
+    
+    def _conform_entities(self, data: Any) -> Dict[str, List[Dict[str, Any]]]:
+        """Keep the entity lists of a parsed response, with an empty list for each missing one"""
+        data = data if isinstance(data, dict) else {}
+        return {
+            key: [item for item in data.get(key) or [] if isinstance(item, dict)]
+            for key in self.ENTITY_KEYS
+        }
+    
+    def _conform_category(self, data: Any) -> Dict[str, Any]:
+        """Keep the category fields of a parsed response, defaulting invalid ones"""
+        data = data if isinstance(data, dict) else {}
+        
+        category = self.CATEGORY_MAPPING.get(str(data.get("category", "")).lower())
+        priority = data.get("priority")
+        if isinstance(priority, str) and priority.strip().isdigit():
+            priority = int(priority.strip())
+        if isinstance(priority, bool) or not isinstance(priority, int) or not 1 <= priority <= 5:
+            priority = None
+        
+        if category is None or priority is None:
+            return {
+                "category": category or "General",
+                "priority": priority or 3,
+                "explanation": "Default categorization (incomplete response)"
+            }
+        
+        return {
+            "category": category,
+            "priority": priority,
+            "explanation": str(data.get("explanation") or "")
+        }
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED))
     def extract_entities(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
         """
         Extract entities from email text using OpenAI API
@@ -96,26 +504,17 @@ class OpenAIService:
            - Include terms related to deals, property features, market conditions, etc.
         
         For each entity, provide a confidence score (0.0-1.0) indicating how certain you are about the extraction.
-        
-        Return the extracted information in a structured JSON format with these categories.
+        Use an empty string for details that are not mentioned, and dates in YYYY-MM-DD format where possible.
         If a category has no entities, return an empty array for that category.
-        
-        IMPORTANT: Use lowercase keys in your JSON response (e.g., "properties" not "Properties").
         """
         
+        # Strip quoted history and boilerplate, then fit the task's token budget
+        email_text = self.budget.prepare(email_text, "entities")
+        
         # Create the user prompt with the email content
         user_prompt = f"Subject: {email_subject}\n\nBody:\n{email_text}"
         
         try:
-            # Define the API endpoint
-            url = "https://api.openai.com/v1/chat/completions"
-            
-            # Define the headers
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
             # Define the data
             data = {
                 "model": model,
@@ -123,44 +522,17 @@ class OpenAIService:
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                "response_format": {"type": "json_object"},
+                "response_format": response_format("email_entities", ENTITIES_SCHEMA),
                 "temperature": 0.2  # Lower temperature for more deterministic outputs
             }
             
-            # Make the API call
-            response = requests.post(url, headers=headers, json=data)
+            # Make the API call on a pooled connection
+            response = self._post_chat_completion(data)
             
             # Check if the response is valid
             if response.status_code == 200:
-                response_data = response.json()
-                content = response_data['choices'][0]['message']['content']
-                extracted_data = json.loads(content)
-                
-                # Normalize keys to lowercase
-                normalized_data = self._normalize_keys(extracted_data)
-                
-                # Ensure all expected keys exist
-                expected_keys = ["properties", "people", "companies", "dates", 
-                                "financial_details", "action_items", "keywords"]
-                for key in expected_keys:
-                    if key not in normalized_data:
-                        normalized_data[key] = []
-                
-                # Fix company names if needed
-                if "companies" in normalized_data:
-                    for company in normalized_data["companies"]:
-                        # Rename company_name to name if needed
-                        if "company_name" in company and "name" not in company:
-                            company["name"] = company["company_name"]
-                            
-                        # Fix ABC Properties Inc. to ABC Properties
-                        if "name" in company and "ABC Properties Inc." in company["name"]:
-                            company["name"] = "ABC Properties"
-                        elif "company_name" in company and "ABC Properties Inc." in company["company_name"]:
-                            company["company_name"] = "ABC Properties"
-                            company["name"] = "ABC Properties"
-                
-                return normalized_data
+                extracted_data = self._parse_structured_response(response.json(), ENTITIES_SCHEMA)
+                return self._conform_entities(extracted_data)
             else:
                 print(f"OpenAI API error: HTTP {response.status_code}")
                 print(f"Response: {response.text}")
@@ -174,6 +546,9 @@ class OpenAIService:
                     "action_items": [],
                     "keywords": []
                 }
+        except NOT_RETRIED:
+            # Surface rate limiting and outages instead of returning default results
+            raise
         except Exception as e:
             print(f"Error in OpenAI API call: {e}")
             # Return empty structure if API call fails
@@ -187,7 +562,8 @@ class OpenAIService:
                 "keywords": []
             }
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED))
     def generate_email_summary(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> str:
         """
         Generate a concise summary of an email
@@ -216,19 +592,13 @@ class OpenAIService:
         Keep the summary under 100 words and focus on information that would be most relevant to a CRE professional.
         """
         
+        # Strip quoted history and boilerplate, then fit the task's token budget
+        email_text = self.budget.prepare(email_text, "summary")
+        
         # Create the user prompt with the email content
         user_prompt = f"Subject: {email_subject}\n\nBody:\n{email_text}"
         
         try:
-            # Define the API endpoint
-            url = "https://api.openai.com/v1/chat/completions"
-            
-            # Define the headers
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
             # Define the data
             data = {
                 "model": model,
@@ -239,8 +609,8 @@ class OpenAIService:
                 "temperature": 0.3  # Slightly higher temperature for more natural language
             }
             
-            # Make the API call
-            response = requests.post(url, headers=headers, json=data)
+            # Make the API call on a pooled connection
+            response = self._post_chat_completion(data)
             
             # Check if the response is valid
             if response.status_code == 200:
@@ -251,11 +621,14 @@ class OpenAIService:
                 print(f"OpenAI API error: HTTP {response.status_code}")
                 print(f"Response: {response.text}")
                 return "Error generating summary."
+        except NOT_RETRIED:
+            raise
         except Exception as e:
             print(f"Error in OpenAI API call: {e}")
             return "Error generating summary."
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED))
     def categorize_email(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
         """
         Categorize an email into CRE-specific categories and determine priority
@@ -287,27 +660,19 @@ class OpenAIService:
            - Consider urgency, importance, deadlines, and financial impact
            - Provide a brief explanation for the priority level
         
-        Return the results in a structured JSON format with these fields:
-        - "category": The primary category (one of the values above, exactly as written with capitalization)
+        Return the results with these fields:
+        - "category": The primary category (one of the values above)
         - "priority": A number from 1-5
         - "explanation": A brief explanation for the priority level
-        
-        IMPORTANT: Use lowercase keys in your JSON response, but keep the category values capitalized exactly as shown above.
         """
         
+        # Strip quoted history and boilerplate, then fit the task's token budget
+        email_text = self.budget.prepare(email_text, "categorize")
+        
         # Create the user prompt with the email content
         user_prompt = f"Subject: {email_subject}\n\nBody:\n{email_text}"
         
         try:
-            # Define the API endpoint
-            url = "https://api.openai.com/v1/chat/completions"
-            
-            # Define the headers
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
             # Define the data
             data = {
                 "model": model,
@@ -315,48 +680,17 @@ class OpenAIService:
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                "response_format": {"type": "json_object"},
+                "response_format": response_format("email_category", CATEGORY_SCHEMA),
                 "temperature": 0.2  # Lower temperature for more deterministic outputs
             }
             
-            # Make the API call
-            response = requests.post(url, headers=headers, json=data)
+            # Make the API call on a pooled connection
+            response = self._post_chat_completion(data)
             
             # Check if the response is valid
             if response.status_code == 200:
-                response_data = response.json()
-                content = response_data['choices'][0]['message']['content']
-                category_data = json.loads(content)
-                
-                # Normalize keys to lowercase but preserve category value
-                normalized_data = self._normalize_keys(category_data)
-                
-                # Ensure all expected keys exist
-                expected_keys = ["category", "priority", "explanation"]
-                for key in expected_keys:
-                    if key not in normalized_data:
-                        if key == "category":
-                            normalized_data[key] = "General"
-                        elif key == "priority":
-                            normalized_data[key] = 3
-                        elif key == "explanation":
-                            normalized_data[key] = "Default categorization"
-                
-                # Capitalize the category if it's lowercase
-                if "category" in normalized_data and normalized_data["category"]:
-                    category_value = normalized_data["category"]
-                    # Map lowercase categories to proper case
-                    category_mapping = {
-                        "property": "Property",
-                        "deal": "Deal",
-                        "meeting": "Meeting",
-                        "task": "Task",
-                        "general": "General"
-                    }
-                    if category_value.lower() in category_mapping:
-                        normalized_data["category"] = category_mapping[category_value.lower()]
-                
-                return normalized_data
+                category_data = self._parse_structured_response(response.json(), CATEGORY_SCHEMA)
+                return self._conform_category(category_data)
             else:
                 print(f"OpenAI API error: HTTP {response.status_code}")
                 print(f"Response: {response.text}")
@@ -366,6 +700,8 @@ class OpenAIService:
                     "priority": 3,
                     "explanation": "Default categorization due to processing error."
                 }
+        except NOT_RETRIED:
+            raise
         except Exception as e:
             print(f"Error in OpenAI API call: {e}")
             # Return default values if API call fails
@@ -375,7 +711,367 @@ class OpenAIService:
                 "explanation": "Default categorization due to processing error."
             }
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED + (StructuredOutputError,)))
+    def detect_follow_ups(self, email_text: str, email_subject: str = "", sender: str = "",
+                          model: str = "gpt-4o") -> List[Dict[str, str]]:
+        """
+        Identify follow-up tasks, action items and requests in an email
+        
+        Args:
+            email_text: The body text of the email
+            email_subject: The subject of the email (optional)
+            sender: Name and address of the sender (optional)
+            model: The OpenAI model to use
+        
+        Returns:
+            List of dictionaries with "title", "responsible" and "due_date"
+            (YYYY-MM-DD or empty)
+        
+        Raises:
+            ValueError: If the API call fails
+            StructuredOutputError: If the response contains no recoverable JSON (not retried)
+        """
+        system_prompt = """
+        You are an AI assistant specialized in commercial real estate (CRE) emails.
+        Identify the follow-up tasks, action items and requests in the email. For each one give:
+        - "title": A short description of the task
+        - "responsible": Who is responsible, or an empty string if not mentioned
+        - "due_date": The due date or deadline as YYYY-MM-DD, or an empty string if not mentioned
+        
+        Return an empty "follow_ups" array if the email contains no follow-up tasks.
+        """
+        
+        # Strip quoted history and boilerplate, then fit the task's token budget
+        email_text = self.budget.prepare(email_text, "follow_up")
+        user_prompt = f"Subject: {email_subject}\nFrom: {sender}\n\nBody:\n{email_text}"
+        
+        data = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "response_format": response_format("email_follow_ups", FOLLOW_UPS_SCHEMA),
+            "temperature": 0.2,
+            "max_tokens": 500
+        }
+        
+        response = self._post_chat_completion(data)
+        if response.status_code != 200:
+            raise ValueError(f"OpenAI API error: HTTP {response.status_code}: {response.text}")
+        
+        result = self._parse_structured_response(response.json(), FOLLOW_UPS_SCHEMA)
+        tasks = result.get("follow_ups") if isinstance(result, dict) else result
+        return [task for task in tasks or [] if isinstance(task, dict) and task.get("title")]
+    
+    def enrich_email(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
+        """
+        Extract entities, summarize and categorize an email with a single API call
+        
+        The response is constrained to ENRICHMENT_SCHEMA. A malformed response is
+        repaired locally and missing fields get defaults ("partial" source if
+        nothing could be recovered). If the combined call fails, the separate
+        extract_entities, generate_email_summary and categorize_email calls are
+        used instead.
+        
+        Args:
+            email_text: The body text of the email
+            email_subject: The subject of the email (optional)
+            model: The OpenAI model to use (default: gpt-4o-mini for cost efficiency)
+        
+        Returns:
+            Dictionary with "entities" (same shape as extract_entities), "summary",
+            "category", "priority", "explanation" and "source" ("combined",
+            "partial" or "fallback")
+        """
+        if not self.api_key:
+            raise ValueError("OpenAI API key not set. Please set OPENAI_API_KEY environment variable.")
+        
+        try:
+            return self._request_enrichment(email_text, email_subject, model)
+        except NOT_RETRIED:
+            # Separate calls would only add load to an exhausted rate limit or fail
+            # the same way against an unavailable API
+            raise
+        except Exception as e:
+            print(f"Combined enrichment failed, falling back to separate calls: {e}")
+        
+        category_data = self.categorize_email(email_text, email_subject, model)
+        return {
+            "entities": self.extract_entities(email_text, email_subject, model),
+            "summary": self.generate_email_summary(email_text, email_subject, model),
+            "category": category_data.get("category", "General"),
+            "priority": category_data.get("priority", 3),
+            "explanation": category_data.get("explanation", ""),
+            "source": "fallback"
+        }
+    
+    def build_enrichment_request(self, email_text: str, email_subject: str = "", model: str = "gpt-4o-mini") -> Dict[str, Any]:
+        """
+        Build the chat completion request body of the combined enrichment call
+        
+        Also used to write Batch API input files.
+        
+        Args:
+            email_text: The body text of the email
+            email_subject: The subject of the email (optional)
+            model: The OpenAI model to use
+        
+        Returns:
+            Chat completion request body
+        """
+        system_prompt = """
+        You are an AI assistant specialized in commercial real estate (CRE) emails.
+        Analyze the email and return ONE JSON object with exactly these lowercase keys:
+        """ + self.ENRICHMENT_FIELDS_PROMPT
+        
+        # Strip quoted history and boilerplate, then fit the task's token budget
+        email_text = self.budget.prepare(email_text, "enrichment")
+        user_prompt = f"Subject: {email_subject}\n\nBody:\n{email_text}"
+        
+        return {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "response_format": response_format("email_enrichment", ENRICHMENT_SCHEMA),
+            "temperature": 0.2
+        }
+    
+    def pack_emails(self, emails: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """
+        Group short emails into packs that fit one enrichment request
+        
+        Emails are packed in order until a pack would exceed PACKED_MAX_EMAILS
+        or PACKED_MAX_PROMPT_TOKENS of email text. Longer emails, and all
+        emails when packing is disabled, get a pack of their own.
+        
+        Args:
+            emails: Dictionaries with "message_id", "text" and "subject";
+                    message IDs must be unique
+        
+        Returns:
+            List of packs, each a list of the given dictionaries
+        """
+        packs = []
+        current = []
+        current_tokens = 0
+        
+        for email_item in emails:
+            tokens = estimate_tokens(email_item.get("subject", "") + clean_email_body(email_item.get("text", "")))
+            if not self.packing_enabled or tokens > self.PACKED_MAX_EMAIL_TOKENS:
+                packs.append([email_item])
+                continue
+            
+            if current and (len(current) >= self.PACKED_MAX_EMAILS
+                            or current_tokens + tokens > self.PACKED_MAX_PROMPT_TOKENS):
+                packs.append(current)
+                current, current_tokens = [], 0
+            current.append(email_item)
+            current_tokens += tokens
+        
+        if current:
+            packs.append(current)
+        return packs
+    
+    def enrich_packed(self, pack: List[Dict[str, str]], model: str = "gpt-4o-mini") -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Enrich a pack of emails, sending the enrichment prompt once for all of them
+        
+        Results are matched to emails by message ID. Emails whose result is
+        missing, duplicated or incomplete (e.g. cut off at max_tokens), and all
+        emails of a pack whose request fails, are enriched with enrich_email.
+        Once one of these calls finds the API unavailable or rate limited, the
+        remaining emails are not sent and get no result, but the results
+        already taken from the packed response are kept.
+        
+        Args:
+            pack: Emails as returned by pack_emails
+            model: The OpenAI model to use
+        
+        Returns:
+            Dictionary mapping each message ID to the same result as enrich_email
+            ("packed" source for results taken from the packed response), or to
+            None if the email could not be enriched
+        
+        Raises:
+            CircuitOpenError: If the API is unavailable before any email is enriched
+            RateLimitError: If the request is still rate limited after waiting, before
+                            any email is enriched
+        """
+        results = {}
+        if len(pack) > 1:
+            try:
+                results = self._request_packed_enrichment(pack, model)
+            except NOT_RETRIED:
+                raise
+            except Exception as e:
+                print(f"Packed enrichment of {len(pack)} emails failed, enriching them one by one: {e}")
+                with self._packing_lock:
+                    self._packing_stats["failed_packs"] += 1
+        
+        unavailable = False
+        for email_item in pack:
+            message_id = email_item["message_id"]
+            if message_id in results:
+                continue
+            if unavailable:
+                results[message_id] = None
+                continue
+            
+            try:
+                results[message_id] = self.enrich_email(email_item.get("text", ""), email_item.get("subject", ""), model)
+            except NOT_RETRIED:
+                # A single-email pack has no other results to keep
+                if len(pack) == 1:
+                    raise
+                unavailable = True
+                results[message_id] = None
+        return results
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED + (StructuredOutputError,)))
+    def _request_packed_enrichment(self, pack: List[Dict[str, str]], model: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Make a packed enrichment call and keep the results that align with the pack
+        
+        Returns:
+            Dictionary mapping message IDs to enrichments; emails without a usable
+            result are left out
+        
+        Raises:
+            ValueError: If the API call fails
+            StructuredOutputError: If the response contains no recoverable JSON (not retried)
+        """
+        system_prompt = """
+        You are an AI assistant specialized in commercial real estate (CRE) emails.
+        Several emails follow, each introduced by a line "=== EMAIL <message_id> ===".
+        Analyze each email on its own and return an "emails" array with one object
+        per email, in the same order. Set "message_id" to the ID from the email's
+        delimiter line and give each object exactly these lowercase keys:
+        """ + self.ENRICHMENT_FIELDS_PROMPT
+        
+        sections = []
+        for email_item in pack:
+            # Strip quoted history and boilerplate, then fit the task's token budget
+            email_text = self.budget.prepare(email_item.get("text", ""), "enrichment")
+            sections.append(f"=== EMAIL {email_item['message_id']} ===\n"
+                            f"Subject: {email_item.get('subject', '')}\n\nBody:\n{email_text}")
+        
+        data = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": "\n\n".join(sections)}
+            ],
+            "response_format": response_format("packed_email_enrichment", PACKED_ENRICHMENT_SCHEMA),
+            "temperature": 0.2,
+            "max_tokens": self.PACKED_COMPLETION_TOKENS_PER_EMAIL * len(pack)
+        }
+        
+        response = self._post_chat_completion(data)
+        if response.status_code != 200:
+            raise ValueError(f"OpenAI API error: HTTP {response.status_code}: {response.text}")
+        
+        parsed = self._parse_structured_response(response.json(), PACKED_ENRICHMENT_SCHEMA)
+        items = parsed.get("emails") if isinstance(parsed, dict) else parsed
+        
+        expected = {email_item["message_id"] for email_item in pack}
+        results = {}
+        seen = set()
+        duplicates = set()
+        for item in items if isinstance(items, list) else []:
+            message_id = item.get("message_id") if isinstance(item, dict) else None
+            if message_id not in expected:
+                continue
+            if message_id in seen:
+                duplicates.add(message_id)
+                continue
+            seen.add(message_id)
+            
+            # Incomplete items are usually the last one of a truncated response
+            if not validate(item, PACKED_ENRICHMENT_ITEM_SCHEMA):
+                enrichment = self._conform_enrichment(item)
+                enrichment["source"] = "packed"
+                results[message_id] = enrichment
+        
+        for message_id in duplicates:
+            results.pop(message_id, None)
+        
+        with self._packing_lock:
+            self._packing_stats["packed_requests"] += 1
+            self._packing_stats["packed_emails"] += len(results)
+            self._packing_stats["unaligned_emails"] += len(pack) - len(results)
+        return results
+    
+    def parse_enrichment_response(self, response_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Parse the chat completion response of an enrichment request
+        
+        Used for direct calls and Batch API results alike, so both label their
+        results the same way.
+        
+        Args:
+            response_data: Chat completion response body
+        
+        Returns:
+            Same as enrich_email: "combined" source, or defaults with "partial"
+            source if the response contains no recoverable JSON
+        """
+        try:
+            enrichment = self._conform_enrichment(self._parse_structured_response(response_data, ENRICHMENT_SCHEMA))
+            enrichment["source"] = "combined"
+        except StructuredOutputError as e:
+            # The request itself succeeded; asking again would cost another round trip
+            print(f"Unusable enrichment response, using defaults: {e}")
+            enrichment = self._conform_enrichment({})
+            enrichment["source"] = "partial"
+        return enrichment
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED))
+    def _request_enrichment(self, email_text: str, email_subject: str, model: str) -> Dict[str, Any]:
+        """
+        Make the combined enrichment call and parse its response
+        
+        Raises:
+            ValueError: If the API call fails
+        """
+        data = self.build_enrichment_request(email_text, email_subject, model)
+        
+        response = self._post_chat_completion(data)
+        if response.status_code != 200:
+            raise ValueError(f"OpenAI API error: HTTP {response.status_code}: {response.text}")
+        
+        return self.parse_enrichment_response(response.json())
+    
+    def _conform_enrichment(self, data: Any) -> Dict[str, Any]:
+        """
+        Build an enrichment from a parsed response, defaulting missing or invalid fields
+        
+        Args:
+            data: Parsed JSON returned by the model, possibly repaired or incomplete
+        
+        Returns:
+            Dictionary with "entities", "summary", "category", "priority" and "explanation"
+        
+        Raises:
+            StructuredOutputError: If the response is not a JSON object
+        """
+        if not isinstance(data, dict):
+            raise StructuredOutputError(f"Enrichment response is a {type(data).__name__}, not an object")
+        
+        summary = data.get("summary")
+        return dict(
+            self._conform_category(data),
+            entities=self._conform_entities(data),
+            summary=summary.strip() if isinstance(summary, str) else ""
+        )
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+           retry=retry_if_not_exception_type(NOT_RETRIED))
     def simple_completion(self, prompt: str, model: str = "gpt-4o-mini") -> str:
         """
         Get a simple text completion from OpenAI
@@ -391,11 +1087,6 @@ class OpenAIService:
             print("ERROR: OPENAI_API_KEY not found in environment variables")
             return ""
             
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
         data = {
             "model": model,
             "messages": [
@@ -407,15 +1098,85 @@ class OpenAIService:
         }
         
         try:
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=data
-            )
+            response = self._post_chat_completion(data)
             response.raise_for_status()
             
             result = response.json()
             return result["choices"][0]["message"]["content"].strip()
         except Exception as e:
             print(f"Error in simple_completion: {e}")
-            raise 
\ No newline at end of file
+            raise
+    
+    def stream_completion(self, prompt: str, model: str = "gpt-4o-mini", max_tokens: int = 150) -> Iterator[str]:
+        """
+        Stream a simple text completion from OpenAI as it is generated
+        
+        Sends the same request as simple_completion with "stream" set; streamed
+        responses bypass the completion cache and request hedging. The call is
+        recorded in the ledger when the stream ends.
+        
+        Args:
+            prompt: The prompt to send to OpenAI
+            model: The model to use for completion
+            max_tokens: Maximum tokens of the completion
+        
+        Yields:
+            Pieces of the completion text, in order
+        
+        Raises:
+            ValueError: If the API key is missing, the API call fails or the stream reports an error
+        """
+        if not self.api_key:
+            raise ValueError("OpenAI API key not set. Please set OPENAI_API_KEY environment variable.")
+        
+        data = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": max_tokens,
+            "stream": True,
+            # The last chunk then reports token usage, for the ledger
+            "stream_options": {"include_usage": True}
+        }
+        
+        started = time.monotonic()
+        response = self._post_chat_completion(data)
+        usage = None
+        error = None
+        try:
+            if response.status_code != 200:
+                raise ValueError(f"OpenAI API error: HTTP {response.status_code}: {response.text}")
+            
+            # Server-sent events carry no charset; the chunks are UTF-8 JSON
+            response.encoding = "utf-8"
+            
+            # chunk_size=None hands over each chunk as soon as it arrives
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                
+                chunk = json.loads(payload)
+                if chunk.get("error"):
+                    raise ValueError(f"OpenAI stream error: {chunk['error'].get('message', chunk['error'])}")
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        except BaseException as e:
+            # Includes GeneratorExit when the consumer stops reading early
+            error = e
+            raise
+        finally:
+            response.close()
+            if self.ledger is not None:
+                self._record_call(data, started, response=response, usage=usage, error=error) 
\ No newline at end of file
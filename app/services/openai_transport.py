@@ -0,0 +1,139 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class OpenAITransport:
+    """
+    Process-wide HTTP layer for the OpenAI API:
+    - Keeps TCP/TLS connections alive in a bounded urllib3 pool
+    - Applies connect and read timeouts to every request
+    - Safe to share between threads; reports pool statistics
+    """
+    
+    def __init__(self, base_url: Optional[str] = None, pool_size: int = 10,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0):
+        """
+        Initialize the transport
+        
+        Args:
+            base_url: API root, e.g. https://api.openai.com/v1
+            pool_size: Maximum number of kept-alive connections per host
+            connect_timeout: Seconds to wait for a connection to be established
+            read_timeout: Seconds to wait for the server between bytes of the response
+        """
+        self.base_url = (base_url or "https://api.openai.com/v1").rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        
+        # pool_block makes extra threads wait for a free connection instead of
+        # opening throwaway ones beyond the pool size
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+    
+    def post(self, path: str, api_key: str, payload: Dict[str, Any], **kwargs) -> requests.Response:
+        """
+        POST a JSON payload to an API path on a pooled connection
+        
+        Args:
+            path: Path below the base URL, e.g. "/chat/completions"
+            api_key: OpenAI API key
+            payload: JSON request body
+            **kwargs: Extra arguments for requests (e.g. stream=True)
+        
+        Returns:
+            The HTTP response
+        """
+        return self.request("POST", path, api_key, json=payload, **kwargs)
+    
+    def request(self, method: str, path: str, api_key: str, **kwargs) -> requests.Response:
+        """
+        Send any request to an API path on a pooled connection
+        
+        Args:
+            method: HTTP method
+            path: Path below the base URL, e.g. "/files"
+            api_key: OpenAI API key
+            **kwargs: Arguments for requests, e.g. json, files, data or stream
+        
+        Returns:
+            The HTTP response
+        """
+        headers = {"Authorization": f"Bearer {api_key}"}
+        if "json" in kwargs:
+            headers["Content-Type"] = "application/json"
+        
+        with self._lock:
+            self.requests += 1
+        
+        try:
+            return self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                headers=headers,
+                timeout=kwargs.pop("timeout", self.timeout),
+                **kwargs
+            )
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report request counters and connection pool usage
+        
+        Returns:
+            Dictionary with request and error counts, connections opened so far
+            and connections currently idle in the pool
+        """
+        opened = 0
+        idle = 0
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "connections_opened": opened,
+                "idle_connections": idle,
+                "pool_size": self.pool_size,
+                "connect_timeout": self.timeout[0],
+                "read_timeout": self.timeout[1]
+            }
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> OpenAITransport:
+    """
+    Get the process-wide transport, creating it from environment variables on first use
+    
+    OPENAI_BASE_URL, OPENAI_POOL_SIZE, OPENAI_CONNECT_TIMEOUT and OPENAI_READ_TIMEOUT
+    configure the transport.
+    """
+    global _transport
+    
+    with _transport_lock:
+        if _transport is None:
+            _transport = OpenAITransport(
+                base_url=os.environ.get("OPENAI_BASE_URL"),
+                pool_size=int(os.environ.get("OPENAI_POOL_SIZE", "10")),
+                connect_timeout=float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5")),
+                read_timeout=float(os.environ.get("OPENAI_READ_TIMEOUT", "60"))
+            )
+        return _transport
@@ -0,0 +1,188 @@
+import re
+import threading
+from typing import Dict, Any, Optional
+
+# Rough token estimate for English text with GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+# Separator EmailProcessor puts between the body and extracted attachment text
+ATTACHMENT_MARKER = "\n\n--- Attachment: "
+
+# Maximum tokens of email text per prompt, by task
+DEFAULT_BUDGETS = {
+    "enrichment": 3000,
+    "entities": 3000,
+    "summary": 1500,
+    "categorize": 800,
+    "follow_up": 400,
+    "capsule_summary": 250,
+    "clustering": 150,
+}
+
+# Lines that start the quoted copy of an earlier message in a reply
+_REPLY_HEADER_PATTERNS = [
+    re.compile(r"^On .{5,200}wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+]
+
+# Outlook-style reply header: a From: line directly followed by Sent: or Date:
+_OUTLOOK_FROM = re.compile(r"^From:\s.+$", re.IGNORECASE)
+_OUTLOOK_SENT = re.compile(r"^(Sent|Date):\s", re.IGNORECASE)
+
+# Header lines of a forwarded message; the forwarded content itself is kept
+_FORWARD_MARKER = re.compile(r"^-{2,}\s*Forwarded message\s*-{2,}\s*$|^Begin forwarded message:\s*$", re.IGNORECASE)
+_FORWARD_HEADER = re.compile(r"^(From|Date|Sent|Subject|To|Cc):\s", re.IGNORECASE)
+
+# Footers that carry no information about the email itself
+_FOOTER_PATTERNS = [
+    re.compile(r"^(CONFIDENTIALITY NOTICE|DISCLAIMER|NOTICE:|This (e-?mail|message|communication) (and any attachments )?(is|are|contains|may contain) (confidential|intended))", re.IGNORECASE),
+    re.compile(r"^Sent from my (iPhone|iPad|Android|mobile|Samsung|BlackBerry)", re.IGNORECASE),
+    re.compile(r"^(To )?unsubscribe\b|^Click here to unsubscribe", re.IGNORECASE),
+    re.compile(r"^Get Outlook for (iOS|Android)", re.IGNORECASE),
+]
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without a tokenizer"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def clean_email_body(text: str) -> str:
+    """
+    Remove quoted replies, forwarded-message headers and boilerplate footers
+    
+    Attachment sections appended by EmailProcessor are left untouched.
+    
+    Args:
+        text: Email body, optionally followed by attachment sections
+    
+    Returns:
+        The cleaned text
+    """
+    body, marker, attachments = text.partition(ATTACHMENT_MARKER)
+    
+    body_lines = body.splitlines()
+    lines = []
+    in_forward_header = False
+    for index, line in enumerate(body_lines):
+        stripped = line.strip()
+        
+        # Quoted lines from earlier messages
+        if stripped.startswith(">"):
+            continue
+        
+        if _FORWARD_MARKER.match(stripped):
+            in_forward_header = True
+            continue
+        if in_forward_header:
+            if not stripped or _FORWARD_HEADER.match(stripped):
+                continue
+            in_forward_header = False
+        elif any(pattern.match(stripped) for pattern in _REPLY_HEADER_PATTERNS) or (
+            _OUTLOOK_FROM.match(stripped)
+            and index + 1 < len(body_lines)
+            and _OUTLOOK_SENT.match(body_lines[index + 1].strip())
+        ):
+            if any(kept.strip() for kept in lines):
+                # Everything below the reply header is the quoted earlier message
+                break
+            # Bottom-posted reply: the new text follows the quote
+            continue
+        
+        # Boilerplate footers end the useful content; signatures are kept
+        # because they carry the sender's role, company and phone number
+        if any(pattern.match(stripped) for pattern in _FOOTER_PATTERNS):
+            break
+        
+        lines.append(line.rstrip())
+    
+    cleaned = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return cleaned + marker + attachments if marker else cleaned
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """
+    Truncate a text to a token budget, preferring paragraph or sentence boundaries
+    
+    Args:
+        text: Text to truncate
+        max_tokens: Maximum estimated tokens of the result
+    
+    Returns:
+        The text, shortened and marked with "[...]" if it was over budget
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    
+    limit = max(0, max_tokens * CHARS_PER_TOKEN - 6)
+    cut = text[:limit]
+    
+    # Back off to a natural boundary if one is close to the limit
+    for separator in ("\n\n", "\n", ". "):
+        position = cut.rfind(separator)
+        if position >= limit * 0.8:
+            cut = cut[:position + (1 if separator == ". " else 0)]
+            break
+    
+    return cut.rstrip() + "\n[...]"
+
+class PromptBudget:
+    """
+    Shared preprocessing of email text before it is sent to the LLM:
+    - Strips quoted replies, forwarded headers and boilerplate footers
+    - Fits the text to a per-task token budget
+    - Counts the tokens saved per task; the last report of each thread is
+      available through last_report()
+    """
+    
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        """
+        Initialize the prompt budget
+        
+        Args:
+            budgets: Maximum tokens of email text per task (default: DEFAULT_BUDGETS)
+        """
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+    
+    def prepare(self, text: str, task: str) -> str:
+        """
+        Clean email text and fit it to the budget of a task
+        
+        Args:
+            text: Email body text
+            task: Task name, a key of the budgets
+        
+        Returns:
+            The prepared text
+        """
+        text = text or ""
+        prepared = fit_to_budget(clean_email_body(text), self.budgets.get(task, DEFAULT_BUDGETS["enrichment"]))
+        
+        report = {
+            "task": task,
+            "tokens_before": estimate_tokens(text),
+            "tokens_after": estimate_tokens(prepared)
+        }
+        report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+        self._local.report = report
+        
+        with self._lock:
+            stats = self._stats.setdefault(task, {"calls": 0, "tokens_before": 0, "tokens_after": 0, "tokens_saved": 0})
+            stats["calls"] += 1
+            for key in ("tokens_before", "tokens_after", "tokens_saved"):
+                stats[key] += report[key]
+        
+        return prepared
+    
+    def last_report(self) -> Optional[Dict[str, Any]]:
+        """Return the report of the last prepare() call made by the current thread"""
+        return getattr(self._local, "report", None)
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return the token counters per task"""
+        with self._lock:
+            return {task: dict(stats) for task, stats in self._stats.items()}
+
+# Shared instance used by all services
+prompt_budget = PromptBudget()
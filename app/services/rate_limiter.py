@@ -0,0 +1,289 @@
+import os
+import re
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Mapping
+
+class RateLimitError(Exception):
+    """Raised when a request is still rate limited after waiting for the limit to reset"""
+
+class AdaptiveRateLimiter:
+    """
+    Rate limiter driven by the OpenAI x-ratelimit-* response headers:
+    - Tracks the remaining requests and tokens and when each budget resets
+    - Reserves budget before a request and blocks callers while it is exhausted
+    - Pauses everyone after a 429 until Retry-After or the next reset
+    - Shares its state between threads, and between processes through a
+      flock-protected state file
+    """
+    
+    # Wait used after a 429 that carries neither Retry-After nor reset headers
+    DEFAULT_PENALTY = 1.0
+    
+    # Longest single sleep, so waiting callers re-read state updated by others
+    MAX_SLEEP = 1.0
+    
+    def __init__(self, state_path: Optional[str] = None, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        """
+        Initialize the rate limiter
+        
+        Args:
+            state_path: JSON file shared with other processes, or None for in-process only
+            requests_per_minute: Request budget assumed until the API reports one
+            tokens_per_minute: Token budget assumed until the API reports one
+        """
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._state = self._initial_state(requests_per_minute, tokens_per_minute)
+        
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+        
+        if state_path:
+            directory = os.path.dirname(state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+    
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until the request and token budgets allow a request, then reserve it
+        
+        Args:
+            tokens: Estimated tokens of the request (prompt plus completion)
+        
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._shared_state() as state:
+                wait = self._wait_time(state, tokens, time.time())
+                if wait <= 0:
+                    if state["remaining_requests"] is not None:
+                        state["remaining_requests"] -= 1
+                    if state["remaining_tokens"] is not None:
+                        state["remaining_tokens"] -= tokens
+                    break
+            
+            if not waited:
+                self.waits += 1
+            sleep = min(wait, self.MAX_SLEEP)
+            time.sleep(sleep)
+            waited += sleep
+        
+        self.wait_seconds += waited
+        return waited
+    
+    def update(self, headers: Mapping[str, str]) -> None:
+        """
+        Record the budgets reported by the x-ratelimit-* headers of a response
+        
+        Args:
+            headers: Response headers (case-insensitive mapping)
+        """
+        values = {
+            key: headers.get(f"x-ratelimit-{key}")
+            for key in ("limit-requests", "limit-tokens", "remaining-requests", "remaining-tokens",
+                        "reset-requests", "reset-tokens")
+        }
+        if not any(values.values()):
+            return
+        
+        now = time.time()
+        with self._shared_state() as state:
+            for kind in ("requests", "tokens"):
+                limit = _to_int(values[f"limit-{kind}"])
+                remaining = _to_int(values[f"remaining-{kind}"])
+                reset = parse_duration(values[f"reset-{kind}"])
+                
+                if limit is not None:
+                    state[f"limit_{kind}"] = limit
+                if remaining is not None:
+                    state[f"remaining_{kind}"] = remaining
+                if reset is not None:
+                    state[f"reset_{kind}_at"] = now + reset
+    
+    def on_rate_limited(self, headers: Optional[Mapping[str, str]] = None) -> float:
+        """
+        Pause all callers after a 429 response
+        
+        Args:
+            headers: Headers of the 429 response
+        
+        Returns:
+            Seconds until requests are allowed again
+        """
+        headers = headers or {}
+        self.update(headers)
+        self.rate_limited += 1
+        
+        now = time.time()
+        penalty = parse_duration(headers.get("retry-after-ms"), unit="ms")
+        if penalty is None:
+            penalty = parse_duration(headers.get("retry-after"))
+        
+        with self._shared_state() as state:
+            if penalty is None:
+                resets = [state[key] - now for key in ("reset_requests_at", "reset_tokens_at")
+                          if state[key] and state[key] > now]
+                penalty = min(resets) if resets else self.DEFAULT_PENALTY
+            state["blocked_until"] = max(state["blocked_until"], now + penalty)
+        
+        return penalty
+    
+    def headroom(self) -> Dict[str, Any]:
+        """
+        Report the budget currently available
+        
+        Returns:
+            Dictionary with remaining requests and tokens, seconds until each
+            budget resets, the remaining pause after a 429 and wait counters
+        """
+        now = time.time()
+        with self._shared_state() as state:
+            return {
+                "remaining_requests": state["remaining_requests"],
+                "remaining_tokens": state["remaining_tokens"],
+                "limit_requests": state["limit_requests"],
+                "limit_tokens": state["limit_tokens"],
+                "requests_reset_in": round(max(0.0, (state["reset_requests_at"] or now) - now), 3),
+                "tokens_reset_in": round(max(0.0, (state["reset_tokens_at"] or now) - now), 3),
+                "blocked_for": round(max(0.0, state["blocked_until"] - now), 3),
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "rate_limited": self.rate_limited
+            }
+    
+    def _wait_time(self, state: Dict[str, Any], tokens: int, now: float) -> float:
+        """Seconds to wait before a request of the given size fits the budgets"""
+        # Budgets refill completely once their reset time has passed; one whose
+        # limit was never reported is unknown until the next response
+        for kind in ("requests", "tokens"):
+            reset_at = state[f"reset_{kind}_at"]
+            if reset_at and reset_at <= now:
+                state[f"remaining_{kind}"] = state[f"limit_{kind}"]
+                state[f"reset_{kind}_at"] = now + 60.0 if state[f"limit_{kind}"] is not None else None
+        
+        wait = state["blocked_until"] - now
+        
+        # A request larger than the whole budget only waits for a full budget
+        needed = {"requests": 1, "tokens": min(tokens, state["limit_tokens"] or tokens)}
+        for kind in ("requests", "tokens"):
+            remaining = state[f"remaining_{kind}"]
+            if remaining is None or remaining >= needed[kind]:
+                continue
+            
+            # Without reset headers the budget is assumed to refill after
+            # DEFAULT_PENALTY, otherwise nothing would ever refill it
+            if not state[f"reset_{kind}_at"]:
+                state[f"reset_{kind}_at"] = now + self.DEFAULT_PENALTY
+            wait = max(wait, state[f"reset_{kind}_at"] - now)
+        
+        return wait
+    
+    @contextmanager
+    def _shared_state(self):
+        """Lock the state for this process and, with a state file, for all processes"""
+        with self._lock:
+            if not self.state_path:
+                yield self._state
+                return
+            
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read()
+                    if content:
+                        try:
+                            self._state.update(json.loads(content))
+                        except ValueError:
+                            pass
+                    
+                    yield self._state
+                    
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(self._state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+    
+    @staticmethod
+    def _initial_state(requests_per_minute: Optional[int], tokens_per_minute: Optional[int]) -> Dict[str, Any]:
+        """State before any response was seen"""
+        now = time.time()
+        return {
+            "limit_requests": requests_per_minute,
+            "limit_tokens": tokens_per_minute,
+            "remaining_requests": requests_per_minute,
+            "remaining_tokens": tokens_per_minute,
+            "reset_requests_at": now + 60.0 if requests_per_minute else None,
+            "reset_tokens_at": now + 60.0 if tokens_per_minute else None,
+            "blocked_until": 0.0
+        }
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_duration(value: Optional[str], unit: str = "s") -> Optional[float]:
+    """
+    Parse a rate-limit duration such as "1s", "6m0s", "20ms" or a bare number
+    
+    Args:
+        value: Header value
+        unit: Unit of bare numbers ("s" or "ms")
+    
+    Returns:
+        Seconds, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    
+    value = value.strip()
+    try:
+        number = float(value)
+        return number / 1000 if unit == "ms" else number
+    except ValueError:
+        pass
+    
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    
+    scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(number) * scale[part_unit] for number, part_unit in parts)
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    """Parse an integer header value"""
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    Get the process-wide rate limiter, creating it from environment variables on first use
+    
+    OPENAI_RATELIMIT_STATE (default .cache/openai_ratelimit.json; empty for
+    in-process only), OPENAI_RPM and OPENAI_TPM configure the limiter.
+    """
+    global _limiter
+    
+    with _limiter_lock:
+        if _limiter is None:
+            rpm = os.environ.get("OPENAI_RPM")
+            tpm = os.environ.get("OPENAI_TPM")
+            _limiter = AdaptiveRateLimiter(
+                state_path=os.environ.get("OPENAI_RATELIMIT_STATE", ".cache/openai_ratelimit.json") or None,
+                requests_per_minute=int(rpm) if rpm else None,
+                tokens_per_minute=int(tpm) if tpm else None
+            )
+        return _limiter
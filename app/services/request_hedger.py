@@ -0,0 +1,212 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+class RequestHedger:
+    """
+    Hedged requests to cut tail latency:
+    - Tracks the latency of recent requests, separately for each kind of
+      request (e.g. model and operation) so a slow kind does not set the
+      hedge delay of a fast one
+    - If a request has not returned within a percentile of the latency of its
+      kind, sends an identical second request and uses whichever finishes first
+    - Caps hedges at a fraction of all requests so slow periods do not
+      double the spend
+    - Runs a request on the caller's thread when no worker is free for it and
+      its hedge, so waiting in the pool's queue never looks like a slow request
+    """
+    
+    def __init__(self, percentile: float = 95.0, max_hedge_rate: float = 0.05, window: int = 200,
+                 min_samples: int = 20, min_delay: float = 0.5, max_workers: int = 32):
+        """
+        Initialize the hedger
+        
+        Args:
+            percentile: Latency percentile after which a hedge is sent
+            max_hedge_rate: Maximum fraction of requests that may be hedged
+            window: Number of recent latencies kept per kind of request
+            min_samples: Latencies of a kind needed before hedging it starts
+            min_delay: Shortest wait before a hedge, in seconds
+            max_workers: Threads running primary and hedged requests
+        """
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_workers = max_workers
+        self.window = window
+        
+        self._latencies: Dict[Hashable, deque] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._busy = 0
+        
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+    
+    def hedge_delay(self, key: Hashable = None) -> Optional[float]:
+        """Seconds to wait before hedging a kind of request, or None while there are too few samples"""
+        with self._lock:
+            latencies = self._latencies.get(key) or ()
+            if len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+    
+    def call(self, send: Callable[[], T], hedge: Optional[Callable[[], T]] = None,
+             close: Optional[Callable[[T], None]] = None,
+             failed: Optional[Callable[[T], bool]] = None,
+             key: Hashable = None,
+             prepare_hedge: Optional[Callable[[], Any]] = None) -> T:
+        """
+        Run a request, hedging it if it is slower than usual
+        
+        Args:
+            send: Function sending the request
+            hedge: Function sending the hedged copy (default: send)
+            close: Function releasing the result of the request that lost
+            failed: Function telling whether a result is a failure (e.g. a 5xx
+                    response); a failed result only wins if both requests fail
+            key: Kind of request whose latencies set the hedge delay
+            prepare_hedge: Function run before the hedged copy is sent and timed,
+                           e.g. waiting for the rate limiter
+        
+        Returns:
+            The result of whichever request finished first without failing, or
+            the last failed result if neither succeeded
+        """
+        delay = self.hedge_delay(key)
+        with self._lock:
+            self.requests += 1
+            # Without a free worker for both copies the primary would wait in
+            # the queue and be hedged for that wait; send it directly instead
+            pooled = delay is not None and self._busy + 2 <= self.max_workers
+            if pooled:
+                self._busy += 1
+        
+        if not pooled:
+            return self._timed(send, failed, key)
+        
+        primary = self._executor.submit(self._pooled, send, failed, key)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._reserve_hedge():
+            return primary.result()
+        
+        with self._lock:
+            self._busy += 1
+        hedged = self._executor.submit(self._pooled, hedge or send, failed, key, prepare_hedge)
+        pending = {primary, hedged}
+        error = None
+        failures = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                
+                result = future.result()
+                if failed and failed(result):
+                    failures.append(result)
+                    continue
+                
+                if future is hedged:
+                    with self._lock:
+                        self.hedges_won += 1
+                
+                # The slower request keeps running; release its result when it arrives
+                for loser in pending:
+                    loser.add_done_callback(lambda f: self._discard(f, close))
+                for lost in failures:
+                    if close:
+                        close(lost)
+                return result
+        
+        if not failures:
+            raise error
+        for lost in failures[:-1]:
+            if close:
+                close(lost)
+        return failures[-1]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return hedge counters and the current hedge delay of each kind of request"""
+        with self._lock:
+            keys = list(self._latencies)
+        delays = {str(key): self.hedge_delay(key) for key in keys}
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges_issued": self.hedges_issued,
+                "hedges_won": self.hedges_won,
+                "hedge_rate": round(self.hedges_issued / self.requests, 4) if self.requests else 0.0,
+                "hedge_delays": {key: round(delay, 3) for key, delay in delays.items() if delay is not None}
+            }
+    
+    def _reserve_hedge(self) -> bool:
+        """Count a hedge if the hedge rate cap allows another one"""
+        with self._lock:
+            if self.hedges_issued + 1 > self.max_hedge_rate * self.requests:
+                return False
+            self.hedges_issued += 1
+            return True
+    
+    def _timed(self, send: Callable[[], T], failed: Optional[Callable[[T], bool]] = None, key: Hashable = None,
+               prepare: Optional[Callable[[], Any]] = None) -> T:
+        """Run a request and record its latency if it succeeds; time spent in prepare is not counted"""
+        if prepare:
+            prepare()
+        started = time.monotonic()
+        result = send()
+        if not (failed and failed(result)):
+            with self._lock:
+                if key not in self._latencies:
+                    self._latencies[key] = deque(maxlen=self.window)
+                self._latencies[key].append(time.monotonic() - started)
+        return result
+    
+    def _pooled(self, send: Callable[[], T], failed: Optional[Callable[[T], bool]] = None, key: Hashable = None,
+                prepare: Optional[Callable[[], Any]] = None) -> T:
+        """Run a request on a pool worker, freeing the worker for the next call when it ends"""
+        try:
+            return self._timed(send, failed, key, prepare)
+        finally:
+            with self._lock:
+                self._busy -= 1
+    
+    @staticmethod
+    def _discard(future, close: Optional[Callable[[Any], None]]) -> None:
+        """Release the result of a request that lost the race"""
+        if close and future.exception() is None:
+            close(future.result())
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+def get_hedger() -> Optional[RequestHedger]:
+    """
+    Get the process-wide request hedger, or None if hedging is disabled
+    
+    Hedging is enabled with OPENAI_HEDGING=1; OPENAI_HEDGE_PERCENTILE (default 95)
+    and OPENAI_HEDGE_MAX_RATE (default 0.05) configure it.
+    """
+    global _hedger
+    
+    if os.environ.get("OPENAI_HEDGING", "").lower() not in ("1", "true", "yes"):
+        return None
+    
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = RequestHedger(
+                percentile=float(os.environ.get("OPENAI_HEDGE_PERCENTILE", "95")),
+                max_hedge_rate=float(os.environ.get("OPENAI_HEDGE_MAX_RATE", "0.05"))
+            )
+        return _hedger
@@ -0,0 +1,230 @@
+import re
+import json
+from typing import Dict, List, Any, Optional, Tuple
+
+class StructuredOutputError(ValueError):
+    """Raised when no JSON value can be recovered from a model response"""
+
+def object_schema(properties: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a strict-mode object schema: every property required, no others allowed
+    
+    Args:
+        properties: Schema of each property
+    
+    Returns:
+        JSON schema of the object
+    """
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+def _entity_list(*fields: str) -> Dict[str, Any]:
+    """Schema of an entity list whose items have string fields and a confidence"""
+    properties = {field: {"type": "string"} for field in fields}
+    properties["confidence"] = {"type": "number"}
+    return {"type": "array", "items": object_schema(properties)}
+
+# Entity lists shared by the entity extraction and combined enrichment calls;
+# unknown fields are returned as empty strings so callers can use .get(...).lower()
+ENTITY_SCHEMAS = {
+    "properties": _entity_list("address", "property_type", "size", "details"),
+    "people": _entity_list("name", "role", "company", "email", "phone"),
+    "companies": _entity_list("name", "type"),
+    "dates": _entity_list("date", "description"),
+    "financial_details": _entity_list("amount", "currency", "description"),
+    "action_items": _entity_list("action", "responsible", "deadline"),
+    "keywords": _entity_list("keyword"),
+}
+
+CATEGORY_FIELDS = {
+    "category": {"type": "string", "enum": ["Property", "Deal", "Meeting", "Task", "General"]},
+    "priority": {"type": "integer", "enum": [1, 2, 3, 4, 5]},
+    "explanation": {"type": "string"},
+}
+
+ENTITIES_SCHEMA = object_schema(ENTITY_SCHEMAS)
+
+CATEGORY_SCHEMA = object_schema(CATEGORY_FIELDS)
+
+ENRICHMENT_FIELDS = dict(ENTITY_SCHEMAS, summary={"type": "string"}, **CATEGORY_FIELDS)
+
+ENRICHMENT_SCHEMA = object_schema(ENRICHMENT_FIELDS)
+
+# Several emails enriched in one request, each result tagged with its message ID
+PACKED_ENRICHMENT_ITEM_SCHEMA = object_schema(dict(message_id={"type": "string"}, **ENRICHMENT_FIELDS))
+
+PACKED_ENRICHMENT_SCHEMA = object_schema({
+    "emails": {"type": "array", "items": PACKED_ENRICHMENT_ITEM_SCHEMA}
+})
+
+FOLLOW_UPS_SCHEMA = object_schema({
+    "follow_ups": {
+        "type": "array",
+        "items": object_schema({
+            "title": {"type": "string"},
+            "responsible": {"type": "string"},
+            "due_date": {"type": "string"}
+        })
+    }
+})
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the response_format of a chat completion constrained to a JSON schema
+    
+    Args:
+        name: Name of the schema
+        schema: Strict-mode JSON schema
+    
+    Returns:
+        Value for the "response_format" request field
+    """
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None),
+}
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Validate a value against the JSON schema subset used by the structured calls
+    
+    Supports type, enum, properties, required, additionalProperties and items.
+    
+    Args:
+        value: Parsed JSON value
+        schema: JSON schema
+        path: Location of the value, used in error messages
+    
+    Returns:
+        List of error messages, empty if the value is valid
+    """
+    types = schema.get("type")
+    if types:
+        types = [types] if isinstance(types, str) else types
+        # bool is an int subclass but never a valid number
+        if not any(isinstance(value, _TYPES[t]) and not (isinstance(value, bool) and t != "boolean") for t in types):
+            return [f"{path}: expected {'/'.join(types)}, got {type(value).__name__}"]
+    
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: {value!r} is not one of {schema['enum']}"]
+    
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{key}: unexpected property")
+    elif isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{index}]"))
+    
+    return errors
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+def repair_json(text: str, max_attempts: int = 50) -> Any:
+    """
+    Recover a JSON value from model output
+    
+    Handles code fences, prose around the JSON and output truncated at any
+    point: open strings and containers are closed, and incomplete trailing
+    elements are dropped.
+    
+    Args:
+        text: Model output
+        max_attempts: Maximum number of truncation points tried
+    
+    Returns:
+        The recovered JSON value
+    
+    Raises:
+        StructuredOutputError: If the text contains no recoverable JSON
+    """
+    text = text or ""
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        raise StructuredOutputError(f"No JSON found in response: {text[:100]!r}")
+    text = text[min(starts):]
+    
+    # Complete JSON followed by prose
+    try:
+        return json.JSONDecoder().raw_decode(text)[0]
+    except ValueError:
+        pass
+    
+    # Truncated JSON: remember where a prefix ends with a complete element
+    stack = []
+    cuts = []
+    in_string = escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            cuts.append((index + 1, list(stack)))
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            cuts.append((index + 1, list(stack)))
+        elif char == ",":
+            cuts.append((index, list(stack)))
+    
+    closed = text + ('"' if in_string else "")
+    candidates = [(len(closed), stack)] + list(reversed(cuts))
+    for end, open_containers in candidates[:max_attempts]:
+        candidate = closed[:end].rstrip().rstrip(",") + "".join(reversed(open_containers))
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    
+    raise StructuredOutputError(f"Could not repair JSON response: {text[:100]!r}")
+
+def parse_structured(content: Optional[str], schema: Dict[str, Any]) -> Tuple[Any, List[str]]:
+    """
+    Parse a structured response, repairing it if needed, and validate it
+    
+    Args:
+        content: Message content returned by the model
+        schema: JSON schema the response should match
+    
+    Returns:
+        Tuple of (parsed value, validation errors)
+    
+    Raises:
+        StructuredOutputError: If the content contains no recoverable JSON
+    """
+    try:
+        value = json.loads(content or "")
+    except ValueError:
+        value = repair_json(content)
+        print(f"Repaired malformed JSON response ({len(content or '')} chars)")
+    
+    return value, validate(value, schema)
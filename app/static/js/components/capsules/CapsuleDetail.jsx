@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import styled from 'styled-components';
 import { capsuleAPI, emailAPI } from '../../services/api';
@@ -263,6 +263,8 @@ const CapsuleDetail = () => {
   const [notes, setNotes] = useState('');
   const [savingNotes, setSavingNotes] = useState(false);
   const [selectedEmail, setSelectedEmail] = useState(null);
+  const [streamedSummary, setStreamedSummary] = useState(null);
+  const summaryStream = useRef(null);
   
   useEffect(() => {
     if (id) {
@@ -270,6 +272,9 @@ const CapsuleDetail = () => {
     }
   }, [id]);
   
+  // Stop a summary stream that is still running when leaving the page
+  useEffect(() => () => summaryStream.current && summaryStream.current.close(), []);
+  
   const fetchCapsule = async () => {
     setLoading(true);
     try {
@@ -313,6 +318,23 @@ const CapsuleDetail = () => {
     }
   };
   
+  const handleRegenerateSummary = () => {
+    setStreamedSummary('');
+    summaryStream.current = capsuleAPI.streamSummary(id, {
+      onDelta: (text) => setStreamedSummary((current) => current + text),
+      onDone: (summary) => {
+        summaryStream.current = null;
+        setStreamedSummary(null);
+        setCapsule((current) => ({ ...current, summary }));
+      },
+      onError: (error) => {
+        console.error('Failed to regenerate summary:', error);
+        summaryStream.current = null;
+        setStreamedSummary(null);
+      },
+    });
+  };
+  
   const handleAddEmail = () => {
     navigate(`/capsule/${id}/add-email`);
   };
@@ -377,8 +399,13 @@ const CapsuleDetail = () => {
       <CapsuleContent>
         <CapsuleMain>
           <CapsulesSection>
-            <SectionTitle>Summary</SectionTitle>
-            <p>{capsule.summary || 'No summary available.'}</p>
+            <SectionTitle>
+              Summary
+              <ActionButton onClick={handleRegenerateSummary} disabled={streamedSummary !== null}>
+                {streamedSummary !== null ? 'Generating...' : 'Regenerate'}
+              </ActionButton>
+            </SectionTitle>
+            <p>{streamedSummary !== null ? streamedSummary : (capsule.summary || 'No summary available.')}</p>
           </CapsulesSection>
           
           <CapsulesSection>
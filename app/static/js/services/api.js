@@ -31,6 +31,21 @@ export const capsuleAPI = {
   createCapsule: (data) => api.post('/api/capsules', data),
   updateCapsule: (id, data) => api.put(`/api/capsules/${id}`, data),
   deleteCapsule: (id) => api.delete(`/api/capsules/${id}`),
+  // Regenerates the summary, calling onDelta with each piece of text as it arrives;
+  // returns the EventSource so the caller can close it
+  streamSummary: (id, { onDelta, onDone, onError }) => {
+    const source = new EventSource(`/api/capsules/${id}/summary/stream`);
+    source.onmessage = (event) => onDelta(JSON.parse(event.data).delta);
+    source.addEventListener('done', (event) => {
+      source.close();
+      onDone(JSON.parse(event.data).summary);
+    });
+    source.addEventListener('error', (event) => {
+      source.close();
+      onError(event.data ? JSON.parse(event.data).error : 'Connection lost');
+    });
+    return source;
+  },
 };
 
 export default api; 
\ No newline at end of file
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+LLM Cost and Latency Report CLI
+
+This script aggregates the LLM call ledger by day and call site, showing
+where tokens, money and time go.
+
+Usage:
+    python llm_report.py [--days=7] [--source=mongo|file] [--path=.cache/llm_calls.jsonl] [--json]
+
+Options:
+    --days      Number of days to report, including today (default: 7)
+    --source    Read the llm_calls collection ("mongo") or a ledger file ("file")
+                (default: "file" if LLM_LEDGER is "file", otherwise "mongo")
+    --path      Ledger file read with --source=file, and with --source=mongo for
+                the calls written there while MongoDB failed (default:
+                LLM_LEDGER_PATH or .cache/llm_calls.jsonl)
+    --json      Print the rows as JSON instead of a table
+"""
+
+import os
+import sys
+import json
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.llm_ledger import aggregate_collection, aggregate_entries, read_entries, report_since
+
+def print_table(rows):
+    """Print report rows as a fixed-width table with a total line"""
+    header = (f"{'Day':<10}  {'Call site':<44} {'Calls':>6} {'Errors':>6} {'Cached':>6} {'Retries':>7} "
+              f"{'Prompt tok':>11} {'Compl tok':>10} {'Avg ms':>7} {'Max ms':>7} {'Cost USD':>9}")
+    print(header)
+    print("-" * len(header))
+    
+    for row in rows:
+        print(f"{row['day']:<10}  {row['call_site'][:44]:<44} {row['calls']:>6} {row['errors']:>6} "
+              f"{row['cache_hits']:>6} {row['retries']:>7} {row['prompt_tokens']:>11} "
+              f"{row['completion_tokens']:>10} {row['latency_ms_avg']:>7} {row['latency_ms_max']:>7} "
+              f"{row['cost_usd']:>9.4f}")
+    
+    print("-" * len(header))
+    print(f"{'Total':<56} {sum(row['calls'] for row in rows):>6} {sum(row['errors'] for row in rows):>6} "
+          f"{sum(row['cache_hits'] for row in rows):>6} {sum(row['retries'] for row in rows):>7} "
+          f"{sum(row['prompt_tokens'] for row in rows):>11} {sum(row['completion_tokens'] for row in rows):>10} "
+          f"{'':>7} {'':>7} {sum(row['cost_usd'] for row in rows):>9.4f}")
+    
+    unpriced = sum(row["unpriced_calls"] for row in rows)
+    if unpriced:
+        print(f"{unpriced} calls used models without a known price and are not included in the cost")
+
+def main():
+    """Main entry point for the LLM report script"""
+    # Parse command line arguments
+    default_source = "file" if os.environ.get("LLM_LEDGER", "").lower() == "file" else "mongo"
+    default_path = os.environ.get("LLM_LEDGER_PATH") or os.path.join(".cache", "llm_calls.jsonl")
+    
+    parser = argparse.ArgumentParser(description="LLM cost and latency report")
+    parser.add_argument("--days", type=int, default=7, help="Number of days to report, including today (default: 7)")
+    parser.add_argument("--source", choices=["mongo", "file"], default=default_source, help="Where the ledger is stored")
+    parser.add_argument("--path", default=default_path,
+                        help="Ledger file read with --source=file, and with --source=mongo if it exists")
+    parser.add_argument("--json", action="store_true", help="Print the rows as JSON")
+    args = parser.parse_args()
+    
+    since = report_since(args.days)
+    if args.source == "mongo":
+        from app.services.db_utils import db_connection
+        
+        db_connection.connect()
+        # The ledger appends to the file whatever MongoDB did not take
+        entries = None
+        if os.path.exists(args.path):
+            print(f"Including the calls written to {args.path} while MongoDB was unavailable", file=sys.stderr)
+            entries = read_entries(args.path)
+        rows = aggregate_collection(db_connection.get_collection("llm_calls"), since, entries)
+    else:
+        rows = aggregate_entries(read_entries(args.path), since)
+    
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    elif not rows:
+        print(f"No LLM calls recorded since {since:%Y-%m-%d}")
+    else:
+        print_table(rows)
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,24 @@ into capsules. It can be run as a one-time process or as a continuous background
 
 Usage:
     python process_emails.py [--continuous] [--interval=300] [--max-emails=10]
+    python process_emails.py --backfill [--query="newer_than:1y"] [--max-emails=1000] [--batch]
+    python process_emails.py --enrich-pending
+    python process_emails.py --train-classifier
 
 Options:
     --continuous    Run continuously at specified intervals
     --interval      Time between processing runs in seconds (default: 300)
-    --max-emails    Maximum number of emails to process in each run (default: 10)
+    --max-emails    Maximum number of emails to process in each run (default: 10;
+                    a backfill has no limit unless one is given, 0 also means none)
+    --backfill      Import all historical emails matching --query, page by page
+    --query         Gmail search query used by --backfill (default: "newer_than:1y")
+    --batch         With --backfill, enrich emails through the OpenAI Batch API
+                    instead of interactive calls
+    --enrich-pending  Submit batch jobs for stored emails still awaiting enrichment
+    --poll-interval Seconds between batch status checks (default: 60)
+    --train-classifier  Train the local categorization and follow-up classifier
+                    from stored emails (CLASSIFIER_CONFIDENCE_THRESHOLD sets
+                    the confidence needed to skip the LLM)
 """
 
 import os
@@ -28,31 +41,76 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.services.email_pipeline import EmailPipeline
 
+# Emails processed per regular run when --max-emails is not given
+DEFAULT_MAX_EMAILS = 10
+
 def main():
     """Main entry point for the email processing script"""
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Email Processing Pipeline")
     parser.add_argument("--continuous", action="store_true", help="Run continuously at specified intervals")
     parser.add_argument("--interval", type=int, default=300, help="Time between processing runs in seconds (default: 300)")
-    parser.add_argument("--max-emails", type=int, default=10, help="Maximum number of emails to process in each run (default: 10)")
+    parser.add_argument("--max-emails", type=int, default=None,
+                        help=f"Maximum number of emails to process in each run (default: {DEFAULT_MAX_EMAILS}, "
+                             "no limit with --backfill)")
+    parser.add_argument("--backfill", action="store_true", help="Import historical emails matching --query")
+    parser.add_argument("--query", default="newer_than:1y", help="Gmail search query for --backfill (default: newer_than:1y)")
+    parser.add_argument("--batch", action="store_true", help="With --backfill, enrich emails through the OpenAI Batch API")
+    parser.add_argument("--enrich-pending", action="store_true", help="Batch-enrich stored emails awaiting enrichment")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between batch status checks (default: 60)")
+    parser.add_argument("--train-classifier", action="store_true", help="Train the local classifier from stored emails")
     args = parser.parse_args()
     
     # Initialize the email pipeline
     pipeline = EmailPipeline()
     
+    # Training only reads stored emails and does not need Gmail access
+    if args.train_classifier:
+        print("Training the local email classifier from stored emails")
+        result = pipeline.train_classifier()
+        
+        if result["success"]:
+            print(f"Trained on {result['examples']}, saved to {result['model_path']}")
+        else:
+            print(f"Error training classifier: {result.get('error', 'Unknown error')}")
+        return
+    
     # Check if Gmail service is authenticated
     if not pipeline.is_authenticated():
         print("Gmail service is not authenticated.")
         print("Please run the web application and authenticate with Gmail first.")
         sys.exit(1)
     
-    # Run the pipeline
-    if args.continuous:
-        print(f"Running email processing pipeline continuously (interval: {args.interval}s, max emails: {args.max_emails})")
-        pipeline.run_continuous(args.interval, args.max_emails)
+    # Run the pipeline; only a backfill runs without a limit by default
+    max_emails = args.max_emails if args.max_emails is not None else DEFAULT_MAX_EMAILS
+    if args.enrich_pending:
+        print("Enriching pending emails through the OpenAI Batch API")
+        result = pipeline.enrich_pending(poll_interval=args.poll_interval)
+        
+        if result["success"]:
+            print(f"Successfully enriched {result['processed_emails']} emails ({result['pending_emails']} still pending)")
+            print(f"Created {result['created_capsules']} capsules")
+        else:
+            print(f"Error enriching emails: {result.get('error', 'Unknown error')}")
+    elif args.backfill:
+        limit = args.max_emails if args.max_emails and args.max_emails > 0 else None
+        print(f"Backfilling emails matching '{args.query}' (limit: {limit or 'none'}, batch: {args.batch})")
+        if args.batch:
+            result = pipeline.batch_backfill(query=args.query, limit=limit, poll_interval=args.poll_interval)
+        else:
+            result = pipeline.backfill(query=args.query, limit=limit)
+        
+        if result["success"]:
+            print(f"Successfully processed {result['processed_emails']} emails")
+            print(f"Created {result['created_capsules']} capsules")
+        else:
+            print(f"Error backfilling emails: {result.get('error', 'Unknown error')}")
+    elif args.continuous:
+        print(f"Running email processing pipeline continuously (interval: {args.interval}s, max emails: {max_emails})")
+        pipeline.run_continuous(args.interval, max_emails)
     else:
-        print(f"Running email processing pipeline once (max emails: {args.max_emails})")
-        result = pipeline.process_emails(args.max_emails)
+        print(f"Running email processing pipeline once (max emails: {max_emails})")
+        result = pipeline.process_emails(max_emails)
         
         if result["success"]:
             print(f"Successfully processed {result['processed_emails']} emails")
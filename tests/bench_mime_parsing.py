@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark for Gmail message parsing
+
+This script compares the two ways of turning a Gmail API message into email data:
+1. format='full': Gmail's JSON MIME tree parsed by GmailService._parse_message
+2. format='raw': the RFC 2822 bytes parsed locally by mime_parser.parse_raw_message
+
+Both paths are timed from the JSON response text, so the cost of decoding
+the API payload is included. The corpus is synthetic and built in memory.
+
+Usage:
+    python -m tests.bench_mime_parsing [--iterations N]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+from email.message import EmailMessage
+
+# Add project root to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.gmail_service import GmailService
+from app.services.mime_parser import parse_raw_message
+
+def _b64(data):
+    """Encode bytes the way the Gmail API does (base64url without padding)"""
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def build_corpus():
+    """Build a list of synthetic CRE emails covering the common MIME shapes"""
+    corpus = []
+    
+    # Plain text only
+    msg = EmailMessage()
+    msg["Subject"] = "LOI for 123 Main Street"
+    msg["From"] = "broker@example.com"
+    msg["To"] = "investor@example.com"
+    msg["Date"] = "Mon, 6 Jan 2025 10:00:00 -0500"
+    msg.set_content("Please find the LOI terms below.\n" * 40)
+    corpus.append(msg)
+    
+    # multipart/alternative with a latin-1 plain part
+    msg = EmailMessage()
+    msg["Subject"] = "Café lease renewal"
+    msg["From"] = "landlord@example.com"
+    msg["To"] = "tenant@example.com"
+    msg["Date"] = "Tue, 7 Jan 2025 09:30:00 -0500"
+    msg.set_content("Renewal for the café at 45 Rue Élysée.\n" * 60, charset="latin-1")
+    msg.add_alternative("<html><body>" + "<p>Renewal for the café.</p>" * 60 + "</body></html>", subtype="html")
+    corpus.append(msg)
+    
+    # Text with CSV and PDF attachments
+    msg = EmailMessage()
+    msg["Subject"] = "Rent roll and OM"
+    msg["From"] = "analyst@example.com"
+    msg["To"] = "team@example.com"
+    msg["Date"] = "Wed, 8 Jan 2025 14:15:00 -0500"
+    msg.set_content("Attached are the rent roll and the offering memorandum.")
+    rent_roll = "unit,tenant,rent\n" + "".join(f"{i},Tenant {i},{1000 + i}\n" for i in range(2000))
+    msg.add_attachment(rent_roll.encode("utf-8"), maintype="text", subtype="csv", filename="rent_roll.csv")
+    msg.add_attachment(os.urandom(256 * 1024), maintype="application", subtype="pdf", filename="om.pdf")
+    corpus.append(msg)
+    
+    # Newsletter with a large HTML body
+    msg = EmailMessage()
+    msg["Subject"] = "Weekly market report"
+    msg["From"] = "news@example.com"
+    msg["To"] = "investor@example.com"
+    msg["Date"] = "Thu, 9 Jan 2025 07:00:00 -0500"
+    msg.set_content("View this report in your browser.")
+    rows = "".join(f"<tr><td>Deal {i}</td><td>${i * 1000:,}</td></tr>" for i in range(5000))
+    msg.add_alternative(f"<html><body><table>{rows}</table></body></html>", subtype="html", charset="utf-8")
+    corpus.append(msg)
+    
+    return corpus
+
+def to_full_payload(part, part_id=""):
+    """Convert an email.message part into a Gmail format='full' payload"""
+    payload = {
+        "partId": part_id,
+        "mimeType": part.get_content_type(),
+        "filename": part.get_filename() or "",
+        "headers": [{"name": name, "value": str(value)} for name, value in part.items()],
+    }
+    
+    if part.is_multipart():
+        payload["body"] = {"size": 0}
+        payload["parts"] = [
+            to_full_payload(child, f"{part_id}.{index}" if part_id else str(index))
+            for index, child in enumerate(part.iter_parts())
+        ]
+    else:
+        data = part.get_payload(decode=True) or b""
+        if part.get_filename():
+            # Gmail returns attachment bodies separately
+            payload["body"] = {"size": len(data), "attachmentId": f"att-{part_id}"}
+        else:
+            payload["body"] = {"size": len(data), "data": _b64(data)}
+    
+    return payload
+
+def build_responses(corpus):
+    """Serialize each message as both a format='full' and a format='raw' API response"""
+    full_responses = []
+    raw_responses = []
+    
+    for index, msg in enumerate(corpus):
+        common = {"id": f"msg-{index}", "threadId": f"thread-{index}", "snippet": "", "labelIds": ["INBOX"]}
+        full_responses.append(json.dumps(dict(common, payload=to_full_payload(msg))))
+        raw_responses.append(json.dumps(dict(common, raw=_b64(msg.as_bytes()))))
+    
+    return full_responses, raw_responses
+
+def time_parser(responses, parse, iterations):
+    """Return the mean time in milliseconds to decode and parse one response"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for response in responses:
+            parse(json.loads(response))
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000 / (iterations * len(responses))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Gmail message parsing")
+    parser.add_argument("--iterations", type=int, default=50, help="Passes over the corpus per parser")
+    args = parser.parse_args()
+    
+    corpus = build_corpus()
+    full_responses, raw_responses = build_responses(corpus)
+    
+    # _parse_message does not touch instance state
+    gmail_service = GmailService.__new__(GmailService)
+    
+    full_bytes = sum(len(r) for r in full_responses)
+    raw_bytes = sum(len(r) for r in raw_responses)
+    full_ms = time_parser(full_responses, gmail_service._parse_message, args.iterations)
+    raw_ms = time_parser(raw_responses, parse_raw_message, args.iterations)
+    
+    print(f"Messages: {len(corpus)}, iterations: {args.iterations}")
+    print(f"format='full': {full_ms:.3f} ms/message, {full_bytes / 1024:.1f} KiB of JSON")
+    print(f"format='raw':  {raw_ms:.3f} ms/message, {raw_bytes / 1024:.1f} KiB of JSON")
+    
+    # Per-message breakdown; attachments weigh on the raw path, which carries their bodies inline
+    for msg, full, raw in zip(corpus, full_responses, raw_responses):
+        full_ms = time_parser([full], gmail_service._parse_message, args.iterations)
+        raw_ms = time_parser([raw], parse_raw_message, args.iterations)
+        print(f"  {msg['Subject']:<28} full {full_ms:8.3f} ms   raw {raw_ms:8.3f} ms")
+    
+    # The raw parser must see the same headers and text as the full parser
+    for full, raw in zip(full_responses, raw_responses):
+        full_data = gmail_service._parse_message(json.loads(full))
+        raw_data = parse_raw_message(json.loads(raw))
+        for key in ("subject", "from", "to", "date"):
+            assert full_data[key] == raw_data[key], (key, full_data[key], raw_data[key])
+        assert [a["filename"] for a in full_data["attachments"]] == [a["filename"] for a in raw_data["attachments"]]
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Shared stand-ins for the test scripts.
+
+StandInServer is a local HTTP server whose responses come from a handler
+function, used in place of the OpenAI API; StandInTestCase runs one for
+all tests of a class. FakeClock replaces a module's "time" import, and
+FakeCondition a condition variable, so that waits advance a simulated
+clock instead of blocking.
+"""
+
+import json
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, Tuple
+
+from app.services.openai_transport import OpenAITransport
+
+def chat_completion(content: str, finish_reason: str = "stop", **fields: Any) -> Dict[str, Any]:
+    """Build a chat completion response body with a single choice"""
+    body = {"choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": content},
+        "finish_reason": finish_reason
+    }]}
+    body.update(fields)
+    return body
+
+class StandInRequest:
+    """Request received by a StandInServer"""
+    
+    def __init__(self, method: str, path: str, headers: Any, body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+    
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Passes each request to the server's handler function and sends its response"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        self._respond()
+    
+    def do_POST(self):
+        self._respond()
+    
+    def _respond(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        request = StandInRequest(self.command, self.path, self.headers, body)
+        stand_in = self.server.stand_in
+        with stand_in.lock:
+            stand_in.requests.append(request)
+        
+        status, payload, *rest = stand_in.handler(request)
+        headers = dict(rest[0]) if rest else {}
+        
+        if isinstance(payload, (dict, list)):
+            headers.setdefault("Content-Type", "application/json")
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        
+        if isinstance(payload, bytes):
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        
+        # Any other payload is an iterable of pieces, each sent as its own chunk
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in payload:
+            data = piece.encode("utf-8") if isinstance(piece, str) else piece
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+    
+    def log_message(self, format, *args):
+        pass
+
+class StandInServer:
+    """
+    Local HTTP server answering every request with a handler function
+    
+    The handler is called with a StandInRequest and returns (status, payload)
+    or (status, payload, headers). Dict and list payloads are sent as JSON,
+    str and bytes as they are, and any other iterable as a chunked response,
+    one chunk per item.
+    """
+    
+    def __init__(self, handler: Callable[[StandInRequest], Tuple]):
+        self.handler = handler
+        self.requests = []
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        self._server.stand_in = self
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+    
+    def transport(self) -> OpenAITransport:
+        """Create a transport sending OpenAI API requests to this server"""
+        return OpenAITransport(base_url=self.base_url)
+    
+    def start(self) -> "StandInServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+    
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+class StandInTestCase(unittest.TestCase):
+    """Test case running a StandInServer for all its tests; subclasses define the handle classmethod"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Start the stand-in server"""
+        cls.server = StandInServer(cls.handle).start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the stand-in server"""
+        cls.server.stop()
+    
+    @classmethod
+    def handle(cls, request: StandInRequest) -> Tuple:
+        raise NotImplementedError
+
+class FakeClock:
+    """Simulated clock providing the time functions the services use"""
+    
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+        self.sleeps = []
+    
+    def monotonic(self) -> float:
+        return self.now
+    
+    def time(self) -> float:
+        return self.now
+    
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+    
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+class FakeCondition:
+    """Condition variable whose waits advance a FakeClock instead of blocking"""
+    
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def wait(self, timeout: float) -> None:
+        self.clock.sleep(timeout)
+    
+    def notify_all(self) -> None:
+        pass
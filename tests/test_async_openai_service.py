@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script for the asyncio OpenAI client
+
+This script tests AsyncOpenAIService by:
+1. Returning one result or error per item, in input order, when some calls fail
+2. Never running more than max_concurrency calls at a time
+3. Running batches from synchronous code with run_batch, and refusing to
+   block a running event loop
+4. Keeping one semaphore per event loop while loops in several threads use
+   the service
+
+Usage:
+    python -m tests.test_async_openai_service
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.async_openai_service import AsyncOpenAIService
+
+class _OpenAIService:
+    """Blocking service whose enrich_email fails for some subjects and tracks concurrency"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    def enrich_email(self, email_text, email_subject="", model="gpt-4o-mini"):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.02)
+            if email_subject.startswith("bad"):
+                raise ValueError(f"Cannot enrich {email_subject}")
+            return {"summary": email_text.upper()}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+class TestAsyncOpenAIService(unittest.TestCase):
+    """Test cases for gather_batch and run_batch"""
+    
+    def setUp(self):
+        """Create an async service with two concurrent calls"""
+        self.openai_service = _OpenAIService()
+        self.service = AsyncOpenAIService(self.openai_service, max_concurrency=2)
+    
+    def test_errors_are_isolated(self):
+        """A failing call is reported in its slot and does not cancel the others"""
+        items = [("a", "ok 1"), ("b", "bad 2"), ("c", "ok 3"), ("d", "bad 4"), ("e", "ok 5")]
+        
+        results = asyncio.run(self.service.gather_batch(
+            items, lambda item: self.service.enrich_email(item[0], item[1])
+        ))
+        
+        self.assertEqual([result.get("result") for result in results],
+                         [{"summary": "A"}, None, {"summary": "C"}, None, {"summary": "E"}])
+        self.assertIsInstance(results[1]["error"], ValueError)
+        self.assertIn("bad 4", str(results[3]["error"]))
+    
+    def test_concurrency_is_bounded(self):
+        """No more than max_concurrency calls run at once"""
+        items = [(str(index), f"ok {index}") for index in range(8)]
+        
+        results = self.service.run_batch(items, lambda item: self.service.enrich_email(item[0], item[1]))
+        
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all("result" in result for result in results))
+        self.assertLessEqual(self.openai_service.max_in_flight, 2)
+    
+    def test_run_batch_in_running_loop(self):
+        """run_batch refuses to block a running event loop"""
+        async def nested():
+            with self.assertRaises(RuntimeError):
+                self.service.run_batch([("a", "ok")], lambda item: self.service.enrich_email(*item))
+            return await self.service.gather_batch([("a", "ok")], lambda item: self.service.enrich_email(*item))
+        
+        self.assertEqual(asyncio.run(nested()), [{"result": {"summary": "A"}}])
+    
+    def test_semaphore_per_loop(self):
+        """Loops in different threads each keep their own semaphore"""
+        semaphores = {}
+        barrier = threading.Barrier(2)
+        
+        def run(name):
+            async def main():
+                first = self.service._semaphore()
+                barrier.wait(1)
+                await self.service.enrich_email("x", "ok")
+                barrier.wait(1)
+                semaphores[name] = (first, self.service._semaphore())
+            asyncio.run(main())
+        
+        threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(set(semaphores), {"a", "b"})
+        self.assertTrue(all(first is second for first, second in semaphores.values()))
+        self.assertIsNot(semaphores["a"][0], semaphores["b"][0])
+
+if __name__ == "__main__":
+    unittest.main()
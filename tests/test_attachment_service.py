@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test script for the attachment service
+
+This script tests AttachmentService by:
+1. Decoding unpadded base64url attachment bodies chunk by chunk to the same bytes
+   as a single decode
+2. Storing identical attachments of different emails as one file
+3. Extracting the visible text of HTML attachments
+
+Usage:
+    python -m tests.test_attachment_service
+"""
+
+import os
+import sys
+import base64
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.attachment_service import AttachmentService
+
+class _Collection:
+    """In-memory collection supporting the updates used by AttachmentService"""
+    
+    def __init__(self):
+        self.docs = {}
+    
+    def find_one(self, query, projection=None):
+        return self.docs.get(query["_id"])
+    
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query.get("_id"))
+        if doc is None:
+            if not upsert:
+                return
+            doc = dict(query, **update.get("$setOnInsert", {}))
+            self.docs[query["_id"]] = doc
+        for key, value in update.get("$addToSet", {}).items():
+            if value not in doc.setdefault(key, []):
+                doc[key].append(value)
+
+class _Gmail:
+    """Gmail service returning attachment bodies without base64 padding"""
+    
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.downloads = 0
+    
+    def get_attachment(self, message_id, attachment_id):
+        self.downloads += 1
+        data = base64.urlsafe_b64encode(self.bodies[attachment_id]).decode("ascii").rstrip("=")
+        return {"data": data, "size": len(self.bodies[attachment_id])}
+
+class TestAttachmentService(unittest.TestCase):
+    """Test cases for AttachmentService downloads and text extraction"""
+    
+    def setUp(self):
+        """Create a service storing files in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.gmail = _Gmail({
+            "csv": b"address,size\n12 Main St,4000 SF\n" * 50 + b"end",
+            "html": b"<html><style>p {}</style><body><p>Suite 400</p>\n\n\n<p>is   available</p></body></html>"
+        })
+        
+        # Without a database: collections are in memory
+        self.service = AttachmentService.__new__(AttachmentService)
+        self.service.gmail_service = self.gmail
+        self.service.storage_dir = self.tmp_dir
+        self.service.max_text_chars = 20000
+        self.service.attachments_collection = _Collection()
+        self.service.emails_collection = _Collection()
+        
+        # Small chunks so a body spans many of them
+        self.service.CHUNK_CHARS = 16
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_chunked_decode(self):
+        """Chunked decoding of an unpadded body gives the original bytes and hash"""
+        body = self.gmail.bodies["csv"]
+        data = self.gmail.get_attachment("m1", "csv")["data"]
+        
+        content_hash, size, tmp_path = self.service._write_chunks(data)
+        
+        with open(tmp_path, "rb") as f:
+            self.assertEqual(f.read(), body)
+        self.assertEqual((content_hash, size), (hashlib.sha256(body).hexdigest(), len(body)))
+    
+    def test_identical_attachments_share_a_file(self):
+        """The same file attached to two emails is stored once and linked to both"""
+        for message_id in ("m1", "m2"):
+            attachment = {"attachment_id": "csv", "filename": "rent_roll.csv", "mime_type": "text/csv"}
+            stored = self.service.download(message_id, attachment, update_email=False)
+        
+        self.assertEqual(stored["message_ids"], ["m1", "m2"])
+        self.assertTrue(stored["text"].startswith("address,size\n12 Main St"))
+        files = [name for _, _, names in os.walk(self.tmp_dir) for name in names]
+        self.assertEqual(files, [attachment["content_hash"]])
+    
+    def test_html_text(self):
+        """Markup, styles and runs of whitespace are removed from HTML attachments"""
+        attachment = {"attachment_id": "html", "filename": "listing.html", "mime_type": "text/html"}
+        stored = self.service.download("m1", attachment, update_email=False)
+        
+        self.assertEqual(stored["text"], "Suite 400 \n\n is available")
+
+if __name__ == "__main__":
+    unittest.main()
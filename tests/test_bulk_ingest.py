@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script for bulk email ingest
+
+This script tests the bulk ingest path of EmailProcessor by:
+1. Checking all candidate message IDs with a single $in query
+2. Storing emails with one unordered insert_many
+3. Skipping emails another run inserted first, as reported by the unique index
+
+Usage:
+    python -m tests.test_bulk_ingest
+"""
+
+import os
+import sys
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import BulkWriteError
+
+from app.models.email import EmailModel
+from app.services.email_processor import EmailProcessor
+
+class _EmailsCollection:
+    """In-memory emails collection with a unique message_id index"""
+    
+    def __init__(self, message_ids=()):
+        self.docs = [{"message_id": message_id} for message_id in message_ids]
+        self.queries = []
+        self.insert_calls = 0
+    
+    def find(self, query, projection=None):
+        self.queries.append((query, projection))
+        wanted = set(query["message_id"]["$in"])
+        return [{"message_id": doc["message_id"]} for doc in self.docs if doc["message_id"] in wanted]
+    
+    def insert_many(self, docs, ordered=True):
+        self.insert_calls += 1
+        stored = {doc["message_id"] for doc in self.docs}
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc["message_id"] in stored:
+                errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"})
+                if ordered:
+                    break
+                continue
+            stored.add(doc["message_id"])
+            self.docs.append(doc)
+        
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+
+def _email(message_id):
+    """Build a minimal email model"""
+    return EmailModel(message_id=message_id, thread_id="t1", sender={"name": "Dana", "email": "dana@example.com"},
+                      recipients=[], subject="New listing", body_text="Suite 400 is available.")
+
+class TestBulkIngest(unittest.TestCase):
+    """Test cases for EmailProcessor deduplication and bulk inserts"""
+    
+    def setUp(self):
+        """Create a processor around an in-memory emails collection"""
+        self.collection = _EmailsCollection(["m1", "m3"])
+        
+        # Only the emails collection is used by the methods under test
+        self.processor = EmailProcessor.__new__(EmailProcessor)
+        self.processor.emails_collection = self.collection
+    
+    def test_filter_new_ids(self):
+        """One projected $in query finds the stored IDs; order is kept and repeats dropped"""
+        new_ids = self.processor._filter_new_ids(["m4", "m1", "m2", "m4", None, "m3"])
+        
+        self.assertEqual(new_ids, ["m4", "m2"])
+        self.assertEqual(len(self.collection.queries), 1)
+        self.assertEqual(self.collection.queries[0][1], {"message_id": 1, "_id": 0})
+        
+        self.assertEqual(self.processor._filter_new_ids([]), [])
+        self.assertEqual(len(self.collection.queries), 1)
+    
+    def test_store_emails(self):
+        """All emails go out in one insert; duplicates from a concurrent run are skipped"""
+        stored = self.processor._store_emails([_email("m2"), _email("m3"), _email("m4")])
+        
+        self.assertEqual(stored, ["m2", "m4"])
+        self.assertEqual(self.collection.insert_calls, 1)
+        self.assertEqual([doc["message_id"] for doc in self.collection.docs], ["m1", "m3", "m2", "m4"])
+    
+    def test_other_write_errors_are_raised(self):
+        """Write errors other than duplicate keys are not swallowed"""
+        def failing_insert(docs, ordered=True):
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+        
+        self.collection.insert_many = failing_insert
+        with self.assertRaises(BulkWriteError):
+            self.processor._store_emails([_email("m5")])
+
+if __name__ == "__main__":
+    unittest.main()
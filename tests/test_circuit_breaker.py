@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for the OpenAI circuit breaker
+
+This script tests the circuit breaker by:
+1. Opening the circuit after consecutive failures
+2. Failing calls fast while the circuit is open
+3. Letting a single probe through once the recovery timeout has passed
+4. Short-circuiting OpenAIService calls against a failing local stand-in
+5. Freeing the probe of a call that fails for reasons other than the API
+
+Usage:
+    python -m tests.test_circuit_breaker
+"""
+
+import os
+import sys
+import time
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.openai_service import OpenAIService
+from app.services.rate_limiter import AdaptiveRateLimiter
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tests.helpers import StandInTestCase, chat_completion
+
+class _BrokenTransport:
+    """Transport failing before any request is sent"""
+    
+    def post(self, path, api_key, data, stream=False):
+        raise ValueError("Request body is not serializable")
+
+class TestCircuitBreaker(StandInTestCase):
+    """Test cases for CircuitBreaker"""
+    
+    # Whether the stand-in answers successfully or with 503
+    healthy = False
+    
+    @classmethod
+    def handle(cls, request):
+        """Answer chat completions, failing with 503 until healthy is set"""
+        if cls.healthy:
+            return 200, chat_completion("Done")
+        return 503, {"error": {"message": "Service unavailable"}}
+    
+    def test_opens_after_failures(self):
+        """Consecutive failures open the circuit; a success resets the count"""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+        
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual(breaker.stats()["short_circuited"], 1)
+    
+    def test_half_open_probe(self):
+        """After the timeout one probe goes through and decides the next state"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        # A failed probe opens the circuit again
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()["opened"], 2)
+    
+    def test_service_fails_fast(self):
+        """Once open, OpenAIService raises CircuitOpenError without calling the API"""
+        type(self).healthy = False
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.2)
+        service = OpenAIService(transport=self.server.transport(), rate_limiter=AdaptiveRateLimiter(),
+                                circuit_breaker=breaker, cache=None, ledger=None)
+        service.api_key = "test-key"
+        
+        for _ in range(2):
+            self.assertEqual(service._post_chat_completion({"messages": []}).status_code, 503)
+        
+        requests_before = len(self.server.requests)
+        started = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            service.categorize_email("Please review the lease.", "Lease")
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(len(self.server.requests), requests_before)
+        
+        # The API recovers; the probe after the timeout closes the circuit
+        type(self).healthy = True
+        time.sleep(0.25)
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        self.assertEqual(service.circuit_stats()["state"], CircuitBreaker.CLOSED)
+    
+    def test_probe_released_on_local_error(self):
+        """A probe that fails without reaching the API leaves the circuit half-open for the next one"""
+        type(self).healthy = True
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        service = OpenAIService(transport=_BrokenTransport(), rate_limiter=AdaptiveRateLimiter(),
+                                circuit_breaker=breaker, cache=None, ledger=None)
+        service.api_key = "test-key"
+        breaker.record_failure()
+        time.sleep(0.06)
+        
+        with self.assertRaises(ValueError):
+            service._post_chat_completion({"messages": []})
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        
+        service.transport = self.server.transport()
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test script for the local email classifier
+
+This script tests the classifier cascade by:
+1. Selecting training labels from stored email documents
+2. Training category, priority and follow-up models
+3. Answering confident cases locally and escalating the rest
+4. Saving and loading the trained models, and keeping them when retraining fails
+5. Storing the LLM's follow-up answers as training labels
+
+Usage:
+    python -m tests.test_email_classifier
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.email_classifier import EmailClassifier, LOCAL_EXPLANATION
+from app.services.follow_up_service import FollowUpService
+from app.models.email import EmailModel
+
+def _doc(subject, body, category, priority, follow_up_label):
+    """Build an email document as stored by EmailProcessor and FollowUpService"""
+    return {
+        "subject": subject,
+        "body_text": body,
+        "category": category,
+        "priority": priority,
+        "category_explanation": "Explained by the LLM",
+        "enrichment_status": "complete",
+        "follow_up_label": follow_up_label
+    }
+
+TRAINING_DOCS = [
+    _doc(f"Thanks {n}", "Thanks, got it. Have a great weekend!", "General", 5, "no")
+    for n in range(30)
+] + [
+    _doc(f"LOI for {n} Main Street", f"Please review the attached LOI for {n} Main Street and send comments "
+         "by Friday. The purchase price is $4.2M with a 60 day due diligence period.",
+         "Deal", 1, "yes")
+    for n in range(30)
+]
+
+class _Collection:
+    """In-memory emails collection recording updates"""
+    
+    def __init__(self):
+        self.updates = []
+    
+    def update_one(self, query, update):
+        self.updates.append((query, update))
+
+class _OpenAIService:
+    """OpenAI service whose follow-up detection returns fixed tasks"""
+    
+    def __init__(self, tasks):
+        self.tasks = tasks
+    
+    def detect_follow_ups(self, email_text, email_subject="", sender=""):
+        return self.tasks
+
+class TestEmailClassifier(unittest.TestCase):
+    """Test cases for EmailClassifier"""
+    
+    def setUp(self):
+        """Train a classifier on the synthetic documents"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.tmp_dir, "classifier.json")
+        self.classifier = EmailClassifier(self.model_path, threshold=0.8, min_examples=20)
+        self.examples = self.classifier.train(TRAINING_DOCS)
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_training_labels(self):
+        """Only LLM labels of fully enriched emails are learned from"""
+        doc = _doc("Hi", "Body", "Deal", 2, None)
+        self.assertEqual(EmailClassifier.training_labels(doc), {"category": "Deal", "priority": "2"})
+        
+        for override in ({"category_explanation": "Default categorization"},
+                         {"category_explanation": f"{LOCAL_EXPLANATION} (confidence 0.95)"},
+                         {"enrichment_status": "pending"}):
+            self.assertEqual(EmailClassifier.training_labels(dict(doc, **override)), {})
+        
+        # The follow-up label comes from the follow-up LLM call, not from enrichment
+        pending = dict(doc, enrichment_status="pending", follow_up_label="no")
+        self.assertEqual(EmailClassifier.training_labels(pending), {"follow_up": "no"})
+    
+    def test_confident_answers(self):
+        """Easy emails are answered locally"""
+        self.assertEqual(self.examples, {"category": 60, "priority": 60, "follow_up": 60})
+        
+        result = self.classifier.categorize("Thanks, got it!", "Thanks")
+        self.assertEqual(result["category"], "General")
+        self.assertEqual(result["priority"], 5)
+        self.assertTrue(result["explanation"].startswith(LOCAL_EXPLANATION))
+        
+        self.assertFalse(self.classifier.needs_follow_up("Thanks, got it. Have a great weekend!"))
+        self.assertTrue(self.classifier.needs_follow_up(
+            "Please review the attached LOI and send comments by Friday.", "LOI for 9 Main Street"))
+    
+    def test_escalation(self):
+        """Unconfident predictions and untrained tasks escalate to the LLM"""
+        strict = EmailClassifier(threshold=1.0)
+        strict.models = self.classifier.models
+        self.assertIsNone(strict.categorize("Thanks, got it!", "Thanks"))
+        
+        untrained = EmailClassifier()
+        self.assertIsNone(untrained.needs_follow_up("Thanks"))
+        self.assertEqual(untrained.stats()["tasks"]["follow_up"], {"local": 0, "escalated": 1})
+    
+    def test_too_few_examples(self):
+        """Tasks without enough labels stay untrained"""
+        classifier = EmailClassifier(min_examples=100)
+        self.assertEqual(classifier.train(TRAINING_DOCS), {})
+        self.assertEqual(classifier.models, {})
+        
+        # Retraining with too few labels keeps the trained models and the saved file
+        with open(self.model_path) as f:
+            saved = f.read()
+        self.classifier.min_examples = 100
+        self.assertEqual(self.classifier.train(TRAINING_DOCS), {})
+        self.assertEqual(set(self.classifier.models), {"category", "priority", "follow_up"})
+        with open(self.model_path) as f:
+            self.assertEqual(f.read(), saved)
+    
+    def test_save_and_load(self):
+        """Saved models give the same predictions after loading"""
+        loaded = EmailClassifier(self.model_path, threshold=0.8)
+        
+        text = "Please review the LOI for 12 Main Street by Friday."
+        self.assertEqual(loaded.categorize(text, "LOI")["category"], self.classifier.categorize(text, "LOI")["category"])
+        self.assertEqual(loaded.trained_at, self.classifier.trained_at)
+    
+    def test_follow_up_labels_are_stored(self):
+        """FollowUpService stores the LLM's answer for emails it asks about"""
+        collection = _Collection()
+        email_model = EmailModel("m1", "t1", {"name": "Dana", "email": "dana@example.com"}, [],
+                                 "Suite 400", "Can you send the floor plan for Suite 400?",
+                                 extracted_data={"action_items": []})
+        service = FollowUpService(None, _OpenAIService([{"title": "Send the floor plan"}]),
+                                  classifier=EmailClassifier(), emails_collection=collection)
+        
+        follow_ups = service.detect_follow_ups(email_model)
+        
+        self.assertEqual([follow_up["title"] for follow_up in follow_ups], ["Send the floor plan"])
+        self.assertEqual(collection.updates, [({"message_id": "m1"}, {"$set": {"follow_up_label": "yes"}})])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -168,6 +168,30 @@ class TestEntityRecognition(unittest.TestCase):
         priority = category_data.get("priority")
         self.assertIsInstance(priority, int)
         self.assertTrue(1 <= priority <= 5, f"Priority not in range 1-5: {priority}")
+    
+    def test_combined_enrichment(self):
+        """Test entity extraction, summary and categorization in a single call"""
+        print("\n=== Testing Combined Enrichment ===")
+        
+        enrichment = self.openai_service.enrich_email(
+            email_text=SAMPLE_EMAIL,
+            email_subject="123 Main Street Office Building - Lease Proposal"
+        )
+        
+        # Print the enrichment results
+        print(json.dumps(enrichment, indent=2))
+        
+        # The combined call should succeed without the per-task fallback
+        self.assertEqual(enrichment.get("source"), "combined")
+        
+        # Entities keep the extract_entities shape
+        for key in OpenAIService.ENTITY_KEYS:
+            self.assertIsInstance(enrichment["entities"].get(key), list, f"Missing entity list: {key}")
+        self.assertTrue(len(enrichment["entities"]["properties"]) > 0, "No properties extracted")
+        
+        self.assertIn("lease", enrichment["summary"].lower())
+        self.assertIn(enrichment["category"], ["Property", "Deal", "Meeting", "Task", "General"])
+        self.assertTrue(1 <= enrichment["priority"] <= 5, f"Priority not in range 1-5: {enrichment['priority']}")
 
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test script for the local Gmail caches
+
+This script tests the caches used by GmailService by:
+1. Serving stored message payloads with their current labels, revalidated
+   by a minimal fetch instead of a full download
+2. Keeping cached threads unchanged when callers modify the threads they get
+3. Sharing one blob between identical payloads and evicting least recently
+   used entries once the store is over its size limit
+
+Usage:
+    python -m tests.test_gmail_cache
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.gmail_service import GmailService
+from app.services.gmail_cache import PayloadStore, ThreadCache
+from tests.helpers import FakeClock
+
+class _Request:
+    """Gmail API request returning a fixed response"""
+    
+    methodId = "gmail.users.messages.get"
+    
+    def __init__(self, response):
+        self.response = response
+    
+    def execute(self):
+        return self.response
+
+class _Batch:
+    """Batch request calling its callback for every added request"""
+    
+    def __init__(self, callback):
+        self.callback = callback
+        self._requests = {}
+    
+    def add(self, request, request_id):
+        self._requests[request_id] = request
+    
+    def execute(self):
+        for request_id, request in self._requests.items():
+            self.callback(request_id, request.execute(), None)
+
+class _GmailAPI:
+    """Gmail API stand-in serving messages whose labels can change"""
+    
+    def __init__(self):
+        self.labels = ["INBOX", "UNREAD"]
+        self.history_id = "100"
+        self.formats = []
+    
+    def users(self):
+        return self
+    
+    def messages(self):
+        return self
+    
+    def get(self, userId, id, format="full", fields=None):
+        self.formats.append(format)
+        message = {"id": id, "threadId": "t1", "historyId": self.history_id, "labelIds": list(self.labels)}
+        if format != "minimal":
+            message["payload"] = {"mimeType": "text/plain", "headers": [{"name": "Subject", "value": "Listing"}],
+                                  "body": {"data": "U3VpdGUgNDAwIGlzIGF2YWlsYWJsZS4="}}
+        return _Request(message)
+    
+    def new_batch_http_request(self, callback):
+        return _Batch(callback)
+
+class TestGmailCache(unittest.TestCase):
+    """Test cases for the caches used by GmailService"""
+    
+    def setUp(self):
+        """Create a Gmail service with a payload store in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.api = _GmailAPI()
+        self.gmail = GmailService("credentials.json", "token.pickle", [], cache_dir=self.tmp_dir)
+        self.gmail.service = self.api
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_stored_message_gets_current_labels(self):
+        """A stored message is revalidated with a minimal fetch and its labels updated"""
+        self.assertEqual(self.gmail.get_message("m1")["labelIds"], ["INBOX", "UNREAD"])
+        
+        # The message was read and archived since it was stored
+        self.api.labels = []
+        self.api.history_id = "105"
+        message = self.gmail.get_message("m1")
+        
+        self.assertEqual(self.api.formats, ["full", "minimal"])
+        self.assertEqual(message["labelIds"], [])
+        self.assertEqual(message["payload"]["headers"][0]["value"], "Listing")
+        self.assertEqual(self.gmail.payload_store.get("message", "m1")["historyId"], "105")
+        
+        # Callers that only need the content skip the revalidation
+        self.gmail.get_message("m1", refresh_labels=False)
+        self.assertEqual(len(self.api.formats), 2)
+    
+    def test_batched_fetch_revalidates_stored_messages(self):
+        """Stored messages are revalidated in the same batch that downloads the others"""
+        self.gmail.get_message("m1")
+        self.api.labels = ["INBOX"]
+        
+        result = self.gmail.get_messages_with_body(["m1", "m2"])
+        
+        self.assertEqual(result["errors"], {})
+        self.assertEqual(sorted(self.api.formats), ["full", "full", "minimal"])
+        self.assertEqual([message["labels"] for message in result["messages"]], [["INBOX"], ["INBOX"]])
+    
+    def test_thread_cache_returns_copies(self):
+        """Changes callers make to a cached thread do not reach the cache"""
+        cache = ThreadCache()
+        thread = {"id": "t1", "messages": [{"id": "m1", "labels": ["UNREAD"]}]}
+        cache.put("t1", "100", thread)
+        
+        thread["messages"][0]["labels"].clear()
+        cached = cache.get("t1", "100")
+        cached["messages"].append({"id": "m2"})
+        
+        self.assertEqual(cache.get("t1", "100"), {"id": "t1", "messages": [{"id": "m1", "labels": ["UNREAD"]}]})
+    
+    def test_payload_store_dedupes_and_evicts(self):
+        """Identical payloads are stored once; eviction frees the least recently used blob"""
+        clock = FakeClock()
+        with mock.patch("app.services.gmail_cache.time", clock):
+            store = PayloadStore(os.path.join(self.tmp_dir, "store"))
+            payloads = {name: {"raw": os.urandom(2000).hex()} for name in ("a", "b", "c")}
+            
+            store.put("message", "a", payloads["a"])
+            blob_bytes = store.stats()["bytes"]
+            clock.advance(1)
+            store.put("message", "a-copy", payloads["a"])
+            self.assertEqual(store.stats(), {"entries": 2, "bytes": blob_bytes, "max_bytes": store.max_bytes})
+            
+            # Room for two blobs; reading "a" makes "a-copy" and then "b" the oldest
+            store.max_bytes = blob_bytes * 2 + blob_bytes // 2
+            clock.advance(1)
+            store.put("message", "b", payloads["b"])
+            clock.advance(1)
+            self.assertEqual(store.get("message", "a"), payloads["a"])
+            clock.advance(1)
+            store.put("message", "c", payloads["c"])
+        
+        self.assertIsNone(store.get("message", "a-copy"))
+        self.assertIsNone(store.get("message", "b"))
+        self.assertEqual(store.get("message", "a"), payloads["a"])
+        self.assertEqual(store.get("message", "c"), payloads["c"])
+        
+        blob_files = [name for _, _, names in os.walk(store.blob_dir) for name in names]
+        self.assertEqual(len(blob_files), 2)
+
+if __name__ == "__main__":
+    unittest.main()
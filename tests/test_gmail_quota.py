@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for the Gmail quota scheduler
+
+This script tests QuotaScheduler on a simulated clock by:
+1. Refilling the token bucket at the configured rate and blocking callers until it can pay
+2. Leaving the bucket in debt after a request costing more than one second of quota
+3. Pausing all callers for the Retry-After delay of a rate-limited request
+4. Retrying 5xx errors with capped, jittered backoff and raising other errors at once
+
+Usage:
+    python -m tests.test_gmail_quota
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.gmail_quota import QuotaScheduler
+from tests.helpers import FakeClock, FakeCondition
+
+def _http_error(status, retry_after=None, content=b"{}"):
+    """Build a Gmail API error response"""
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), content)
+
+class TestGmailQuota(unittest.TestCase):
+    """Test cases for QuotaScheduler"""
+    
+    def setUp(self):
+        """Create a scheduler of 10 units per second on a simulated clock"""
+        self.clock = FakeClock()
+        patcher = mock.patch("app.services.gmail_quota.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.scheduler = QuotaScheduler(units_per_second=10, max_retries=4, base_delay=1.0, max_delay=4.0)
+        self.scheduler._condition = FakeCondition(self.clock)
+    
+    def test_bucket_refills(self):
+        """A full bucket pays at once; the next request waits for the refill"""
+        self.scheduler.acquire(10)
+        self.assertEqual(self.clock.sleeps, [])
+        
+        self.scheduler.acquire(5)
+        self.assertEqual(self.clock.sleeps, [0.5])
+        
+        self.clock.advance(0.3)
+        self.assertEqual(self.scheduler.headroom()["available_units"], 3.0)
+    
+    def test_expensive_request_leaves_debt(self):
+        """A request above capacity waits for a full bucket and delays the next caller"""
+        self.scheduler.acquire(25)
+        self.assertEqual(self.scheduler.headroom()["available_units"], -15.0)
+        
+        self.scheduler.acquire(5)
+        self.assertEqual(self.clock.sleeps, [2.0])
+    
+    def test_retry_after_pauses_all_callers(self):
+        """A 429 with Retry-After blocks the bucket for that long before the retry"""
+        responses = [_http_error(429, retry_after="3"), "ok"]
+        
+        def send():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        
+        started = self.clock.now
+        self.assertEqual(self.scheduler.execute(send, 5), "ok")
+        
+        self.assertGreaterEqual(self.clock.now - started, 3.0)
+        headroom = self.scheduler.headroom()
+        self.assertEqual((headroom["rate_limited"], headroom["retries"]), (1, 1))
+    
+    def test_rate_limit_reasons(self):
+        """403s count as rate limits only for quota reasons"""
+        quota_error = _http_error(403, content=b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}], '
+                                               b'"message": "User Rate Limit Exceeded"}}')
+        permission_error = _http_error(403, content=b'{"error": {"message": "Insufficient Permission"}}')
+        
+        self.assertTrue(self.scheduler.is_rate_limit_error(quota_error))
+        self.assertFalse(self.scheduler.is_retryable(permission_error))
+        self.assertTrue(self.scheduler.is_retryable(_http_error(503)))
+    
+    def test_backoff(self):
+        """5xx errors are retried with doubling delays capped at max_delay; others raise at once"""
+        calls = []
+        
+        def send():
+            calls.append(self.clock.now)
+            raise _http_error(500)
+        
+        # Take the upper bound of each jittered delay
+        with mock.patch("app.services.gmail_quota.random.uniform", side_effect=lambda low, high: high):
+            with self.assertRaises(HttpError):
+                self.scheduler.execute(send, 1)
+        
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0, 4.0, 4.0])
+        
+        def not_found():
+            calls.append(self.clock.now)
+            raise _http_error(404)
+        
+        with self.assertRaises(HttpError):
+            self.scheduler.execute(not_found, 1)
+        self.assertEqual(len(calls), 6)
+
+if __name__ == "__main__":
+    unittest.main()
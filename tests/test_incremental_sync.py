@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental mailbox sync
+
+This script tests EmailProcessor.sync_new_emails by:
+1. Advancing the history checkpoint after a delta has been processed
+2. Keeping messages that failed to fetch for the next sync to retry
+3. Giving up on a message after SYNC_MAX_RETRIES failed syncs
+
+Usage:
+    python -m tests.test_incremental_sync
+"""
+
+import os
+import sys
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.email_processor import EmailProcessor
+
+class _Collection:
+    """In-memory collection supporting the queries used by sync_new_emails"""
+    
+    def __init__(self):
+        self.docs = []
+    
+    def find(self, query, projection=None):
+        wanted = set(query["message_id"]["$in"])
+        return [doc for doc in self.docs if doc.get("message_id") in wanted]
+    
+    def find_one(self, query):
+        return next((doc for doc in self.docs if doc.get("_id") == query["_id"]), None)
+    
+    def insert_many(self, docs, ordered=True):
+        self.docs.extend(docs)
+    
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None:
+            doc = dict(query)
+            self.docs.append(doc)
+        doc.update(update["$set"])
+
+class _Gmail:
+    """Gmail stand-in with one history delta and messages that can fail to fetch"""
+    
+    def __init__(self, message_ids, failing_ids=()):
+        self.message_ids = message_ids
+        self.failing_ids = set(failing_ids)
+        self.fetched = []
+    
+    def list_history(self, start_history_id):
+        return {"message_ids": list(self.message_ids), "history_id": str(int(start_history_id) + 1)}
+    
+    def get_messages_with_body(self, message_ids):
+        self.fetched.append(list(message_ids))
+        return {
+            "messages": [
+                {"id": message_id, "thread_id": "t1", "from": "Dana <dana@example.com>", "subject": "Listing",
+                 "body": {"plain": "Suite 400 is available."}}
+                for message_id in message_ids if message_id not in self.failing_ids
+            ],
+            "errors": {message_id: "HttpError 500" for message_id in message_ids if message_id in self.failing_ids}
+        }
+
+class _Attachments:
+    """Attachment service for emails without attachments"""
+    
+    def ingest_attachments(self, email_model):
+        return {}
+
+class TestIncrementalSync(unittest.TestCase):
+    """Test cases for history checkpoints and fetch retries"""
+    
+    def _processor(self, gmail):
+        """Create a processor around in-memory collections, without enrichment"""
+        processor = EmailProcessor.__new__(EmailProcessor)
+        processor.gmail_service = gmail
+        processor.emails_collection = _Collection()
+        processor.sync_state_collection = _Collection()
+        processor.sync_state_collection.update_one({"_id": EmailProcessor.SYNC_STATE_ID}, {"$set": {"history_id": "100"}})
+        processor.attachment_service = _Attachments()
+        processor._enrich_emails = lambda email_models: None
+        return processor
+    
+    def _state(self, processor):
+        return processor.sync_state_collection.find_one({"_id": EmailProcessor.SYNC_STATE_ID})
+    
+    def test_checkpoint_advances(self):
+        """A fully processed delta moves the checkpoint and leaves nothing to retry"""
+        processor = self._processor(_Gmail(["m1", "m2"]))
+        
+        self.assertEqual(processor.sync_new_emails(), ["m1", "m2"])
+        self.assertEqual(self._state(processor)["history_id"], "101")
+        self.assertEqual(self._state(processor)["retry_ids"], {})
+    
+    def test_failed_fetch_is_retried(self):
+        """The checkpoint moves past a failed message, which the next sync fetches again"""
+        gmail = _Gmail(["m1", "m2"], failing_ids=["m2"])
+        processor = self._processor(gmail)
+        
+        self.assertEqual(processor.sync_new_emails(), ["m1"])
+        self.assertEqual(self._state(processor)["history_id"], "101")
+        self.assertEqual(self._state(processor)["retry_ids"], {"m2": 1})
+        
+        # The next delta no longer contains m2
+        gmail.message_ids = ["m3"]
+        gmail.failing_ids = set()
+        self.assertEqual(processor.sync_new_emails(), ["m2", "m3"])
+        self.assertEqual(self._state(processor)["retry_ids"], {})
+    
+    def test_retries_are_limited(self):
+        """A message that keeps failing is dropped after SYNC_MAX_RETRIES syncs"""
+        gmail = _Gmail(["m1"], failing_ids=["m1"])
+        processor = self._processor(gmail)
+        
+        processor.sync_new_emails()
+        gmail.message_ids = []
+        for _ in range(EmailProcessor.SYNC_MAX_RETRIES - 1):
+            processor.sync_new_emails()
+        
+        self.assertEqual(len(gmail.fetched), EmailProcessor.SYNC_MAX_RETRIES)
+        self.assertEqual(self._state(processor)["retry_ids"], {})
+
+if __name__ == "__main__":
+    unittest.main()
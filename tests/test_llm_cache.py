@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for the LLM response cache
+
+This script tests the cache by:
+1. Building keys that ignore whitespace-only prompt differences
+2. Expiring entries after their TTL and evicting least recently used ones
+3. Making one upstream call for concurrent requests with the same key
+
+Usage:
+    python -m tests.test_llm_cache
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_cache import LLMCache
+
+def _request(content, model="gpt-4o-mini", temperature=0.2):
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        "temperature": temperature
+    }
+
+class TestLLMCache(unittest.TestCase):
+    """Test cases for LLMCache"""
+    
+    def setUp(self):
+        """Create a cache in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = LLMCache(os.path.join(self.tmp_dir, "cache.sqlite3"), ttl_seconds=60, max_entries=2)
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_key_normalization(self):
+        """Keys ignore whitespace but not model or parameters"""
+        key = LLMCache.make_key(_request("Summarize  this\n   email"))
+        self.assertEqual(key, LLMCache.make_key(_request("Summarize this email")))
+        self.assertNotEqual(key, LLMCache.make_key(_request("Summarize this email", model="gpt-4o")))
+        self.assertNotEqual(key, LLMCache.make_key(_request("Summarize this email", temperature=0.3)))
+    
+    def test_ttl_and_lru_eviction(self):
+        """Expired entries are not served and the least recently used entry is evicted"""
+        self.cache.put("a", {"value": 1})
+        self.cache.put("b", {"value": 2})
+        self.cache.get("a")
+        self.cache.put("c", {"value": 3})
+        
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), {"value": 1})
+        
+        self.cache.ttl_seconds = 0
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get("c"))
+    
+    def test_single_flight(self):
+        """Concurrent requests for one key make a single upstream call"""
+        calls = []
+        
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"value": "done"}
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_compute("key", compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": "done"}] * 5)
+        
+        stats = self.cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"] + stats["coalesced"], 4)
+    
+    def test_uncacheable_response(self):
+        """Responses the caller marks as uncacheable are not stored"""
+        self.assertIsNone(self.cache.get_or_compute("error", lambda: None))
+        self.assertIsNone(self.cache.get("error"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Test script for the LLM call ledger
+
+This script tests the ledger by:
+1. Writing queued entries to a JSON Lines file in batches
+2. Recording call site, operation, tokens, latency and outcome of OpenAIService
+   calls against a local stand-in, with cache hits not billed
+3. Recording both copies of a hedged request once each, with their own
+   responses, when the hedge wins
+4. Aggregating tokens, latency and cost per day and call site
+5. Appending what MongoDB did not take to the file, trying MongoDB again later
+
+Usage:
+    python -m tests.test_llm_ledger
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.openai_service import OpenAIService
+from app.services.llm_cache import LLMCache
+from app.services.rate_limiter import AdaptiveRateLimiter
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.request_hedger import RequestHedger
+from app.services.llm_ledger import LLMLedger, aggregate_collection, aggregate_entries, read_entries, estimate_cost
+from tests.helpers import StandInTestCase, chat_completion
+
+class _Collection:
+    """llm_calls collection whose inserts fail as scripted"""
+    
+    def __init__(self, failures=(), rows=()):
+        self.failures = list(failures)
+        self.rows = list(rows)
+        self.docs = []
+    
+    def insert_many(self, docs, ordered=True):
+        failure = self.failures.pop(0) if self.failures else None
+        if isinstance(failure, BulkWriteError):
+            failed = {error["index"] for error in failure.details["writeErrors"]}
+            self.docs.extend(doc for index, doc in enumerate(docs) if index not in failed)
+        if failure is not None:
+            raise failure
+        self.docs.extend(docs)
+    
+    def aggregate(self, pipeline):
+        return [dict(row) for row in self.rows]
+
+class TestLLMLedger(StandInTestCase):
+    """Test cases for LLMLedger and its use by OpenAIService"""
+    
+    # Seconds the next responses are delayed by, in order
+    delays = []
+    
+    @classmethod
+    def handle(cls, request):
+        """Answer chat completions, reporting token usage"""
+        if cls.delays:
+            time.sleep(cls.delays.pop(0))
+        return 200, chat_completion(
+            "Done",
+            model="gpt-4o-mini-2024-07-18",
+            usage={"prompt_tokens": 120, "completion_tokens": 8, "prompt_tokens_details": {"cached_tokens": 64}}
+        )
+    
+    def setUp(self):
+        """Create a file ledger in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "llm_calls.jsonl")
+        self.ledger = LLMLedger(path=self.path, use_mongo=False, batch_size=10, flush_interval=0.05)
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_batched_file_writes(self):
+        """Queued entries end up in the file with ISO timestamps"""
+        for index in range(25):
+            self.ledger.record({"call_site": "test", "index": index})
+        
+        self.assertTrue(self.ledger.flush())
+        entries = list(read_entries(self.path))
+        self.assertEqual([entry["index"] for entry in entries], list(range(25)))
+        self.assertIsInstance(datetime.fromisoformat(entries[0]["timestamp"]), datetime)
+        self.assertEqual(self.ledger.stats()["written"], 25)
+    
+    def test_service_calls_are_recorded(self):
+        """Each call is recorded with its caller; the cached repeat costs no tokens"""
+        service = OpenAIService(transport=self.server.transport(), cache=LLMCache(os.path.join(self.tmp_dir, "cache.sqlite3")),
+                                rate_limiter=AdaptiveRateLimiter(), circuit_breaker=CircuitBreaker(),
+                                ledger=self.ledger)
+        service.api_key = "test-key"
+        
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        self.assertTrue(self.ledger.flush())
+        
+        first, second = read_entries(self.path)
+        self.assertEqual(first["call_site"], "test_llm_ledger.test_service_calls_are_recorded")
+        self.assertEqual(first["operation"], "simple_completion")
+        self.assertEqual(first["outcome"], "ok")
+        self.assertEqual((first["prompt_tokens"], first["completion_tokens"], first["cached_tokens"]), (120, 8, 64))
+        self.assertEqual(first["attempt"], 1)
+        self.assertGreaterEqual(first["latency_ms"], 0)
+        
+        self.assertEqual(second["outcome"], "cache_hit")
+        self.assertEqual(second["prompt_tokens"], 0)
+    
+    def test_hedged_copy_is_recorded(self):
+        """Both copies of a hedged request are recorded once with the caller's call site"""
+        hedger = RequestHedger(min_samples=1, min_delay=0.02, max_hedge_rate=1.0)
+        service = OpenAIService(transport=self.server.transport(), cache=None, rate_limiter=AdaptiveRateLimiter(),
+                                circuit_breaker=CircuitBreaker(), hedger=hedger, ledger=self.ledger)
+        service.api_key = "test-key"
+        
+        # A fast call gives the hedger a latency for this kind of request
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        type(self).delays = [0.3]
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        self.assertEqual(hedger.stats()["hedges_won"], 1)
+        
+        # The losing primary is recorded once its own response arrives
+        deadline = time.monotonic() + 2
+        while self.ledger.flush() and len(list(read_entries(self.path))) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        
+        entries = {entry["hedge"]: entry for entry in list(read_entries(self.path))[1:]}
+        self.assertEqual(len(list(read_entries(self.path))), 3)
+        self.assertEqual(set(entries), {False, True})
+        self.assertTrue(all(entry["call_site"] == "test_llm_ledger.test_hedged_copy_is_recorded"
+                            and entry["operation"] == "simple_completion"
+                            and entry["outcome"] == "ok" and entry["prompt_tokens"] == 120
+                            for entry in entries.values()))
+        self.assertGreaterEqual(entries[False]["latency_ms"], 250)
+        self.assertLess(entries[True]["latency_ms"], 250)
+    
+    def test_aggregation(self):
+        """Rows sum tokens and cost per day and call site, newest day first"""
+        today = datetime.utcnow()
+        entries = [
+            {"timestamp": today, "call_site": "a", "model": "gpt-4o-mini", "outcome": "ok", "attempt": 2,
+             "rate_limit_waits": 1, "prompt_tokens": 1000, "completion_tokens": 100, "cached_tokens": 0,
+             "latency_ms": 300},
+            {"timestamp": today, "call_site": "a", "model": "gpt-4o", "outcome": "error", "attempt": 1,
+             "rate_limit_waits": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+             "latency_ms": 100},
+            {"timestamp": (today - timedelta(days=1)).isoformat(), "call_site": "b", "model": "gpt-4o",
+             "outcome": "cache_hit", "latency_ms": 5},
+            {"timestamp": today - timedelta(days=30), "call_site": "old", "model": "gpt-4o", "latency_ms": 1},
+        ]
+        
+        rows = aggregate_entries(entries, today - timedelta(days=7))
+        
+        self.assertEqual([row["call_site"] for row in rows], ["a", "b"])
+        today_row = rows[0]
+        self.assertEqual((today_row["calls"], today_row["errors"], today_row["retries"]), (2, 1, 2))
+        self.assertEqual(today_row["latency_ms_avg"], 200)
+        self.assertEqual(today_row["latency_ms_max"], 300)
+        self.assertAlmostEqual(today_row["cost_usd"], estimate_cost("gpt-4o-mini", 1000, 100))
+        self.assertEqual(rows[1]["cache_hits"], 1)
+    
+    def test_mongo_failures(self):
+        """Entries MongoDB did not take go to the file; later batches try MongoDB again"""
+        ledger = LLMLedger(path=self.path, use_mongo=True, batch_size=3, flush_interval=0.05)
+        ledger.MONGO_RETRY_INTERVAL = 0.0
+        ledger._collection = _Collection(failures=[
+            BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "Document failed validation"}]}),
+            ServerSelectionTimeoutError("No servers found")
+        ])
+        
+        for batch in range(3):
+            for index in range(3):
+                ledger.record({"call_site": "test", "index": batch * 3 + index})
+            self.assertTrue(ledger.flush())
+        
+        self.assertTrue(ledger.use_mongo)
+        self.assertEqual([doc["index"] for doc in ledger._collection.docs], [0, 2, 6, 7, 8])
+        self.assertEqual([entry["index"] for entry in read_entries(self.path)], [1, 3, 4, 5])
+        self.assertEqual(ledger.stats()["written"], 9)
+    
+    def test_collection_and_file_are_merged(self):
+        """The report counts the collection together with entries written to the file"""
+        today = datetime.utcnow()
+        collection = _Collection(rows=[{
+            "_id": {"day": today.strftime("%Y-%m-%d"), "call_site": "a", "model": "gpt-4o-mini"},
+            "calls": 2, "errors": 0, "cache_hits": 0, "retries": 0, "prompt_tokens": 2000,
+            "completion_tokens": 200, "cached_tokens": 0, "latency_ms_total": 400, "latency_ms_max": 300
+        }])
+        entries = [{"timestamp": today.isoformat(), "call_site": "a", "model": "gpt-4o-mini", "outcome": "ok",
+                    "prompt_tokens": 1000, "completion_tokens": 100, "latency_ms": 500}]
+        
+        rows = aggregate_collection(collection, today - timedelta(days=1), entries)
+        
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["calls"], rows[0]["prompt_tokens"]), (3, 3000))
+        self.assertEqual((rows[0]["latency_ms_avg"], rows[0]["latency_ms_max"]), (300, 500))
+
+if __name__ == "__main__":
+    unittest.main()
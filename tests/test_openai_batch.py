@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Test script for the OpenAI Batch API client
+
+This script tests the batch client against a local stand-in of the
+/files and /batches endpoints by:
+1. Writing enrichment requests to a JSONL input file
+2. Uploading the file and creating a batch job
+3. Polling the job until it completes
+4. Streaming the results back and validating them as enrichments
+5. Collecting the finished requests of an expired batch
+6. Enriching pending emails, resuming the batches of an interrupted run
+
+Usage:
+    python -m tests.test_openai_batch
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from email.parser import BytesParser
+from unittest import mock
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.openai_batch import OpenAIBatchClient, BatchError
+from app.services.openai_service import OpenAIService
+from app.services.email_processor import EmailProcessor
+from app.services.email_pipeline import EmailPipeline
+from tests.helpers import StandInTestCase
+
+ENRICHMENT = {
+    "properties": [{"address": "123 Main Street", "confidence": 0.9}],
+    "people": [], "companies": [], "dates": [], "financial_details": [],
+    "action_items": [], "keywords": ["lease"],
+    "summary": "Lease proposal for 123 Main Street.",
+    "category": "Deal", "priority": 2, "explanation": "Deadline next week"
+}
+
+class _Collection:
+    """In-memory collection supporting the queries used by enrich_pending"""
+    
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+    
+    def find(self, query, projection=None):
+        return [doc for doc in self.docs if all(doc.get(key) == value for key, value in query.items())]
+    
+    def find_one(self, query):
+        return next(iter(self.find(query)), None)
+    
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None:
+            if not upsert:
+                return
+            doc = dict(query)
+            self.docs.append(doc)
+        doc.update(update.get("$set", {}))
+        for key, value in update.get("$addToSet", {}).items():
+            if value not in doc.setdefault(key, []):
+                doc[key].append(value)
+        for key, value in update.get("$pull", {}).items():
+            doc[key] = [item for item in doc.get(key, []) if item != value]
+
+class _CapsuleGenerator:
+    """Capsule generator recording the emails it was given"""
+    
+    def __init__(self):
+        self.processed = []
+    
+    def process_email(self, message_id):
+        self.processed.append(message_id)
+        return None
+
+class TestOpenAIBatch(StandInTestCase):
+    """Test cases for OpenAIBatchClient"""
+    
+    files = {}
+    batches = {}
+    polls_before_completion = 2
+    
+    @classmethod
+    def handle(cls, request):
+        """Minimal in-memory implementation of the batch endpoints"""
+        parts = request.path.strip("/").split("/")
+        
+        if request.method == "POST" and request.path == "/v1/files":
+            form = cls._read_form(request)
+            file_id = f"file-{len(cls.files)}"
+            cls.files[file_id] = form["file"]
+            return 200, {"id": file_id, "purpose": form["purpose"].decode("utf-8")}
+        
+        if request.method == "POST" and request.path == "/v1/batches":
+            body = request.json()
+            if body["input_file_id"] not in cls.files:
+                return 404, {"error": {"message": "No such file"}}
+            batch_id = f"batch-{len(cls.batches)}"
+            cls.batches[batch_id] = {"id": batch_id, "status": "validating", "polls": 0, **body}
+            return 200, cls.batches[batch_id]
+        
+        if request.method == "GET" and parts[:2] == ["v1", "batches"] and parts[2] in cls.batches:
+            batch = cls.batches[parts[2]]
+            batch["polls"] += 1
+            if batch["polls"] > cls.polls_before_completion and batch["status"] != "completed":
+                cls._complete(batch)
+            elif batch["status"] == "validating":
+                batch["status"] = "in_progress"
+            return 200, batch
+        
+        if request.method == "GET" and parts[:2] == ["v1", "files"] and parts[-1] == "content" and parts[2] in cls.files:
+            return 200, cls.files[parts[2]]
+        
+        return 404, {"error": {"message": "Not found"}}
+    
+    @staticmethod
+    def _read_form(request):
+        """Parse a multipart/form-data body into a dict of field name to bytes"""
+        message = BytesParser().parsebytes(
+            f"Content-Type: {request.headers['Content-Type']}\r\n\r\n".encode("utf-8") + request.body
+        )
+        return {
+            part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.get_payload()
+        }
+    
+    @classmethod
+    def _complete(cls, batch):
+        """
+        Answer every request of the input file; ids starting with 'fail' get an
+        error, ids starting with 'late' expire the batch before they are run and
+        ids starting with 'partial' get a response without any JSON
+        """
+        lines = cls.files[batch["input_file_id"]].decode("utf-8").splitlines()
+        output, errors = [], []
+        for line in lines:
+            request = json.loads(line)
+            if request["custom_id"].startswith("fail"):
+                errors.append({"custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "server_error", "message": "failed"}})
+                continue
+            if request["custom_id"].startswith("late"):
+                errors.append({"custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "batch_expired", "message": "expired"}})
+                continue
+            content = "I cannot help with that." if request["custom_id"].startswith("partial") else json.dumps(ENRICHMENT)
+            body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+            output.append({"custom_id": request["custom_id"], "error": None,
+                           "response": {"status_code": 200, "body": body}})
+        
+        for key, results in (("output_file_id", output), ("error_file_id", errors)):
+            if results:
+                file_id = f"file-{len(cls.files)}"
+                cls.files[file_id] = "".join(json.dumps(r) + "\n" for r in results).encode("utf-8")
+                batch[key] = file_id
+        
+        expired = any(error["error"]["code"] == "batch_expired" for error in errors)
+        batch["status"] = "expired" if expired else "completed"
+        batch["request_counts"] = {"total": len(lines), "completed": len(output), "failed": len(errors)}
+    
+    def setUp(self):
+        """Create a client pointed at the stand-in"""
+        self.tmp_dir = tempfile.mkdtemp()
+        transport = self.server.transport()
+        self.client = OpenAIBatchClient(api_key="test-key", transport=transport)
+        self.openai_service = OpenAIService(transport=transport, cache=None, ledger=None)
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_batch_round_trip(self):
+        """Requests are submitted, polled and their results streamed back"""
+        requests = [
+            (message_id, self.openai_service.build_enrichment_request("Body text", f"Subject {message_id}"))
+            for message_id in ("msg-1", "msg-2", "fail-3")
+        ]
+        
+        results = list(self.client.run(requests, os.path.join(self.tmp_dir, "input.jsonl"), poll_interval=0.01))
+        
+        by_id = {result["custom_id"]: result for result in results}
+        self.assertEqual(set(by_id), {"msg-1", "msg-2", "fail-3"})
+        self.assertIsNotNone(by_id["fail-3"]["error"])
+        
+        enrichment = self.openai_service.parse_enrichment_response(by_id["msg-1"]["response"]["body"])
+        self.assertEqual(enrichment["source"], "combined")
+        self.assertEqual(enrichment["category"], "Deal")
+        self.assertEqual(enrichment["priority"], 2)
+        self.assertEqual(enrichment["entities"]["properties"][0]["address"], "123 Main Street")
+    
+    def test_input_file_format(self):
+        """Input lines follow the Batch API request format"""
+        path = os.path.join(self.tmp_dir, "input.jsonl")
+        count = self.client.write_requests([("msg-1", {"model": "gpt-4o-mini", "messages": []})], path)
+        
+        self.assertEqual(count, 1)
+        with open(path) as f:
+            line = json.loads(f.readline())
+        self.assertEqual(line, {
+            "custom_id": "msg-1",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": "gpt-4o-mini", "messages": []}
+        })
+    
+    def test_expired_batch(self):
+        """An expired batch yields its finished results; without any it raises BatchError"""
+        requests = [
+            (message_id, self.openai_service.build_enrichment_request("Body text", f"Subject {message_id}"))
+            for message_id in ("msg-1", "late-2")
+        ]
+        
+        results = list(self.client.run(requests, os.path.join(self.tmp_dir, "input.jsonl"), poll_interval=0.01))
+        
+        by_id = {result["custom_id"]: result for result in results}
+        self.assertEqual(by_id["msg-1"]["response"]["status_code"], 200)
+        self.assertEqual(by_id["late-2"]["error"]["code"], "batch_expired")
+        
+        with self.assertRaises(BatchError):
+            list(self.client.run(requests[1:], os.path.join(self.tmp_dir, "late.jsonl"), poll_interval=0.01))
+    
+    def _pipeline(self, message_ids):
+        """Create a pipeline whose emails with the given IDs are pending"""
+        processor = EmailProcessor.__new__(EmailProcessor)
+        processor.emails_collection = _Collection(
+            {"message_id": message_id, "subject": f"Subject {message_id}", "body_text": "Body text",
+             "sender": {"name": "Dana", "email": "dana@example.com"}, "enrichment_status": "pending"}
+            for message_id in message_ids
+        )
+        processor.sync_state_collection = _Collection()
+        processor.openai_service = self.openai_service
+        
+        pipeline = EmailPipeline.__new__(EmailPipeline)
+        pipeline.openai_service = self.openai_service
+        pipeline.email_processor = processor
+        pipeline.capsule_generator = _CapsuleGenerator()
+        return pipeline
+    
+    def _statuses(self, pipeline):
+        """Map message IDs to their enrichment status"""
+        return {doc["message_id"]: doc["enrichment_status"] for doc in pipeline.email_processor.emails_collection.docs}
+    
+    def test_apply_batch_result(self):
+        """A usable line completes its email; failed lines and unusable responses leave it pending"""
+        pipeline = self._pipeline(["msg-1", "fail-2", "partial-3"])
+        processor = pipeline.email_processor
+        results = {
+            result["custom_id"]: result
+            for result in self.client.run(processor.iter_pending_enrichment_requests(["msg-1", "fail-2", "partial-3"]),
+                                          os.path.join(self.tmp_dir, "input.jsonl"), poll_interval=0.01)
+        }
+        
+        self.assertEqual(processor.apply_batch_result(results["msg-1"]), "msg-1")
+        self.assertIsNone(processor.apply_batch_result(results["fail-2"]))
+        self.assertIsNone(processor.apply_batch_result(results["partial-3"]))
+        
+        self.assertEqual(self._statuses(pipeline), {"msg-1": "complete", "fail-2": "pending", "partial-3": "pending"})
+        partial = processor.emails_collection.find_one({"message_id": "partial-3"})
+        self.assertEqual(partial["category"], "General")
+        self.assertEqual(processor.emails_collection.find_one({"message_id": "msg-1"})["category"], "Deal")
+    
+    def test_enrich_pending(self):
+        """Enriched emails are completed; failed, unusable and expired requests stay pending"""
+        pipeline = self._pipeline(["msg-1", "fail-2", "partial-3", "late-4"])
+        
+        with mock.patch.dict(os.environ, {"OPENAI_BATCH_DIR": self.tmp_dir}):
+            result = pipeline.enrich_pending(poll_interval=0.01)
+        
+        self.assertTrue(result["success"])
+        self.assertEqual(result["processed_emails"], 1)
+        self.assertEqual(result["pending_emails"], 3)
+        self.assertEqual(self._statuses(pipeline), {
+            "msg-1": "complete", "fail-2": "pending", "partial-3": "pending", "late-4": "pending"
+        })
+        self.assertEqual(pipeline.capsule_generator.processed, ["msg-1"])
+        self.assertEqual(pipeline._saved_batch_ids(), [])
+    
+    def test_enrich_pending_resumes_saved_batch(self):
+        """A batch submitted by an interrupted run is collected instead of submitted again"""
+        pipeline = self._pipeline(["msg-1"])
+        input_path = os.path.join(self.tmp_dir, "input.jsonl")
+        self.client.write_requests(pipeline.email_processor.iter_pending_enrichment_requests(["msg-1"]), input_path)
+        batch = self.client.create_batch(self.client.upload_file(input_path))
+        pipeline._save_batch_id(batch["id"])
+        batch_count = len(self.batches)
+        
+        with mock.patch.dict(os.environ, {"OPENAI_BATCH_DIR": self.tmp_dir}):
+            result = pipeline.enrich_pending(poll_interval=0.01)
+        
+        self.assertEqual(result["processed_emails"], 1)
+        self.assertEqual(len(self.batches), batch_count)
+        self.assertEqual(self._statuses(pipeline), {"msg-1": "complete"})
+        self.assertEqual(pipeline._saved_batch_ids(), [])
+    
+    def test_enrich_pending_keeps_unfinished_batch(self):
+        """A batch still running at the timeout stays saved and blocks new submissions"""
+        pipeline = self._pipeline(["msg-1"])
+        
+        with mock.patch.dict(os.environ, {"OPENAI_BATCH_DIR": self.tmp_dir}), \
+             mock.patch.object(TestOpenAIBatch, "polls_before_completion", 1000):
+            first = pipeline.enrich_pending(poll_interval=0.01, timeout=0.05)
+            batch_count = len(self.batches)
+            second = pipeline.enrich_pending(poll_interval=0.01, timeout=0.05)
+        
+        self.assertEqual(first["unfinished_batches"], second["unfinished_batches"])
+        self.assertEqual(len(first["unfinished_batches"]), 1)
+        self.assertEqual(len(self.batches), batch_count)
+        self.assertEqual(pipeline._saved_batch_ids(), first["unfinished_batches"])
+        
+        with mock.patch.dict(os.environ, {"OPENAI_BATCH_DIR": self.tmp_dir}):
+            third = pipeline.enrich_pending(poll_interval=0.01)
+        
+        self.assertEqual(third["processed_emails"], 1)
+        self.assertEqual(self._statuses(pipeline), {"msg-1": "complete"})
+        self.assertEqual(pipeline._saved_batch_ids(), [])
+    
+    def test_unknown_input_file(self):
+        """HTTP errors from the batch endpoints raise BatchError"""
+        with self.assertRaises(BatchError):
+            self.client.create_batch("file-missing")
+
+if __name__ == "__main__":
+    unittest.main()
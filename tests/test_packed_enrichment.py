@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for packed multi-email enrichment
+
+This script tests packed enrichment by:
+1. Packing short emails together and sending long ones alone
+2. Matching the results of a packed response to emails by message ID
+3. Enriching emails with a missing or truncated result one by one
+4. Falling back to single-email calls when the packed response is unusable
+5. Keeping the packed results when the single-email calls are rate limited
+
+Usage:
+    python -m tests.test_packed_enrichment
+"""
+
+import os
+import sys
+import json
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.openai_service import OpenAIService
+from app.services.rate_limiter import AdaptiveRateLimiter
+from app.services.circuit_breaker import CircuitBreaker
+from tests.helpers import StandInTestCase, chat_completion
+
+def _enrichment(category, summary):
+    """Build a complete enrichment result as the model would return it"""
+    result = {key: [] for key in OpenAIService.ENTITY_KEYS}
+    result.update(summary=summary, category=category, priority=2, explanation="Test")
+    return result
+
+class TestPackedEnrichment(StandInTestCase):
+    """Test cases for OpenAIService.pack_emails and enrich_packed"""
+    
+    # Content of the stand-in's answers to packed requests
+    packed_content = ""
+    
+    # Whether single-email requests are answered with 429
+    single_rate_limited = False
+    
+    @classmethod
+    def handle(cls, request):
+        """Answer packed enrichment requests with packed_content and single ones with a fixed result"""
+        if cls._schema_name(request) == "packed_email_enrichment":
+            return 200, chat_completion(cls.packed_content)
+        if cls.single_rate_limited:
+            return 429, {"error": {"message": "Rate limit reached"}}, {"retry-after-ms": "1"}
+        return 200, chat_completion(json.dumps(_enrichment("General", "Single")))
+    
+    @staticmethod
+    def _schema_name(request):
+        return request.json()["response_format"]["json_schema"]["name"]
+    
+    def setUp(self):
+        """Create a service talking to the stand-in, without caching or a ledger"""
+        self.service = OpenAIService(transport=self.server.transport(), rate_limiter=AdaptiveRateLimiter(),
+                                     circuit_breaker=CircuitBreaker(), cache=None, ledger=None)
+        self.service.api_key = "test-key"
+        self.service.packing_enabled = True
+        self.server.requests.clear()
+        type(self).single_rate_limited = False
+    
+    def _emails(self, count):
+        """Build short listing emails"""
+        return [
+            {"message_id": f"m{index}", "subject": f"New listing {index}", "text": f"Suite {index} is available."}
+            for index in range(count)
+        ]
+    
+    def test_pack_emails(self):
+        """Short emails share packs; long emails are sent alone"""
+        self.service.PACKED_MAX_EMAILS = 3
+        emails = self._emails(5)
+        emails.insert(2, {"message_id": "long", "subject": "OM", "text": "Rent roll. " * 1000})
+        
+        packs = self.service.pack_emails(emails)
+        self.assertEqual([[item["message_id"] for item in pack] for pack in packs],
+                         [["long"], ["m0", "m1", "m2"], ["m3", "m4"]])
+        
+        self.service.packing_enabled = False
+        self.assertEqual(len(self.service.pack_emails(self._emails(3))), 3)
+    
+    def test_results_keyed_by_message_id(self):
+        """Results are matched by ID; missing and truncated ones are enriched singly"""
+        complete = [dict(_enrichment("Property", f"Listing {index}"), message_id=f"m{index}") for index in (1, 0)]
+        packed = json.dumps({"emails": complete + [{"message_id": "unknown"}]})
+        
+        # m2 is cut off mid-object and m3 is missing from the response
+        type(self).packed_content = packed[:-2] + ', {"message_id": "m2", "summary": "Suite'
+        
+        results = self.service.enrich_packed(self._emails(4))
+        
+        self.assertEqual(results["m0"]["summary"], "Listing 0")
+        self.assertEqual(results["m1"]["summary"], "Listing 1")
+        self.assertEqual(results["m0"]["source"], "packed")
+        self.assertEqual(results["m2"]["source"], "combined")
+        self.assertEqual(results["m3"]["summary"], "Single")
+        names = [self._schema_name(request) for request in self.server.requests]
+        self.assertEqual(names.count("packed_email_enrichment"), 1)
+        self.assertEqual(names.count("email_enrichment"), 2)
+        
+        stats = self.service.packing_stats()
+        self.assertEqual(stats["packed_emails"], 2)
+        self.assertEqual(stats["unaligned_emails"], 2)
+    
+    def test_failed_pack_falls_back(self):
+        """A pack whose response cannot be used is enriched one email at a time"""
+        type(self).packed_content = "Sorry, I can only analyze one email at a time."
+        
+        results = self.service.enrich_packed(self._emails(2))
+        
+        self.assertEqual(sorted(results), ["m0", "m1"])
+        self.assertTrue(all(result["source"] == "combined" for result in results.values()))
+        self.assertEqual(self.service.packing_stats()["failed_packs"], 1)
+    
+    def test_rate_limited_stragglers_keep_packed_results(self):
+        """Rate limiting of the single-email calls leaves the packed results in place"""
+        complete = [dict(_enrichment("Property", f"Listing {index}"), message_id=f"m{index}") for index in (0, 1)]
+        type(self).packed_content = json.dumps({"emails": complete})
+        type(self).single_rate_limited = True
+        self.service.MAX_RATE_LIMIT_WAITS = 0
+        
+        results = self.service.enrich_packed(self._emails(4))
+        
+        self.assertEqual([results[f"m{index}"]["summary"] for index in (0, 1)], ["Listing 0", "Listing 1"])
+        self.assertEqual((results["m2"], results["m3"]), (None, None))
+        names = [self._schema_name(request) for request in self.server.requests]
+        self.assertEqual(names.count("email_enrichment"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
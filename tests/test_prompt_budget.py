@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script for prompt preprocessing
+
+This script tests the prompt budget by:
+1. Stripping quoted replies, forwarded headers, signatures and footers
+2. Keeping attachment sections intact
+3. Fitting text to a token budget and counting the tokens saved
+
+Usage:
+    python -m tests.test_prompt_budget
+"""
+
+import os
+import sys
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.prompt_budget import PromptBudget, clean_email_body, fit_to_budget, estimate_tokens
+
+REPLY_EMAIL = """Hi John,
+
+The seller accepted $4.2M for 123 Main Street. Closing is set for March 1.
+
+Thanks,
+Sarah
+--
+Sarah Johnson | Smith & Associates
+CONFIDENTIALITY NOTICE: This email is intended only for the addressee.
+
+On Mon, Jan 6, 2025 at 10:00 AM John Smith <john@example.com> wrote:
+> Any update on the counteroffer?
+> We can go to $4.2M if needed.
+"""
+
+class TestPromptBudget(unittest.TestCase):
+    """Test cases for prompt preprocessing"""
+    
+    def test_strip_reply_and_footer(self):
+        """Quoted history and disclaimer are removed, the signature is kept"""
+        cleaned = clean_email_body(REPLY_EMAIL)
+        
+        self.assertIn("The seller accepted $4.2M", cleaned)
+        self.assertNotIn("counteroffer", cleaned)
+        self.assertNotIn("CONFIDENTIALITY", cleaned)
+        self.assertIn("Smith & Associates", cleaned)
+    
+    def test_outlook_reply_header(self):
+        """Outlook From:/Sent: headers start the quoted message"""
+        cleaned = clean_email_body("Sounds good.\n\nFrom: Bob\nSent: Monday\nTo: Sarah\n\nOld message")
+        self.assertEqual(cleaned, "Sounds good.")
+    
+    def test_bottom_posted_reply(self):
+        """Text written below a quote is kept"""
+        cleaned = clean_email_body("On Mon, Bob <bob@example.com> wrote:\n> Is the space available?\n\nYes, from April.")
+        self.assertEqual(cleaned, "Yes, from April.")
+    
+    def test_forwarded_message(self):
+        """Forwarded headers are removed but the forwarded content is kept"""
+        text = (
+            "FYI\n\n---------- Forwarded message ---------\n"
+            "From: Broker <broker@example.com>\nDate: Mon, Jan 6\nSubject: Rent roll\nTo: me\n\n"
+            "Rent roll for 45 Elm Street attached."
+        )
+        self.assertEqual(clean_email_body(text), "FYI\n\nRent roll for 45 Elm Street attached.")
+    
+    def test_attachments_untouched(self):
+        """Attachment sections are not cleaned"""
+        text = "Body\n\n--- Attachment: notes.txt ---\nOn Monday Bob wrote:\n> kept"
+        self.assertTrue(clean_email_body(text).endswith("On Monday Bob wrote:\n> kept"))
+    
+    def test_fit_to_budget(self):
+        """Long text is cut near a boundary and stays within the budget"""
+        text = "The property has ten units. " * 200
+        fitted = fit_to_budget(text, 100)
+        
+        self.assertLessEqual(estimate_tokens(fitted), 100)
+        self.assertTrue(fitted.endswith("[...]"))
+        self.assertEqual(fit_to_budget("short", 100), "short")
+    
+    def test_tokens_saved(self):
+        """Every prepare call is reported and counted per task"""
+        budget = PromptBudget({"summary": 20})
+        budget.prepare(REPLY_EMAIL, "summary")
+        
+        report = budget.last_report()
+        self.assertEqual(report["task"], "summary")
+        self.assertGreater(report["tokens_saved"], 0)
+        self.assertLessEqual(report["tokens_after"], 20)
+        self.assertEqual(budget.stats()["summary"]["calls"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test script for the adaptive OpenAI rate limiter
+
+This script tests the rate limiter by:
+1. Parsing the durations used by the x-ratelimit-reset-* headers
+2. Blocking callers while the request or token budget is exhausted, with
+   or without reset headers
+3. Sharing the budget between limiters through the state file
+4. Waiting out 429 responses from a local stand-in instead of failing
+5. Storing an email as pending enrichment once its 429s outlast the retries
+
+Usage:
+    python -m tests.test_rate_limiter
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.openai_service import OpenAIService
+from app.services.async_openai_service import AsyncOpenAIService
+from app.services.email_processor import EmailProcessor
+from app.models.email import EmailModel
+from app.services.rate_limiter import AdaptiveRateLimiter, RateLimitError, parse_duration
+from tests.helpers import StandInTestCase, chat_completion
+
+class _Classifier:
+    """Local classifier that is never confident"""
+    
+    def categorize(self, body_text, subject=""):
+        return None
+
+class TestRateLimiter(StandInTestCase):
+    """Test cases for AdaptiveRateLimiter"""
+    
+    # Number of upcoming stand-in responses that are 429s
+    rate_limited_responses = 0
+    
+    @classmethod
+    def handle(cls, request):
+        """Answer chat completions, with 429 for the first rate_limited_responses requests"""
+        if cls.rate_limited_responses > 0:
+            cls.rate_limited_responses -= 1
+            return 429, {"error": {"message": "Rate limit reached"}}, {"retry-after-ms": "50"}
+        
+        return 200, chat_completion("Done"), {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-remaining-requests": "499",
+            "x-ratelimit-limit-tokens": "200000",
+            "x-ratelimit-remaining-tokens": "199000",
+            "x-ratelimit-reset-requests": "120ms",
+            "x-ratelimit-reset-tokens": "300ms"
+        }
+    
+    def setUp(self):
+        """Create a temporary directory for the state file"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.tmp_dir, "ratelimit.json")
+    
+    def tearDown(self):
+        """Remove the temporary directory"""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_parse_duration(self):
+        """Reset headers use Go-style durations"""
+        self.assertEqual(parse_duration("1s"), 1.0)
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+        self.assertAlmostEqual(parse_duration("1m30.5s"), 90.5)
+        self.assertEqual(parse_duration("250", unit="ms"), 0.25)
+        self.assertIsNone(parse_duration(None))
+        self.assertIsNone(parse_duration("soon"))
+    
+    def test_waits_for_request_reset(self):
+        """A caller is queued until the request budget resets"""
+        limiter = AdaptiveRateLimiter()
+        limiter.update({
+            "x-ratelimit-limit-requests": "10",
+            "x-ratelimit-remaining-requests": "1",
+            "x-ratelimit-reset-requests": "200ms"
+        })
+        
+        self.assertEqual(limiter.acquire(), 0.0)
+        waited = limiter.acquire()
+        
+        self.assertGreater(waited, 0.1)
+        headroom = limiter.headroom()
+        self.assertEqual(headroom["remaining_requests"], 9)
+        self.assertEqual(headroom["waits"], 1)
+    
+    def test_token_budget(self):
+        """Requests larger than the remaining tokens wait for the reset"""
+        limiter = AdaptiveRateLimiter()
+        limiter.update({
+            "x-ratelimit-limit-tokens": "1000",
+            "x-ratelimit-remaining-tokens": "600",
+            "x-ratelimit-reset-tokens": "150ms"
+        })
+        
+        self.assertEqual(limiter.acquire(500), 0.0)
+        self.assertGreater(limiter.acquire(500), 0.05)
+        self.assertEqual(limiter.headroom()["remaining_tokens"], 500)
+    
+    def test_exhausted_without_reset_headers(self):
+        """An exhausted budget without a reset time refills after DEFAULT_PENALTY"""
+        for headers, remaining in (
+            ({"x-ratelimit-limit-requests": "10", "x-ratelimit-remaining-requests": "0"}, 9),
+            ({"x-ratelimit-remaining-requests": "0"}, None)
+        ):
+            limiter = AdaptiveRateLimiter()
+            limiter.DEFAULT_PENALTY = 0.1
+            limiter.update(headers)
+            
+            waited = []
+            caller = threading.Thread(target=lambda: waited.append(limiter.acquire()), daemon=True)
+            caller.start()
+            caller.join(timeout=5)
+            
+            self.assertEqual(len(waited), 1, f"acquire did not return for {headers}")
+            self.assertGreater(waited[0], 0.05)
+            self.assertEqual(limiter.headroom()["remaining_requests"], remaining)
+    
+    def test_shared_between_limiters(self):
+        """Limiters using the same state file share one budget"""
+        first = AdaptiveRateLimiter(self.state_path)
+        second = AdaptiveRateLimiter(self.state_path)
+        
+        first.update({"x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "1s"})
+        second.acquire()
+        
+        self.assertEqual(first.headroom()["remaining_requests"], 4)
+        
+        first.on_rate_limited({"retry-after": "2"})
+        self.assertGreater(second.headroom()["blocked_for"], 1.5)
+    
+    def test_service_waits_out_429(self):
+        """OpenAIService retries rate limited requests and records the headers"""
+        type(self).rate_limited_responses = 2
+        self.server.requests.clear()
+        limiter = AdaptiveRateLimiter(self.state_path)
+        service = self._service(limiter)
+        
+        started = time.monotonic()
+        self.assertEqual(service.simple_completion("Hello"), "Done")
+        
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        headroom = service.rate_limit_headroom()
+        self.assertEqual(headroom["rate_limited"], 2)
+        self.assertEqual(headroom["limit_tokens"], 200000)
+    
+    def test_persistent_429_is_raised(self):
+        """Rate limiting is surfaced instead of becoming a default result"""
+        type(self).rate_limited_responses = 100
+        service = self._service(AdaptiveRateLimiter())
+        service.MAX_RATE_LIMIT_WAITS = 1
+        
+        try:
+            with self.assertRaises(RateLimitError):
+                service.categorize_email("Please review the lease.", "Lease")
+        finally:
+            type(self).rate_limited_responses = 0
+    
+    def test_rate_limited_email_is_pending(self):
+        """An email whose enrichment stays rate limited is enriched offline, without per-task calls"""
+        type(self).rate_limited_responses = 100
+        self.server.requests.clear()
+        service = self._service(AdaptiveRateLimiter())
+        service.MAX_RATE_LIMIT_WAITS = 1
+        
+        processor = EmailProcessor.__new__(EmailProcessor)
+        processor.openai_service = service
+        processor.async_openai_service = AsyncOpenAIService(service)
+        processor.classifier = _Classifier()
+        email_model = EmailModel("m1", "t1", {"name": "Dana", "email": "dana@example.com"}, [],
+                                 "Lease", "Please review the lease by Friday.")
+        
+        try:
+            processor._enrich_emails([(email_model, {})])
+        finally:
+            type(self).rate_limited_responses = 0
+        
+        self.assertEqual(email_model.enrichment_status, "pending")
+        self.assertEqual(email_model.category, "Property")
+        self.assertEqual(len(self.server.requests), 2)
+    
+    def _service(self, limiter):
+        """Create an OpenAIService pointed at the stand-in, without caching or a ledger"""
+        service = OpenAIService(transport=self.server.transport(), rate_limiter=limiter, cache=None,
+                                ledger=None)
+        service.api_key = "test-key"
+        return service
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test script for hedged requests
+
+This script tests the request hedger by:
+1. Sending no hedges until enough latencies have been recorded
+2. Hedging a request slower than the latency percentile and using the faster copy
+3. Capping the share of hedged requests
+4. Releasing the result of the request that lost the race
+5. Not letting a fast server error win the race
+6. Sending requests from the caller's thread instead of queueing them for a worker
+7. Keeping one latency window per kind of request
+8. Not timing the wait before a hedged copy is sent
+
+Usage:
+    python -m tests.test_request_hedger
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.request_hedger import RequestHedger
+
+class TestRequestHedger(unittest.TestCase):
+    """Test cases for RequestHedger"""
+    
+    def _warm_up(self, hedger, count=20):
+        """Record fast latencies so the hedge delay is known"""
+        for _ in range(count):
+            hedger.call(lambda: "fast")
+    
+    def test_no_hedge_without_samples(self):
+        """Hedging starts only after min_samples latencies"""
+        hedger = RequestHedger(min_samples=5, min_delay=0.01, max_hedge_rate=1.0)
+        self.assertIsNone(hedger.hedge_delay())
+        
+        self.assertEqual(hedger.call(lambda: "ok"), "ok")
+        self.assertEqual(hedger.stats()["hedges_issued"], 0)
+    
+    def test_slow_request_is_hedged(self):
+        """A slow primary is overtaken by the hedged copy"""
+        hedger = RequestHedger(min_samples=20, min_delay=0.02, max_hedge_rate=0.5)
+        self._warm_up(hedger)
+        
+        closed = []
+        released = threading.Event()
+        
+        def slow():
+            time.sleep(0.3)
+            return "slow"
+        
+        def close(result):
+            closed.append(result)
+            released.set()
+        
+        started = time.monotonic()
+        result = hedger.call(slow, hedge=lambda: "hedged", close=close)
+        
+        self.assertEqual(result, "hedged")
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertTrue(released.wait(1))
+        self.assertEqual(closed, ["slow"])
+        
+        stats = hedger.stats()
+        self.assertEqual(stats["hedges_issued"], 1)
+        self.assertEqual(stats["hedges_won"], 1)
+    
+    def test_hedge_rate_cap(self):
+        """No more hedges are sent once the cap is reached"""
+        hedger = RequestHedger(min_samples=20, min_delay=0.01, max_hedge_rate=0.05)
+        self._warm_up(hedger)
+        
+        def slow():
+            time.sleep(0.05)
+            return "slow"
+        
+        for _ in range(3):
+            hedger.call(slow, hedge=lambda: "hedged")
+        
+        # 23 requests allow a single hedge at a 5% rate
+        self.assertEqual(hedger.stats()["hedges_issued"], 1)
+    
+    def test_failed_primary(self):
+        """A failing primary does not hide a successful hedge"""
+        hedger = RequestHedger(min_samples=20, min_delay=0.01, max_hedge_rate=1.0)
+        self._warm_up(hedger)
+        
+        def failing():
+            time.sleep(0.05)
+            raise ConnectionError("reset")
+        
+        self.assertEqual(hedger.call(failing, hedge=lambda: "hedged"), "hedged")
+        
+        with self.assertRaises(ConnectionError):
+            hedger.call(failing, hedge=failing)
+    
+    def test_server_error_loses(self):
+        """A failed result only wins when both requests fail"""
+        hedger = RequestHedger(min_samples=20, min_delay=0.02, max_hedge_rate=1.0)
+        self._warm_up(hedger)
+        closed = []
+        
+        def slow():
+            time.sleep(0.1)
+            return 200
+        
+        result = hedger.call(slow, hedge=lambda: 503, close=closed.append, failed=lambda status: status >= 500)
+        self.assertEqual(result, 200)
+        self.assertEqual(closed, [503])
+        self.assertEqual(hedger.stats()["hedges_won"], 0)
+        
+        def slow_error():
+            time.sleep(0.1)
+            return 502
+        
+        self.assertEqual(hedger.call(slow_error, hedge=lambda: 503, failed=lambda status: status >= 500), 502)
+    
+    def test_busy_pool_runs_on_caller_thread(self):
+        """Without a free worker for a request and its hedge, the request runs unhedged on the caller's thread"""
+        hedger = RequestHedger(min_samples=20, min_delay=0.02, max_hedge_rate=1.0, max_workers=2)
+        self._warm_up(hedger)
+        
+        started = threading.Event()
+        release = threading.Event()
+        
+        def blocking():
+            started.set()
+            release.wait(1)
+            return "blocking"
+        
+        # The background call is won by its hedge; its primary keeps holding a worker
+        background = threading.Thread(target=lambda: hedger.call(blocking, hedge=lambda: "hedged"))
+        background.start()
+        self.assertTrue(started.wait(1))
+        
+        def slow():
+            time.sleep(0.1)
+            return threading.current_thread()
+        
+        try:
+            self.assertIs(hedger.call(slow, hedge=lambda: "hedged"), threading.current_thread())
+        finally:
+            release.set()
+            background.join()
+        self.assertEqual(hedger.stats()["hedges_issued"], 1)
+    
+    def test_latencies_per_key(self):
+        """Slow requests of one kind do not delay hedging another kind"""
+        hedger = RequestHedger(min_samples=5, min_delay=0.01, max_hedge_rate=1.0, percentile=50)
+        
+        def slow():
+            time.sleep(0.1)
+            return "slow"
+        
+        for _ in range(5):
+            hedger.call(slow, key="gpt-4o/enrichment")
+        
+        self.assertIsNone(hedger.hedge_delay("gpt-4o-mini/category"))
+        self.assertGreaterEqual(hedger.hedge_delay("gpt-4o/enrichment"), 0.09)
+        
+        for _ in range(5):
+            hedger.call(lambda: "fast", key="gpt-4o-mini/category")
+        
+        self.assertLess(hedger.hedge_delay("gpt-4o-mini/category"), 0.05)
+        self.assertEqual(hedger.call(slow, hedge=lambda: "hedged", key="gpt-4o-mini/category"), "hedged")
+        self.assertEqual(set(hedger.stats()["hedge_delays"]), {"gpt-4o/enrichment", "gpt-4o-mini/category"})
+    
+    def test_prepare_hedge_is_not_timed(self):
+        """Waiting before the hedged copy is sent does not count as its latency"""
+        hedger = RequestHedger(min_samples=20, min_delay=0.02, max_hedge_rate=1.0)
+        self._warm_up(hedger)
+        
+        def slow():
+            time.sleep(0.5)
+            return "slow"
+        
+        result = hedger.call(slow, hedge=lambda: "hedged", prepare_hedge=lambda: time.sleep(0.2))
+        
+        self.assertEqual(result, "hedged")
+        self.assertLess(max(hedger._latencies[None]), 0.1)
+
+if __name__ == "__main__":
+    unittest.main()
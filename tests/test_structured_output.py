@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Test script for schema-constrained structured outputs
+
+This script tests structured output handling by:
+1. Repairing fenced, prose-wrapped and truncated JSON responses
+2. Reporting schema violations with their location
+3. Defaulting the fields an incomplete enrichment response is missing
+4. Recovering a truncated categorization against a local stand-in without another request
+5. Caching only complete responses that match their schema
+6. Leaving an email pending enrichment when its response cannot be used
+
+Usage:
+    python -m tests.test_structured_output
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.openai_service import OpenAIService
+from app.services.llm_cache import LLMCache
+from app.services.email_processor import EmailProcessor
+from app.models.email import EmailModel
+from app.services.rate_limiter import AdaptiveRateLimiter
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.structured_output import (
+    StructuredOutputError, CATEGORY_SCHEMA, FOLLOW_UPS_SCHEMA, repair_json, validate, parse_structured
+)
+from tests.helpers import StandInTestCase, chat_completion
+
+class TestStructuredOutput(StandInTestCase):
+    """Test cases for structured output parsing and repair"""
+    
+    # Content of the stand-in's responses, cut off at max_tokens unless finish_reason is changed
+    content = ""
+    finish_reason = "length"
+    
+    @classmethod
+    def handle(cls, request):
+        """Answer chat completions with the configured content and finish_reason"""
+        return 200, chat_completion(cls.content, finish_reason=cls.finish_reason)
+    
+    def setUp(self):
+        """Reset the stand-in's responses"""
+        type(self).content = ""
+        type(self).finish_reason = "length"
+        self.server.requests.clear()
+    
+    def _service(self, cache=None):
+        """Create a service talking to the stand-in, without a ledger or, by default, caching"""
+        service = OpenAIService(transport=self.server.transport(), rate_limiter=AdaptiveRateLimiter(),
+                                circuit_breaker=CircuitBreaker(), cache=cache, ledger=None)
+        service.api_key = "test-key"
+        return service
+    
+    def test_repair_wrapped_json(self):
+        """Code fences and surrounding prose are stripped"""
+        self.assertEqual(repair_json('```json\n{"category": "Deal"}\n```'), {"category": "Deal"})
+        self.assertEqual(repair_json('Here you go: {"priority": 2} Hope this helps!'), {"priority": 2})
+        
+        with self.assertRaises(StructuredOutputError):
+            repair_json("I cannot help with that.")
+    
+    def test_repair_truncated_json(self):
+        """Open strings and containers are closed and incomplete elements dropped"""
+        text = '{"follow_ups": [{"title": "Send the LOI", "due_date": "2026-10-20"}, {"title": "Call the bro'
+        self.assertEqual(repair_json(text), {"follow_ups": [
+            {"title": "Send the LOI", "due_date": "2026-10-20"},
+            {"title": "Call the bro"}
+        ]})
+        
+        text = '{"category": "Deal", "priority": 2, "expl'
+        self.assertEqual(repair_json(text), {"category": "Deal", "priority": 2})
+    
+    def test_validate(self):
+        """Schema violations are reported with their path"""
+        self.assertEqual(validate({"category": "Deal", "priority": 2, "explanation": "LOI"}, CATEGORY_SCHEMA), [])
+        
+        errors = validate({"category": "Spam", "priority": True, "extra": 1}, CATEGORY_SCHEMA)
+        self.assertIn("$.explanation: missing", errors)
+        self.assertIn("$.extra: unexpected property", errors)
+        self.assertTrue(any(error.startswith("$.category:") for error in errors))
+        self.assertTrue(any(error.startswith("$.priority:") for error in errors))
+        
+        value, errors = parse_structured('{"follow_ups": [{"title": "Tour"', FOLLOW_UPS_SCHEMA)
+        self.assertEqual(value, {"follow_ups": [{"title": "Tour"}]})
+        self.assertIn("$.follow_ups[0].responsible: missing", errors)
+    
+    def test_conform_enrichment(self):
+        """An incomplete enrichment gets defaults instead of failing"""
+        service = self._service()
+        enrichment = service._conform_enrichment({"summary": " Lease renewal. ", "category": "Property",
+                                                  "entities_extra": []})
+        
+        self.assertEqual(enrichment["summary"], "Lease renewal.")
+        self.assertEqual(enrichment["category"], "Property")
+        self.assertEqual(enrichment["priority"], 3)
+        self.assertEqual(enrichment["entities"]["people"], [])
+        self.assertEqual(set(enrichment["entities"]), set(service.ENTITY_KEYS))
+        
+        with self.assertRaises(StructuredOutputError):
+            service._conform_enrichment(["not", "an", "object"])
+    
+    def test_truncated_response_is_not_retried(self):
+        """A truncated categorization is repaired from the single response"""
+        type(self).content = '{"category": "Deal", "priority": 1, "explanation": "The buyer wants the LOI by Fri'
+        
+        result = self._service().categorize_email("Please send the LOI by Friday.", "LOI")
+        
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0].json()["response_format"]["type"], "json_schema")
+        self.assertEqual(result["category"], "Deal")
+        self.assertEqual(result["priority"], 1)
+        self.assertTrue(result["explanation"].startswith("The buyer wants"))
+    
+    def test_only_valid_responses_are_cached(self):
+        """Truncated and schema-invalid responses are asked again; complete valid ones are cached"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        service = self._service(cache=LLMCache(os.path.join(tmp_dir, "cache.sqlite3")))
+        
+        type(self).content = '{"category": "Deal", "priority": 1, "explanation": "The buyer wants the LOI by Fri'
+        service.categorize_email("Please send the LOI by Friday.", "LOI")
+        type(self).finish_reason = "stop"
+        type(self).content = '{"category": "Spam", "priority": 1, "explanation": "LOI"}'
+        service.categorize_email("Please send the LOI by Friday.", "LOI")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(service.cache_stats()["entries"], 0)
+        
+        type(self).content = '{"category": "Deal", "priority": 1, "explanation": "LOI due Friday"}'
+        for _ in range(2):
+            self.assertEqual(service.categorize_email("Please send the LOI by Friday.", "LOI")["category"], "Deal")
+        self.assertEqual(len(self.server.requests), 3)
+    
+    def test_unusable_enrichment_stays_pending(self):
+        """Defaults for an unparseable enrichment are stored as pending and the response is not cached"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        service = self._service(cache=LLMCache(os.path.join(tmp_dir, "cache.sqlite3")))
+        type(self).finish_reason = "stop"
+        type(self).content = "I cannot help with that."
+        
+        processor = EmailProcessor.__new__(EmailProcessor)
+        processor.openai_service = service
+        email_model = EmailModel("m1", "t1", {"name": "Dana", "email": "dana@example.com"}, [],
+                                 "Lease", "Please review the lease by Friday.")
+        processor._enrich_email(email_model)
+        
+        self.assertEqual(email_model.enrichment_status, "pending")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(service.cache_stats()["entries"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
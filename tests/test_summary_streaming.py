@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test script for streamed capsule summaries
+
+This script tests summary streaming by:
+1. Receiving completion text from a local streaming stand-in before the stream ends
+2. Sending the summary pieces as server-sent events and saving the final text
+3. Leaving the stored summary unchanged when the stream fails
+
+Usage:
+    python -m tests.test_summary_streaming
+"""
+
+import os
+import sys
+import json
+import threading
+import unittest
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.capsule import CapsuleModel
+from app.models.email import EmailModel
+from app.services.openai_service import OpenAIService
+from app.services.rate_limiter import AdaptiveRateLimiter
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.capsule_summary_service import CapsuleSummaryService
+from app.api.capsule_routes import summary_events
+from tests.helpers import StandInTestCase
+
+class _EmailStore:
+    """Email lookup used by CapsuleSummaryService"""
+    
+    def get_email_by_id(self, message_id):
+        return EmailModel(message_id=message_id, thread_id="t1", sender={"name": "Dana", "email": "dana@example.com"},
+                          recipients=[], subject="LOI for 12 Main St", body_text="We accept the LOI.")
+
+class _CapsuleStore:
+    """Records capsule updates"""
+    
+    def __init__(self):
+        self.updates = []
+    
+    def update_capsule(self, capsule_id, update_data):
+        self.updates.append((capsule_id, update_data))
+        return True
+
+class TestSummaryStreaming(StandInTestCase):
+    """Test cases for streamed completions and capsule summary events"""
+    
+    pieces = ["The buyer ", "accepted ", "the LOI."]
+    fail_after_first = False
+    first_read = threading.Event()
+    
+    @classmethod
+    def handle(cls, request):
+        """Answer chat completions by streaming the pieces as chunked server-sent events"""
+        assert request.json()["stream"] is True
+        return 200, cls._stream(), {"Content-Type": "text/event-stream"}
+    
+    @classmethod
+    def _stream(cls):
+        for index, piece in enumerate(cls.pieces):
+            yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': piece}}]})}\n\n"
+            if index == 0:
+                # The rest is only sent once the client has seen the first piece
+                cls.first_read.wait(2)
+                if cls.fail_after_first:
+                    yield f"data: {json.dumps({'error': {'message': 'Stream interrupted'}})}\n\n"
+                    break
+        yield "data: [DONE]\n\n"
+    
+    def setUp(self):
+        """Create a service talking to the stand-in"""
+        self.service = OpenAIService(transport=self.server.transport(), rate_limiter=AdaptiveRateLimiter(),
+                                     circuit_breaker=CircuitBreaker(), cache=None, ledger=None)
+        self.service.api_key = "test-key"
+        self.first_read.clear()
+        type(self).fail_after_first = False
+    
+    def _events(self):
+        """Stream the summary of a one-email capsule, releasing the stand-in after the first event"""
+        capsule_store = _CapsuleStore()
+        capsule = CapsuleModel(title="12 Main St", type="Deal", emails=[{"email_id": "m1"}])
+        summary_service = CapsuleSummaryService(_EmailStore(), self.service)
+        
+        events = []
+        for event in summary_events("c1", capsule, summary_service, capsule_store):
+            events.append(event)
+            self.first_read.set()
+        return events, capsule_store
+    
+    def test_stream_completion_is_incremental(self):
+        """The first piece arrives while the stand-in is still holding back the rest"""
+        stream = self.service.stream_completion("Summarize")
+        
+        self.assertEqual(next(stream), "The buyer ")
+        self.first_read.set()
+        self.assertEqual("".join(stream), "accepted the LOI.")
+    
+    def test_summary_events_persist_final_text(self):
+        """Pieces are sent as message events and the full text is saved on completion"""
+        events, capsule_store = self._events()
+        
+        self.assertEqual(events[0], 'data: {"delta": "The buyer "}\n\n')
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[-1], 'event: done\ndata: {"summary": "The buyer accepted the LOI."}\n\n')
+        self.assertEqual(capsule_store.updates, [("c1", {"summary": "The buyer accepted the LOI."})])
+    
+    def test_failed_stream_is_not_saved(self):
+        """An error event is sent and the stored summary is kept"""
+        type(self).fail_after_first = True
+        events, capsule_store = self._events()
+        
+        self.assertTrue(events[-1].startswith("event: error\n"))
+        self.assertIn("Stream interrupted", events[-1])
+        self.assertEqual(capsule_store.updates, [])
+
+if __name__ == "__main__":
+    unittest.main()